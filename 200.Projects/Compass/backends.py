@@ -0,0 +1,299 @@
+"""
+空き状況の取得方法（バックエンド）を切り替えるためのモジュール。
+
+- http: カレンダーが裏で呼んでいる JSON API を requests で直接呼ぶ（ブラウザ不要）
+
+ブラウザでページを開いて判定する経路はここには無く、engine.run_job が受け持つ。
+COMPASS_BACKEND=auto（既定）なら API が設定されているときだけ http を試し、
+http が使えない・JSON の形が想定外のときは CompassSite.fast_check が None を返して engine がブラウザに切り替える。
+http なら API だけを使い（失敗はエラー）、playwright なら http を試さない。
+"""
+
+import json
+import os
+import re
+from datetime import datetime
+from itertools import groupby
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+from common import Check, Result
+from snapshots import SnapshotCache, get_snapshot_cache
+
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+if TYPE_CHECKING:
+    import requests
+
+_DATE_RE = re.compile(r"^(\d{4})[-/](\d{1,2})[-/](\d{1,2})")
+_DATE_KEYS = ("date", "day", "eventDate", "event_date", "targetDate", "target_date", "ymd")
+_BOOL_YES_KEYS = ("available", "isAvailable", "is_available", "reservable", "bookable", "canReserve")
+_BOOL_NO_KEYS = ("soldOut", "sold_out", "isSoldOut", "is_sold_out", "full", "isFull", "closed")
+_COUNT_KEYS = ("remaining", "remain", "rest", "stock", "vacancy", "vacancies", "availableCount", "available_count")
+_STATUS_KEYS = ("status", "state", "stockStatus", "stock_status", "mark", "label")
+# 記号・日本語は部分一致、英語は単語ごとに一致を見る（"next" や "max" を "x" と読まない）
+# 空きなしの方を先に見る（「空きなし」「残0」「not available」を、空・残・available で空きありと読まない）
+_STATUS_NO_MARKS = ("×", "✕", "満", "売切", "なし", "無し")
+_STATUS_YES_MARKS = ("○", "〇", "◯", "◎", "△", "▲", "空", "残")
+_STATUS_YES_WORDS = ("available", "open", "few", "vacant")
+_STATUS_NO_WORDS = ("x", "soldout", "sold_out", "full", "closed", "unavailable", "none") + tuple(
+    f"{neg}_{w}" for neg in ("not", "no") for w in _STATUS_YES_WORDS
+)
+_STATUS_ZERO_RE = re.compile(r"(?:残り?|空き?)\s*[:：]?\s*0(?!\d)")
+_WORD_RE = re.compile(r"[a-z]+")
+
+
+def compass_api_url() -> str:
+    """
+    カレンダー API の URL（環境変数 COMPASS_API_URL）。{month} は YYYY-MM に置き換わる
+    例: https://art-ap.passes.jp/api/.../calendar?month={month}
+    """
+    return os.environ.get("COMPASS_API_URL", "").strip()
+
+
+class BackendError(Exception):
+    """バックエンドが使えない（未設定・通信失敗・想定外の応答）ことを表す。"""
+
+
+def _normalize_date(value) -> Optional[str]:
+    if not isinstance(value, str):
+        return None
+    m = _DATE_RE.match(value.strip())
+    if not m:
+        return None
+    y, mo, d = (int(g) for g in m.groups())
+    return f"{y:04d}-{mo:02d}-{d:02d}"
+
+
+def _status_matches(status: str, marks: Tuple[str, ...], words: Tuple[str, ...]) -> bool:
+    # "sold out" / "sold-out" / "SOLD_OUT" は、どれも "_sold_out_" として比べる
+    joined = "_" + "_".join(_WORD_RE.findall(status)) + "_"
+    return any(m in status for m in marks) or any(f"_{w}_" in joined for w in words)
+
+
+def _entry_status(entry: dict) -> Optional[bool]:
+    """1日分のオブジェクトから空きあり/なしを読み取る。判断できなければ None。"""
+    for k in _BOOL_NO_KEYS:
+        if isinstance(entry.get(k), bool):
+            return not entry[k]
+    for k in _BOOL_YES_KEYS:
+        if isinstance(entry.get(k), bool):
+            return entry[k]
+    for k in _COUNT_KEYS:
+        v = entry.get(k)
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            return v > 0
+    for k in _STATUS_KEYS:
+        v = entry.get(k)
+        if isinstance(v, str) and v.strip():
+            s = v.strip().lower()
+            if _status_matches(s, _STATUS_NO_MARKS, _STATUS_NO_WORDS) or _STATUS_ZERO_RE.search(s):
+                return False
+            if _status_matches(s, _STATUS_YES_MARKS, _STATUS_YES_WORDS):
+                return True
+    return None
+
+
+def _entry_count(entry: dict) -> Optional[int]:
+    """1日分（1枠分）のオブジェクトの残り枠数。数の項目が無ければ None。"""
+    for k in _COUNT_KEYS:
+        v = entry.get(k)
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            return max(0, int(v))
+    return None
+
+
+def _add_count(a: Optional[int], b: Optional[int]) -> Optional[int]:
+    if a is None:
+        return b
+    return a if b is None else a + b
+
+
+def parse_calendar_json(data) -> Dict[str, Tuple[bool, Optional[int]]]:
+    """
+    カレンダー API の JSON から {YYYY-MM-DD: (空きありか, 残り枠数)} を取り出す（枠数が無い形なら None）。
+    入れ子の中から「日付キー」と「在庫/状態キー」を持つオブジェクトを探すので、
+    多少レスポンスの形が変わっても読める。1件も読めなければ BackendError。
+    """
+    found: Dict[str, Tuple[bool, Optional[int]]] = {}
+
+    def add(date: str, status: bool, count: Optional[int]) -> None:
+        # 同じ日に複数枠があれば、どれか1つでも空いていれば空きあり。枠数は足し合わせる
+        previous, total = found.get(date, (False, None))
+        found[date] = (previous or status, _add_count(total, count))
+
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict):
+            date = None
+            for k in _DATE_KEYS:
+                date = _normalize_date(node.get(k))
+                if date:
+                    break
+            if date:
+                status = _entry_status(node)
+                count = _entry_count(node)
+                if status is None or count is None:
+                    # {"date": ..., "slots": [{"remaining": 3}, ...]} のように枠が入れ子の形
+                    entries = [v for v in node.values() if isinstance(v, dict)]
+                    entries += [v for vs in node.values() if isinstance(vs, list) for v in vs if isinstance(v, dict)]
+                    slots = [(_entry_status(v), _entry_count(v)) for v in entries]
+                    slots = [(ok, n) for ok, n in slots if ok is not None]
+                    if status is None and slots:
+                        status = any(ok for ok, _ in slots)
+                    if count is None:
+                        for _, n in slots:
+                            count = _add_count(count, n)
+                if status is not None:
+                    add(date, status, count)
+                    continue
+            for key, value in node.items():
+                # {"2026-03-05": {...}} のように日付がキーの形
+                key_date = _normalize_date(key)
+                if key_date and isinstance(value, dict):
+                    status = _entry_status(value)
+                    if status is not None:
+                        add(key_date, status, _entry_count(value))
+                        continue
+                stack.append(value)
+    if not found:
+        raise BackendError("API の応答から日付ごとの空き情報を読み取れませんでした")
+    return found
+
+
+class Backend:
+    """空き状況を取得するバックエンドの共通インターフェース。"""
+
+    name = ""
+
+    def check_many(self, dates: List[str]) -> Result:
+        raise NotImplementedError
+
+
+class HttpBackend(Backend):
+    """
+    カレンダー API を直接呼ぶバックエンド。
+    fixture_dir を指定するとネットワークに出ず {fixture_dir}/{YYYY-MM}.json を読む（オフライン確認用）。
+    record_dir を指定すると取得した JSON を同じ形式で保存する。
+    cache を渡すと月ごとの JSON と ETag を保存し、TTL 以内ならそのまま、過ぎていれば
+    If-None-Match で問い合わせて 304 なら前回の JSON を使う。
+    """
+
+    name = "http"
+    cache_site = "compass-api"  # スナップショットのキャッシュでの site 名
+
+    def __init__(
+        self,
+        url_template: Optional[str] = None,
+        fixture_dir: Optional[str] = None,
+        record_dir: Optional[str] = None,
+        session: Optional["requests.Session"] = None,
+        timeout: float = 5,
+        cache: Optional[SnapshotCache] = None,
+    ):
+        self.url_template = compass_api_url() if url_template is None else url_template
+        self.fixture_dir = Path(fixture_dir) if fixture_dir else None
+        self.record_dir = Path(record_dir) if record_dir else None
+        self._session = session
+        if session is not None:
+            session.headers.update({"User-Agent": USER_AGENT, "Accept": "application/json"})
+        self.timeout = timeout
+        self.cache = cache
+
+    @property
+    def session(self) -> "requests.Session":
+        """初めて API を呼ぶときに作る（COMPASS_API_URL が無い実行では requests を読み込まない）。"""
+        if self._session is None:
+            import requests
+
+            self._session = requests.Session()
+            self._session.headers.update({"User-Agent": USER_AGENT, "Accept": "application/json"})
+        return self._session
+
+    def fetch_month(self, month: str):
+        """YYYY-MM の月のカレンダー JSON を取得する。"""
+        if self.fixture_dir:
+            path = self.fixture_dir / f"{month}.json"
+            try:
+                return json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError) as e:
+                raise BackendError(f"フィクスチャを読めませんでした: {path}: {e}")
+        if not self.url_template:
+            raise BackendError("COMPASS_API_URL が未設定です")
+        cached = self.cache.get(self.cache_site, month) if self.cache else None
+        if self.cache and self.cache.is_fresh(cached):
+            return cached.payload
+        url = self.url_template.format(month=month, year=month[:4], mon=month[5:7])
+        headers = {"If-None-Match": cached.etag} if cached and cached.etag else {}
+        import requests
+
+        try:
+            r = self.session.get(url, timeout=self.timeout, headers=headers)
+            if r.status_code == 304 and cached:
+                self.cache.touch(self.cache_site, month)
+                return cached.payload
+            r.raise_for_status()
+            data = r.json()
+        except (requests.RequestException, ValueError) as e:
+            raise BackendError(f"API の呼び出しに失敗しました: {e}")
+        if self.cache:
+            self.cache.put(self.cache_site, month, data, etag=r.headers.get("ETag"))
+        if self.record_dir:
+            self.record_dir.mkdir(parents=True, exist_ok=True)
+            (self.record_dir / f"{month}.json").write_text(
+                json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8"
+            )
+        return data
+
+    def check_many(self, dates: List[str]) -> Result:
+        results: Result = {}
+        for month, month_dates in groupby(sorted(set(dates)), key=lambda d: d[:7]):
+            status = parse_calendar_json(self.fetch_month(month))
+            for d in month_dates:
+                if d not in status:
+                    results[d] = Check(None, f"{d} の情報が API の応答にありませんでした。要サイト確認。")
+                elif status[d][0]:
+                    # 枠数は Check.slots で渡す（state.py が枠数の変化も通知する）。説明は sites.py の判定と同じ形
+                    slots = status[d][1]
+                    remaining = f"（残り{slots}枠）" if slots else ""
+                    results[d] = Check(True, f"{d} に空きがあります{remaining}。サイトでご確認ください。", slots or None)
+                else:
+                    results[d] = Check(False, f"{d} は空きなし（API の在庫表示です）。")
+        return results
+
+
+def backend_chain(name: str) -> List[Backend]:
+    """
+    COMPASS_BACKEND の値から、ブラウザより先に試すバックエンドを順に並べて返す。
+    空なら最初からブラウザで判定する。
+    """
+    name = (name or "auto").strip().lower()
+    if name == "playwright":
+        return []
+    http = HttpBackend(
+        fixture_dir=os.environ.get("COMPASS_API_FIXTURES", "").strip() or None,
+        record_dir=os.environ.get("COMPASS_API_RECORD", "").strip() or None,
+        cache=get_snapshot_cache(),
+    )
+    if name == "http" or http.url_template or http.fixture_dir:
+        return [http]
+    return []
+
+
+def check_with_fallback(dates: List[str], chain: List[Backend], log: Callable[[str], None] = print) -> Result:
+    """chain の先頭から順に試し、BackendError なら次のバックエンドへ切り替える。"""
+    last_error: Optional[BackendError] = None
+    for backend in chain:
+        try:
+            started = datetime.now()
+            results = backend.check_many(dates)
+            log(f"[{backend.name}] {(datetime.now() - started).total_seconds():.2f} 秒で取得しました。")
+            return results
+        except BackendError as e:
+            log(f"[{backend.name}] 使えません: {e}")
+            last_error = e
+    raise BackendError(str(last_error) if last_error else "使えるバックエンドがありません")
@@ -0,0 +1,85 @@
+"""
+起動にかかる時間を測る（チェック本体より起動の方が重くならないよう、変化を記録して追う）。
+
+- import: python を起動して main を import するまで（通知・ブラウザのライブラリは読み込まれないはず）
+- playwright: さらに playwright.async_api を読み込むまで（ブラウザを使う実行の下限）
+- 上のそれぞれを別プロセスで --runs 回（既定 5）測り、中央値を出す
+- METRICS_FILE / METRICS_PROM を指定すると、metrics.py と同じ形式で1回ごとに記録する
+  （python metrics.py summary で p50 / p95 を見られる）
+
+    python bench_startup.py
+    python bench_startup.py --runs 10 --detail   # -X importtime で時間のかかったモジュールも出す
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from metrics import record_startup
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HEAVY_MODULES = ["playwright", "greenlet", "requests", "urllib3", "smtplib", "email.mime"]
+SCENARIOS = {
+    "import": "import main",
+    "playwright": "import main; import playwright.async_api",
+}
+
+
+def run_once(code: str) -> float:
+    """新しい python プロセスで code を実行し、終わるまでの秒数を返す。"""
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=HERE, check=True)
+    return time.perf_counter() - started
+
+
+def loaded_heavy_modules() -> List[str]:
+    """main を import しただけで読み込まれてしまう重いモジュール（空なのが正しい）。"""
+    code = f"import sys, main; print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], cwd=HERE, check=True, capture_output=True, text=True)
+    return out.stdout.split()
+
+
+def import_times(code: str, top: int = 15) -> List[str]:
+    """-X importtime の結果から、読み込みに時間のかかったモジュール（累計）を上から top 件。"""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=HERE, check=True, capture_output=True, text=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        rows.append((int(cumulative), name.strip()))
+    rows.sort(reverse=True)
+    return [f"{us / 1000:>8.1f}ms  {name}" for us, name in rows[:top]]
+
+
+def main() -> int:
+    args = sys.argv[1:]
+    runs = int(args[args.index("--runs") + 1]) if "--runs" in args else 5
+    medians: Dict[str, float] = {}
+    for scenario, code in SCENARIOS.items():
+        run_once(code)  # 1回目は .pyc の作成などが入るので捨てる
+        samples = [run_once(code) for _ in range(runs)]
+        for seconds in samples:
+            record_startup(scenario, seconds)
+        medians[scenario] = statistics.median(samples)
+        print(f"{scenario:<10}  中央値 {medians[scenario] * 1000:>7.1f}ms  （{runs} 回、最小 {min(samples) * 1000:.1f}ms）")
+
+    heavy = loaded_heavy_modules()
+    if heavy:
+        print(f"main の import で読み込まれている重いモジュール: {', '.join(heavy)}")
+    else:
+        print("main の import では通知・ブラウザのライブラリを読み込んでいません。")
+
+    if "--detail" in args:
+        for scenario, code in SCENARIOS.items():
+            print(f"\n[{scenario}] 読み込みに時間のかかったモジュール（累計）:")
+            print("\n".join(import_times(code)))
+    return 1 if heavy else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""
+空きを見つけたら、そのまま開いているページで予約手続きに進む自動予約（AUTO_BOOK を設定したときだけ）。
+
+- AUTO_BOOK=dry-run: 日付・枠を選び、予約者の情報を入れて確認画面（仮押さえ）まで進み、確定はしない
+- AUTO_BOOK=submit:  確認画面から確定まで行う
+- 判定に使ったページ・セッションをそのまま使うので、ページを開き直す時間がかからない
+- 空きの判定から確認画面に着くまでの時間を metrics に記録する（checker_booking_seconds）。
+  起点はチェックの終わりではなく、その日付を空きと判定した時刻（StepTimer.marks の found <日付>）
+- 予約の結果は空き状況の通知とは別に、そのつど通知する（空き状況が前回と同じで、空きの通知が出ないときも届く）
+- 同じ (サイト, 日付) は、成功した予約があれば二度と予約しない（state.db の bookings）
+- 予約の手続きには、チェックとは別の予算 BOOKING_BUDGET_MS（既定 60000）を使う
+  （チェックで使い切った残りで、クリックや入力の待ち時間を打ち切らない）
+
+予約者の情報は BOOKING_PROFILE（既定 booking.json）に書く:
+
+    {
+      "clinic": {"times": ["10:00", "10:30"], "fields": {"patient_no": "12345", "tel": "09000000000"}},
+      "compass": {"tickets": 2, "fields": {"name": "山田 花子", "email": "me@example.com"}}
+    }
+
+fields は入力欄の name 属性かラベルの文言 → 値。確認は fake_servers.py の FakeReserveSite（偽の予約サイト）でできる:
+
+    python fake_servers.py --reserve   # 偽の予約サイトを起動して、使うべき環境変数を表示する
+"""
+
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from classifier import RULES
+from common import Result, log
+from metrics import record_booking
+from state import DEFAULT_PATH
+from timing import StepTimer
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bookings (
+    site TEXT NOT NULL,
+    date TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    ok INTEGER NOT NULL,
+    detail TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    booked_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bookings_site_date ON bookings (site, date);
+"""
+
+MODES = ("dry-run", "submit")
+DEFAULT_BUDGET_MS = 60000
+
+
+class BookingError(Exception):
+    """予約手続きを続けられなかった（画面の要素が見つからない・枠が埋まったなど）。"""
+
+
+def mode_from_env() -> Optional[str]:
+    """AUTO_BOOK の値（dry-run / submit）。未設定・それ以外なら None（自動予約しない）。"""
+    mode = os.environ.get("AUTO_BOOK", "").strip().lower()
+    return mode if mode in MODES else None
+
+
+def budget_from_env(default_ms: float = DEFAULT_BUDGET_MS) -> float:
+    """環境変数 BOOKING_BUDGET_MS（予約の手続き全体の予算、ミリ秒）。未設定・不正なら default_ms。"""
+    try:
+        return float(os.environ.get("BOOKING_BUDGET_MS", "").strip() or default_ms)
+    except ValueError:
+        return default_ms
+
+
+def load_profile(site: str) -> Optional[dict]:
+    path = os.environ.get("BOOKING_PROFILE", "").strip() or "booking.json"
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get(site)
+
+
+class BookingLog:
+    """予約を試した記録（state.db の bookings）。"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.environ.get("STATE_DB", "").strip() or DEFAULT_PATH
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(SCHEMA)
+
+    def booked(self, site: str, date: str, mode: str) -> bool:
+        row = self.conn.execute(
+            "SELECT 1 FROM bookings WHERE site = ? AND date = ? AND mode = ? AND ok = 1 LIMIT 1",
+            (site, date, mode),
+        ).fetchone()
+        return row is not None
+
+    def add(self, site: str, date: str, mode: str, ok: bool, detail: str, seconds: float) -> None:
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO bookings (site, date, mode, ok, detail, seconds, booked_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (site, date, mode, int(ok), detail, seconds, datetime.now().isoformat(timespec="seconds")),
+            )
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+# --- sites.Site.hold / submit から使う画面操作 ---
+
+def available_text(site: str, text: str, require_mark: bool = True) -> bool:
+    """セルの文言が classifier の判定で空きありか。require_mark=False ならマークの無いセルも空きとみなす。"""
+    kinds = RULES[site].scan(text)
+    return "no" not in kinds and ("yes" in kinds or not require_mark)
+
+
+async def click_first(page, selector: str, pattern: str, timer: StepTimer, what: str, site: Optional[str] = None, require_mark: bool = True) -> str:
+    """
+    selector の要素のうち、文言が pattern に合う（site を渡せば空きでもある）最初のものを押して、その文言を返す。
+    中にリンクがあればリンクを押す。
+    """
+    candidates = page.locator(selector).filter(has_text=re.compile(pattern))
+    for i in range(await candidates.count()):
+        element = candidates.nth(i)
+        text = " ".join((await element.inner_text()).split())
+        if site and not available_text(site, text, require_mark):
+            continue
+        link = element.locator("a")
+        target = link.first if await link.count() else element
+        await target.click(timeout=timer.timeout(5000))
+        await page.wait_for_load_state("domcontentloaded", timeout=timer.timeout(10000))
+        return text
+    raise BookingError(f"{what}が見つかりませんでした")
+
+
+async def fill_fields(page, fields: Dict[str, str], timer: StepTimer) -> None:
+    """name 属性かラベルで入力欄を探して値を入れる。"""
+    for key, value in fields.items():
+        field = page.locator(f"[name='{key}']")
+        if not await field.count():
+            field = page.get_by_label(key)
+        if not await field.count():
+            raise BookingError(f"入力欄「{key}」が見つかりませんでした")
+        await field.first.fill(str(value), timeout=timer.timeout(5000))
+
+
+def button(page, pattern: str):
+    """文言が pattern に合うボタン（input の value・リンクも含む）。"""
+    return page.get_by_role("button", name=re.compile(pattern)).or_(page.get_by_role("link", name=re.compile(pattern)))
+
+
+async def click_button(page, pattern: str, timer: StepTimer, what: str) -> None:
+    target = button(page, pattern)
+    if not await target.count():
+        raise BookingError(f"{what}のボタンが見つかりませんでした")
+    await target.first.click(timeout=timer.timeout(5000))
+    await page.wait_for_load_state("domcontentloaded", timeout=timer.timeout(10000))
+
+
+def _unbooked(site: str, mode: str, results: Result, booking_log: "BookingLog") -> List[str]:
+    return [d for d in sorted(results) if results[d].available and not booking_log.booked(site, d, mode)]
+
+
+def pending(site: str, results: Result) -> bool:
+    """自動予約が有効で、まだ予約していない空きの日付が results にあるか。"""
+    mode = mode_from_env()
+    if mode is None or not any(r.available for r in results.values()) or load_profile(site) is None:
+        return False
+    booking_log = BookingLog()
+    try:
+        return bool(_unbooked(site, mode, results, booking_log))
+    finally:
+        booking_log.close()
+
+
+async def run(site, page, results: Result, timer: StepTimer) -> Result:
+    """
+    check の直後に同じページで呼ぶ。空きありの日付のうち、まだ予約していない最初の1日を
+    確認画面まで（submit なら確定まで）進め、その結果を通知する。results はそのまま返す。
+    timer はチェックのもの（空きを見つけた時刻を読み、所要時間の内訳に book として載せる）。
+    画面操作の待ち時間は予約用の予算で決める。
+    """
+    mode = mode_from_env()
+    if mode is None or not any(r.available for r in results.values()):
+        return results
+    profile = load_profile(site.name)
+    if profile is None:
+        log(f"[{site.name}] 予約者の情報（BOOKING_PROFILE）が無いので、自動予約しません。")
+        return results
+    booking_log = BookingLog()
+    try:
+        dates = _unbooked(site.name, mode, results, booking_log)
+        if not dates:
+            return results
+        target = dates[0]
+        detected = timer.marks.get(f"found {target}", time.perf_counter())
+        held = None
+        ok = False
+        log(f"[{site.name}] {target} の予約手続きに進みます（{mode}）。")
+        book_timer = StepTimer(f"{site.name} 予約", budget_ms=budget_from_env())
+        try:
+            with timer.step("book"):
+                with book_timer.step("hold"):
+                    detail = await site.hold(page, target, profile, book_timer)
+                held = time.perf_counter() - detected
+                if mode == "submit":
+                    with book_timer.step("submit"):
+                        detail = await site.submit(page, book_timer)
+                else:
+                    detail += "（dry-run のため確定していません）"
+                ok = True
+        except BookingError as e:
+            detail = f"自動予約できませんでした: {e}"
+        except Exception as e:
+            detail = f"自動予約中にエラー: {e}"
+        book_timer.report(log)
+        total = time.perf_counter() - detected
+        booking_log.add(site.name, target, mode, ok, detail, total)
+    finally:
+        booking_log.close()
+    record_booking(site.name, mode, ok, held, total)
+    if held is not None:
+        log(f"[{site.name}] 空きの判定から確認画面まで {held:.2f} 秒、合計 {total:.2f} 秒。")
+    log(f"[{site.name}] {detail}")
+    await asyncio.to_thread(site.notify, [f"{target} の自動予約（{mode}）: {detail}"])
+    return results
@@ -0,0 +1,186 @@
+"""
+Playwright（playwright.async_api）の起動・コンテキスト作成をまとめた共通レイヤー。
+
+- 判定に不要なリソース（画像・フォント・CSS・動画・解析タグ）は route で読み込まずに中断する
+- 使わない Chromium の機能は起動引数で止める
+- ページごとに転送量（圧縮後の本文とヘッダーのバイト数）を数え、実行の最後にログに出す
+- スクリーンショットは失敗時か CHECKER_DEBUG=1 のときだけ撮る
+- playwright 本体は、ブラウザを使うときに初めて読み込む（API やキャッシュで済む実行の起動を軽くする）
+
+CHECKER_BLOCK_RESOURCES=0 でブロックを止められる（画面の崩れを確認したいときなど）。
+CHROMIUM_EXECUTABLE に実行ファイルのパスを書くと、playwright install の Chromium の代わりにそれを起動する。
+"""
+
+import asyncio
+import os
+from typing import Set
+from urllib.parse import urlparse
+
+from common import log
+
+
+def async_playwright():
+    """playwright.async_api.async_playwright を、呼ばれたときに読み込んで返す。"""
+    from playwright.async_api import async_playwright as start
+
+    return start()
+
+
+def timeout_error() -> type:
+    """playwright の TimeoutError。except 節で使う（例外が起きたときに初めて評価される）。"""
+    from playwright.async_api import TimeoutError
+
+    return TimeoutError
+
+
+LAUNCH_ARGS = [
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disable-translate",
+    "--disable-domain-reliability",
+    "--disable-client-side-phishing-detection",
+    "--disable-features=Translate,OptimizationHints,MediaRouter,InterestFeedContentSuggestions",
+    "--no-first-run",
+    "--mute-audio",
+    "--blink-settings=imagesEnabled=false",
+]
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font", "stylesheet", "texttrack"}
+BLOCKED_HOSTS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "googlesyndication.com",
+    "facebook.net",
+    "facebook.com",
+    "clarity.ms",
+    "hotjar.com",
+    "yahoo.co.jp",
+    "yimg.jp",
+    "line-scdn.net",
+    "twitter.com",
+)
+
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    value = os.environ.get(name, "").strip().lower()
+    if not value:
+        return default
+    return value in ("1", "true", "yes")
+
+
+def debug_enabled() -> bool:
+    return _env_flag("CHECKER_DEBUG")
+
+
+async def launch(playwright):
+    """軽量な設定で Chromium を起動する。"""
+    options = {"headless": True, "args": LAUNCH_ARGS}
+    executable = os.environ.get("CHROMIUM_EXECUTABLE", "").strip()
+    if executable:
+        # playwright install で入れた Chromium の代わりに、手元の Chrome / Chromium を使う
+        options["executable_path"] = executable
+    return await playwright.chromium.launch(**options)
+
+
+def _should_block(request) -> bool:
+    if request.resource_type in BLOCKED_RESOURCE_TYPES:
+        return True
+    host = urlparse(request.url).hostname or ""
+    return any(host == h or host.endswith("." + h) for h in BLOCKED_HOSTS)
+
+
+class TransferCounter:
+    """ページで実際に受け取ったバイト数と、ブロックしたリクエスト数を数える。"""
+
+    def __init__(self):
+        self.bytes = 0
+        self.requests = 0
+        self.blocked = 0
+        self._pending: Set[asyncio.Future] = set()
+
+    def on_request_finished(self, request) -> None:
+        """requestfinished のハンドラ。sizes() の問い合わせは別タスクで行い、settle() で待てるように控えておく。"""
+        task = asyncio.ensure_future(self.count(request))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def settle(self) -> None:
+        """数え途中のリクエストを全部数え終わるまで待つ（報告・リセットの前に呼ぶ）。"""
+        while self._pending:
+            await asyncio.gather(*list(self._pending), return_exceptions=True)
+
+    async def count(self, request) -> None:
+        """読み込みの終わったリクエストの、実際に受け取ったバイト数（圧縮後の本文 + ヘッダー）を足す。"""
+        self.requests += 1
+        try:
+            sizes = await request.sizes()
+        except Exception:
+            # ページが先に閉じたなどで取れないときは Content-Length で近似する
+            try:
+                response = await request.response()
+            except Exception:
+                return
+            length = response.headers.get("content-length") if response else None
+            if length and length.isdigit():
+                self.bytes += int(length)
+            return
+        # HAR の再生など、実際の通信が無いと -1 になる
+        self.bytes += max(0, sizes.get("responseBodySize", 0)) + max(0, sizes.get("responseHeadersSize", 0))
+
+    def summary(self) -> str:
+        return f"転送 {self.bytes / 1024:.0f}KB（{self.requests} 件、ブロック {self.blocked} 件）"
+
+    def reset(self) -> None:
+        self.bytes = self.requests = self.blocked = 0
+
+
+async def new_context(browser, **options):
+    """
+    不要なリソースをブロックするコンテキストを作る。
+    context.transfer に TransferCounter を付けるので、実行後に転送量を確認できる。
+    """
+    context = await browser.new_context(**options)
+    counter = TransferCounter()
+    context.transfer = counter
+
+    if _env_flag("CHECKER_BLOCK_RESOURCES", default=True):
+        async def handle(route):
+            if _should_block(route.request):
+                counter.blocked += 1
+                await route.abort()
+            else:
+                await route.continue_()
+
+        await context.route("**/*", handle)
+    # chunked や圧縮で Content-Length が無い・実際と違う応答もあるので、読み込み終わりに sizes() で数える
+    context.on("requestfinished", counter.on_request_finished)
+    return context
+
+
+async def report_transfer(page, name: str, timer=None) -> None:
+    """
+    ページのコンテキストの（前回の報告以降の）転送量を stderr に出す。timer があればその件数に足す。
+    コンテキストを閉じる前に呼ぶ（数え途中のリクエストを待ってから報告する）。
+    """
+    counter = getattr(page.context, "transfer", None)
+    if counter is not None:
+        await counter.settle()
+        log(f"[{name}] {counter.summary()}")
+        if timer is not None:
+            timer.count("bytes", counter.bytes)
+            timer.count("requests", counter.requests)
+            timer.count("blocked", counter.blocked)
+        counter.reset()
+
+
+async def screenshot(page, path: str, failed: bool = False) -> None:
+    """失敗時か CHECKER_DEBUG=1 のときだけスクリーンショットを撮る。"""
+    if not (failed or debug_enabled()):
+        return
+    try:
+        await page.screenshot(path=path, full_page=debug_enabled())
+    except Exception as e:
+        log(f"スクリーンショットを保存できませんでした: {e}")
@@ -0,0 +1,278 @@
+"""
+カレンダーのセルから「空きあり／空きなし」を判定する、ブラウザに依存しない判定モジュール。
+
+サイトごとに空き/満員マークを1つの正規表現にまとめてコンパイルしておき、
+1か月分のセルを1回の呼び出しでまとめて判定して {日: 状態} を返す。
+
+セルは _read_calendar と同じ形の dict（text, date, cls, disabled, cell）で渡す。
+保存した HTML からも同じ形のセルを作れるので、オフラインで精度と速度を測れる:
+
+    python classifier.py bench snapshots/compass-2026-03.html ...
+    python classifier.py bench tests/fixtures/classifier/compass-*.html
+
+（各 HTML の隣に {"2026-03-05": "full", ...} 形式の .expected.json を置くと正解率も出す。null はセルなし）
+tests/fixtures/classifier/ のスナップショットと正解は tests/test_classifier.py が pytest で確かめる。
+"""
+
+import json
+import re
+import sys
+import time
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+AVAILABLE = "available"  # 空きマークあり
+FULL = "full"  # 満員マーク・無効表示
+UNMARKED = "unmarked"  # 日付のセルはあるがマークが無い（コンパスでは空きありとして扱う）
+
+_DATE_ATTR_RE = re.compile(r"(\d{4})-(\d{2})-(\d{2})")
+_NUMBER_RE = re.compile(r"\b\d+\b")
+_SLOT_COUNT_RE = re.compile(r"(?:残り|残|あと)\s*(\d+)")
+
+
+class SiteRules:
+    """サイトごとの判定ルール。マークは (?P<no>…)|(?P<yes>…) の1本の正規表現にまとめる。"""
+
+    def __init__(
+        self,
+        name: str,
+        slot_marks: Iterable[str],
+        no_slot_marks: Iterable[str],
+        no_slot_classes: Iterable[str] = (),
+    ):
+        self.name = name
+        self.slot_marks = list(slot_marks)
+        self.no_slot_marks = list(no_slot_marks)
+        self.no_slot_classes = list(no_slot_classes)
+        self.marks = re.compile(
+            "(?P<no>{})|(?P<yes>{})".format(
+                "|".join(map(re.escape, self.no_slot_marks)),
+                "|".join(map(re.escape, self.slot_marks)),
+            )
+        )
+        self.classes = (
+            re.compile("|".join(map(re.escape, self.no_slot_classes)), re.IGNORECASE)
+            if self.no_slot_classes
+            else None
+        )
+
+    def scan(self, text: str) -> set:
+        """text に含まれるマークの種類（"no" / "yes"）の集合を返す。"""
+        return {m.lastgroup for m in self.marks.finditer(text)}
+
+
+COMPASS = SiteRules(
+    "compass",
+    slot_marks=["○", "〇", "△", "▲", "空き", "◯", "◎", "残り", "予約", "購入", "選択"],
+    no_slot_marks=["X", "×", "✕", "❌", "満員", "売切", "－", "ー", "−"],
+    no_slot_classes=["unavailable", "soldout", "sold-out", "closed", "full", "disabled", "no-slot", "blocked"],
+)
+CLINIC = SiteRules(
+    "clinic",
+    slot_marks=["○", "◯", "△", "予約", "空き"],
+    no_slot_marks=["×", "満"],
+)
+RULES = {r.name: r for r in (COMPASS, CLINIC)}
+
+
+def slot_count(text: str) -> Optional[int]:
+    """セルの「残り3」「残3」「あと3」のような表示から残り枠数を読む。無ければ None。"""
+    m = _SLOT_COUNT_RE.search(text or "")
+    return int(m.group(1)) if m else None
+
+
+def _classify_compass(cells: List[dict], year: int, month: int) -> Dict[int, Tuple[str, str]]:
+    rules = COMPASS
+    result: Dict[int, Tuple[str, str]] = {}
+    prefix = f"{year:04d}-{month:02d}-"
+
+    # 1) data-date が振ってある日はそのセルで判定する（完全一致を優先）
+    dated: Dict[int, dict] = {}
+    for cell in cells:
+        m = _DATE_ATTR_RE.search(cell.get("date") or "")
+        if not m or not m.group(0).startswith(prefix):
+            continue
+        day = int(m.group(3))
+        if day not in dated or (cell["date"] == m.group(0) and dated[day]["date"] != m.group(0)):
+            dated[day] = cell
+    for day, cell in dated.items():
+        text = cell.get("text") or ""
+        kinds = rules.scan(text)
+        if cell.get("disabled") or "no" in kinds:
+            status = FULL
+        elif rules.classes and rules.classes.search(cell.get("cls") or ""):
+            status = FULL
+        elif "yes" in kinds:
+            status = AVAILABLE
+        else:
+            status = UNMARKED
+        result[day] = (status, text)
+
+    # 2) 残りの日は、候補セルを DOM 順に見て最初に当てはまったセルで判定する
+    #    （data-date 付きのセルは 1) で済んでいるか、前後の月のセルなので数字では見ない）
+    for cell in cells:
+        text = cell.get("text") or ""
+        if not cell.get("cell", True) or not text or len(text) > 50 or _DATE_ATTR_RE.search(cell.get("date") or ""):
+            continue
+        # 「残り 3」の 3 は枠数なので、日付の候補から外す
+        numbers = _NUMBER_RE.findall(_SLOT_COUNT_RE.sub(" ", text))
+        days = {int(n) for n in numbers if not n.startswith("0")}
+        days = {d for d in days if 1 <= d <= 31 and d not in result}
+        if not days:
+            continue
+        kinds = rules.scan(text)
+        if kinds:
+            status = FULL if "no" in kinds else AVAILABLE
+        elif "—" in text or "－" in text:
+            # 日付＋—（ダッシュ）だけのセルは「未選択」なのでスキップ
+            continue
+        else:
+            status = UNMARKED
+        for d in days:
+            result[d] = (status, text)
+    return result
+
+
+def _classify_clinic(cells: List[dict], year: int, month: int) -> Dict[int, Tuple[str, str]]:
+    rules = CLINIC
+    result: Dict[int, Tuple[str, str]] = {}
+    for cell in cells:
+        text = " ".join((cell.get("text") or "").split())
+        if not text:
+            continue
+        # 「5」だけのセルか「3/5」を含むセルを、その日のセルとみなす（最初に見つかったもの）
+        days = {int(text)} if text.isdigit() else set()
+        days |= {int(d) for d in re.findall(rf"(?<!\d){month}/(\d{{1,2}})(?!\d)", text)}
+        days = {d for d in days if 1 <= d <= 31 and d not in result}
+        if not days:
+            continue
+        kinds = rules.scan(text)
+        status = AVAILABLE if "yes" in kinds and "no" not in kinds else FULL
+        for d in days:
+            result[d] = (status, text)
+    return result
+
+
+_CLASSIFIERS = {"compass": _classify_compass, "clinic": _classify_clinic}
+
+
+def classify_month(site: str, cells: List[dict], year: int, month: int) -> Dict[int, str]:
+    """
+    1か月分のセルをまとめて判定する。
+    戻り値: {日: AVAILABLE / FULL / UNMARKED}（セルが見つからなかった日は含まない）
+    """
+    return {day: status for day, (status, _) in _CLASSIFIERS[site](cells, year, month).items()}
+
+
+def classify_month_cells(site: str, cells: List[dict], year: int, month: int) -> Dict[int, Tuple[str, str]]:
+    """classify_month と同じだが、判定に使ったセルのテキストも {日: (状態, テキスト)} で返す。"""
+    return _CLASSIFIERS[site](cells, year, month)
+
+
+def classify_dates(site: str, cells: List[dict], dates: List[str]) -> Dict[str, Optional[str]]:
+    """classify_month の日付版。{YYYY-MM-DD: 状態 or None（セルなし）} を返す。"""
+    result: Dict[str, Optional[str]] = {}
+    by_month: Dict[tuple, Dict[int, str]] = {}
+    for d in dates:
+        y, m, day = (int(x) for x in d.split("-"))
+        if (y, m) not in by_month:
+            by_month[(y, m)] = classify_month(site, cells, y, m)
+        result[d] = by_month[(y, m)].get(day)
+    return result
+
+
+class _CellParser(HTMLParser):
+    """保存した HTML から _read_calendar と同じ形のセルを取り出す（オフライン用）。"""
+
+    CELL_TAGS = {"td", "li", "button", "a"}
+    CELL_ROLES = {"gridcell", "button"}
+    VOID_TAGS = {"br", "img", "input", "meta", "link", "hr", "wbr", "source", "col", "area", "base"}
+
+    def __init__(self):
+        super().__init__()
+        self.cells: List[dict] = []
+        self._stack: List[Optional[dict]] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.VOID_TAGS:
+            if tag == "br":
+                self.handle_data("\n")
+            return
+        a = dict(attrs)
+        is_cell = tag in self.CELL_TAGS or a.get("role") in self.CELL_ROLES
+        if is_cell or "data-date" in a:
+            entry = {
+                "text": "",
+                "date": a.get("data-date") or "",
+                "cls": a.get("class") or "",
+                "disabled": "disabled" in a or a.get("aria-disabled") == "true",
+                "cell": is_cell,
+            }
+            self.cells.append(entry)
+            self._stack.append(entry)
+        else:
+            self._stack.append(None)
+
+    def handle_endtag(self, tag):
+        if tag not in self.VOID_TAGS and self._stack:
+            self._stack.pop()
+
+    def handle_data(self, data):
+        for entry in self._stack:
+            if entry is not None:
+                entry["text"] += data
+
+
+def cells_from_html(html: str) -> List[dict]:
+    parser = _CellParser()
+    parser.feed(html)
+    cells = []
+    for c in parser.cells:
+        c["text"] = "\n".join(" ".join(line.split()) for line in c["text"].splitlines() if line.strip())
+        if c["date"] or (c["text"] and len(c["text"]) <= 50):
+            cells.append(c)
+    return cells
+
+
+def bench(paths: List[str], site: str = "compass", repeat: int = 200) -> int:
+    """保存した HTML ごとに、判定の正解率と 1 秒あたりの判定セル数を出す。"""
+    total_ok = total = 0
+    for path in paths:
+        p = Path(path)
+        cells = cells_from_html(p.read_text(encoding="utf-8"))
+        expected_path = p.with_suffix(".expected.json")
+        expected = json.loads(expected_path.read_text(encoding="utf-8")) if expected_path.exists() else {}
+        months = sorted({(int(d[:4]), int(d[5:7])) for d in expected}) or [(2000, 1)]
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for y, m in months:
+                classify_month(site, cells, y, m)
+        elapsed = time.perf_counter() - started
+        rate = len(cells) * len(months) * repeat / elapsed if elapsed else 0.0
+
+        got = classify_dates(site, cells, list(expected))
+        ok = sum(1 for d, want in expected.items() if got[d] == want)
+        total_ok += ok
+        total += len(expected)
+        print(f"{p.name}: セル {len(cells)} 個, 正解 {ok}/{len(expected)}, {rate:,.0f} セル/秒")
+        for d, want in expected.items():
+            if got[d] != want:
+                print(f"  ✗ {d}: 期待 {want} / 判定 {got[d]}")
+    if total:
+        print(f"合計 正解率 {total_ok / total:.1%} ({total_ok}/{total})")
+    return 0 if total_ok == total else 1
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if not args or args[0] != "bench":
+        print("使い方: python classifier.py bench [--site compass|clinic] snapshot.html ...", file=sys.stderr)
+        sys.exit(2)
+    site = "compass"
+    if len(args) > 2 and args[1] == "--site":
+        site = args[2]
+        args = args[2:]
+    sys.exit(bench(args[1:], site=site))
@@ -0,0 +1,70 @@
+"""
+コンパス・クリニックの両方で使う小さな共通関数（進行ログ・対象日の読み取り）と、判定結果の型。
+"""
+
+import os
+import re
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional
+
+
+class Check(NamedTuple):
+    """1日分の判定結果。available は判定できなければ None。slots は残り枠数（サイトが出していなければ None）。"""
+
+    available: Optional[bool]
+    detail: str  # 通知にそのまま載せる説明
+    slots: Optional[int] = None
+
+
+# {日付: 判定結果}
+Result = Dict[str, Check]
+
+
+def log(msg: str) -> None:
+    """進行ログ（stderr に出すので標準出力と分離）"""
+    print(msg, file=sys.stderr, flush=True)
+
+
+def get_check_date() -> str:
+    """環境変数 CHECK_DATE (YYYY-MM-DD) または明日の日付を返す。"""
+    s = os.environ.get("CHECK_DATE", "").strip()
+    if s:
+        try:
+            return datetime.strptime(s, "%Y-%m-%d").strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    tomorrow = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+    return tomorrow
+
+
+def parse_dates(s: str) -> List[str]:
+    """
+    カンマ/空白区切りの YYYY-MM-DD と、範囲 YYYY-MM-DD..YYYY-MM-DD（~ も可）を
+    日付のリスト（昇順・重複なし）に展開する。
+    """
+    dates = set()
+    for token in re.split(r"[,\s]+", s.strip()):
+        if not token:
+            continue
+        try:
+            if ".." in token or "~" in token:
+                first, last = re.split(r"\.\.|~", token, maxsplit=1)
+                d = datetime.strptime(first, "%Y-%m-%d")
+                end = datetime.strptime(last, "%Y-%m-%d")
+                while d <= end:
+                    dates.add(d.strftime("%Y-%m-%d"))
+                    d += timedelta(days=1)
+            else:
+                dates.add(datetime.strptime(token, "%Y-%m-%d").strftime("%Y-%m-%d"))
+        except ValueError:
+            log(f"日付を解釈できません: {token}")
+    return sorted(dates)
+
+
+def get_check_dates() -> List[str]:
+    """
+    環境変数 CHECK_DATES から対象日のリストを返す（書式は parse_dates）。
+    未設定なら CHECK_DATE（なければ明日）の1日だけ。
+    """
+    return parse_dates(os.environ.get("CHECK_DATES", "")) or [get_check_date()]
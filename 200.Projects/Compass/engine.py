@@ -0,0 +1,255 @@
+"""
+複数の (サイト, 日付) のチェックを asyncio で並行して動かすエンジン。
+
+Chromium は1つだけ（初めてブラウザが必要になったときに）起動し、ジョブごとのブラウザコンテキストで
+最大 concurrency 本（既定: 環境変数 CHECK_CONCURRENCY または 4）を同時に動かす。
+コンパスとクリニックを一緒に確認しても、かかる時間は遅い方のサイトとほぼ同じになる。
+
+    python main.py all                  # watch.json（WATCH_CONFIG）の対象を1回だけ並行して確認する
+    python main.py all 設定ファイル
+"""
+
+import asyncio
+import os
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import booking
+from browser_setup import async_playwright, launch, new_context, report_transfer
+from common import Check, log
+from metrics import record_check
+from notify import close_dispatcher
+import replay
+from sites import SITES, Result, Site, SiteBlocked
+from state import StateStore
+from timing import StepTimer
+
+
+DEFAULT_CONCURRENCY = 4
+
+
+def concurrency_from_env(default: int = DEFAULT_CONCURRENCY) -> int:
+    """環境変数 CHECK_CONCURRENCY（同時に動かすジョブ数）を読む。未設定・不正なら default。"""
+    try:
+        return max(1, int(os.environ.get("CHECK_CONCURRENCY", "").strip() or default))
+    except ValueError:
+        return default
+
+
+class Job:
+    """1サイト分の確認する日付。"""
+
+    def __init__(self, site: Site, dates: List[str]):
+        self.site = site
+        self.dates = sorted(set(dates))
+
+
+def jobs_from_targets(targets: List[dict]) -> List[Job]:
+    """
+    targets（[{"site": ..., "dates": [...]}]）を、同じサイトの日付をまとめた1サイト1ジョブにする。
+    SITES に無いサイト名（設定の書き間違いなど）の対象は、ログに出して飛ばす。
+    """
+    by_site: Dict[str, set] = defaultdict(set)
+    for target in targets:
+        name = target.get("site")
+        if name not in SITES:
+            log(f"不明なサイト {name!r} の対象を飛ばします（使えるのは {', '.join(SITES)}）。")
+            continue
+        by_site[name].update(target["dates"])
+    return [Job(SITES[name](), sorted(dates)) for name, dates in by_site.items()]
+
+
+def context_options(site: Site, proxy: Optional[str]) -> dict:
+    """site のブラウザコンテキストの設定。proxy があればそのコンテキストだけプロキシ経由にする。"""
+    options = dict(site.context_options, **replay.context_options(site.name))
+    # ログイン済みのセッション（Cookie / localStorage）を使う。自動予約でログインの手間を省く
+    storage_state = os.environ.get(f"{site.name.upper()}_STORAGE_STATE", "").strip()
+    if storage_state and os.path.exists(storage_state):
+        options["storage_state"] = storage_state
+    if proxy:
+        options["proxy"] = {"server": proxy}
+    return options
+
+
+async def open_context(browser, site: Site, proxy: Optional[str] = None):
+    """site 用のブラウザコンテキストを作る（再生中なら通信を HAR から返す）。"""
+    context = await new_context(browser, **context_options(site, proxy))
+    await replay.prepare(context, site.name)
+    return context
+
+
+class Pages:
+    """
+    共有する Chromium と、ジョブに貸し出すページ。
+    ここではジョブごとに新しいコンテキストを作り、返却されたら閉じる（watcher.BrowserPool は使い回す）。
+    playwright（Node のドライバ）も、最初にページが要るときに起動する。API やスナップショットだけで
+    済んだ実行では起動しない。
+    """
+
+    def __init__(self, playwright=None):
+        self.playwright = playwright
+        self._owns_playwright = playwright is None
+        self.browser = None
+        self._lock = asyncio.Lock()
+
+    async def _ensure_browser(self):
+        async with self._lock:
+            if self.playwright is None:
+                self.playwright = await async_playwright().start()
+            if self.browser is None or not self.browser.is_connected():
+                log("Chromium を起動します...")
+                self.browser = await launch(self.playwright)
+                self.on_launch()
+        return self.browser
+
+    def on_launch(self) -> None:
+        """ブラウザを（起動し直して）新しくしたときに呼ばれる。"""
+
+    async def page(self, site: Site, proxy: Optional[str] = None):
+        browser = await self._ensure_browser()
+        context = await open_context(browser, site, proxy)
+        return await context.new_page()
+
+    async def release(self, site: Site, page, broken: bool = False) -> None:
+        try:
+            await page.context.close()
+        except Exception:
+            pass
+
+    async def close(self) -> None:
+        if self.browser is not None:
+            try:
+                await self.browser.close()
+            except Exception:
+                pass
+        if self._owns_playwright and self.playwright is not None:
+            await self.playwright.stop()
+            self.playwright = None
+
+
+async def _check_in_browser(pages: Pages, site: Site, dates: List[str], timer: StepTimer) -> Result:
+    """
+    ブラウザで確認する。プロキシを使うサイトは成績の良い順に試し、
+    遮断・タイムアウト（SiteBlocked）なら同じ実行のうちに次のプロキシで開き直す。
+    AUTO_BOOK が設定されていれば、空きを見つけたページのまま予約手続きに進む（booking.run）。
+    """
+    with timer.step("proxy"):
+        # 再生中はネットワークに出ないので、プロキシは使わない
+        candidates = [None] if replay.replay_dir() else await asyncio.to_thread(site.proxy_candidates)
+    blocked: Optional[SiteBlocked] = None
+    for i, proxy in enumerate(candidates):
+        with timer.step("page"):
+            page = await pages.page(site, proxy)
+        broken = False
+        try:
+            results = await site.check(page, dates, timer)
+            if any(r.available is not None for r in results.values()):
+                # 1日でも判定できたならページは読み込めている。全部 None ならプロキシの成績は動かさない
+                await asyncio.to_thread(site.report_proxy, proxy, True)
+            return await booking.run(site, page, results, timer)
+        except SiteBlocked as e:
+            broken = True
+            blocked = e
+            await asyncio.to_thread(site.report_proxy, proxy, False)
+            if i == len(candidates) - 1 or timer.over_budget():
+                break
+            timer.count("failovers")
+            log(f"[{site.name}] {e}（プロキシ {proxy}）。{candidates[i + 1]} で開き直します。")
+        except Exception:
+            broken = True
+            raise
+        finally:
+            await report_transfer(page, site.name, timer)
+            await pages.release(site, page, broken=broken)
+    detail = str(blocked) if blocked else "試せるプロキシがありませんでした。"
+    return {d: Check(None, detail) for d in dates}
+
+
+async def run_job(pages: Pages, job: Job) -> Result:
+    """
+    1ジョブを確認する。API か TTL 以内のカレンダーのスナップショットで判定できればブラウザを使わない
+    （HAR の記録・再生中は必ずブラウザで確認する）。失敗は日付ごとのエラー（空きありかは None）として返す。
+    """
+    site = job.site
+    timer = StepTimer(site.name, budget_ms=site.budget_ms())
+    started = time.monotonic()
+    try:
+        results = None
+        if not replay.active():
+            with timer.step("api"):
+                results = await asyncio.to_thread(site.fast_check, job.dates)
+            if results is None:
+                results = site.cached_check(job.dates, timer)
+            if results is not None and booking.pending(site.name, results):
+                # API やスナップショットで空きを見つけても、予約はページでしかできない
+                results = None
+        if results is None:
+            results = await _check_in_browser(pages, site, job.dates, timer)
+    except Exception as e:
+        results = {d: Check(None, f"エラー: {e}") for d in job.dates}
+    timer.report(log)
+    record_check(timer, results)
+    replay.save_meta(site.name, job.dates, results)
+    log(f"[{site.name}] {time.monotonic() - started:.1f} 秒で {len(results)} 日分を確認しました。")
+    return results
+
+
+async def run_jobs(pages: Pages, jobs: List[Job], concurrency: Optional[int] = None) -> List[Result]:
+    """jobs を最大 concurrency 本ずつ並行して確認し、jobs と同じ順に結果を返す。"""
+    semaphore = asyncio.Semaphore(concurrency or concurrency_from_env())
+
+    async def run(job: Job) -> Result:
+        async with semaphore:
+            return await run_job(pages, job)
+
+    return list(await asyncio.gather(*(run(job) for job in jobs)))
+
+
+def check_jobs(jobs: List[Job], concurrency: Optional[int] = None) -> List[Result]:
+    """ブラウザを（要るときに）1つだけ起動して jobs を並行して確認し、閉じる（同期版の入口）。"""
+
+    async def main() -> List[Result]:
+        pages = Pages()
+        try:
+            return await run_jobs(pages, jobs, concurrency)
+        finally:
+            await pages.close()
+            for job in jobs:
+                job.site.close()
+
+    return asyncio.run(main())
+
+
+def check_site(site: Site, dates: List[str]) -> Result:
+    """1サイト分の日付を確認する。戻り値: {日付: Check(空きありか, 判定の説明メッセージ, 残り枠数)}"""
+    return check_jobs([Job(site, dates)])[0]
+
+
+def check_targets(targets: List[dict], concurrency: Optional[int] = None) -> Dict[str, Result]:
+    """targets をサイトごとに並行して1回ずつ確認する。戻り値: {site 名: 結果}"""
+    jobs = jobs_from_targets(targets)
+    return {job.site.name: results for job, results in zip(jobs, check_jobs(jobs, concurrency))}
+
+
+def run_all(config_path: Optional[str] = None) -> int:
+    """設定ファイルの全対象を1回だけ並行して確認し、空きに変わった日付をサイトごとに通知する。"""
+    from watcher import load_config
+
+    config = load_config(config_path)
+    started = time.monotonic()
+    results = check_targets(config["targets"], config.get("concurrency"))
+    log(f"{len(results)} サイトを {time.monotonic() - started:.1f} 秒で確認しました。")
+
+    store = StateStore()
+    try:
+        for name, site_results in results.items():
+            for d in sorted(site_results):
+                print(f"[{name}] {site_results[d].detail}", flush=True)
+            hits = [site_results[d].detail for d in store.update(name, site_results)]
+            if hits:
+                SITES[name]().notify(hits)
+    finally:
+        store.close()
+        close_dispatcher()
+    return 0
@@ -0,0 +1,476 @@
+"""
+通知・プロキシ・自動予約の動作確認用のローカル偽サーバー（LINE Messaging API・SMTP・HTTP プロキシ・予約サイト・
+コンパスのカレンダー）。
+
+本物の LINE / Gmail に送らずに、ディスパッチャのまとめ送信・再送・並行送信を確かめられる。
+本物のクリニック・コンパスで予約せずに、booking.py の自動予約を最後まで通せる。
+
+    python fake_servers.py            # 起動して、使うべき環境変数を表示する
+    python fake_servers.py --fail 2   # LINE の最初の2回は 500 を返す（再送の確認）
+    python fake_servers.py --reserve  # 偽の予約サイト（クリニックと同じ手順）を起動する
+
+コードから使う場合:
+
+    with FakeLineServer() as line, FakeSmtpServer() as smtp:
+        d = Dispatcher(line_token="t", line_to="U1", line_api_base=line.url,
+                       gmail_user="a@example.com", gmail_password="p",
+                       smtp_host="127.0.0.1", smtp_port=smtp.port, smtp_ssl=False)
+        d.dispatch("【テスト】", ["2026-03-05 に空きがあります。"])
+        print(line.requests, smtp.messages)
+
+    with FakeProxy() as fast, FakeProxy(delay=2) as slow, FakeProxy(blocked=True) as blocked:
+        pool = ProxyPool("clinic", [slow.url, blocked.url, fast.url], "http://example.com/", path=":memory:")
+        print(pool.ranked())
+"""
+
+import html
+import json
+import socketserver
+import sys
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+
+class _Background:
+    """serve_forever を別スレッドで動かし、with で起動・停止する共通部分。"""
+
+    server: socketserver.BaseServer
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class FakeLineServer(_Background):
+    """
+    /v2/bot/message/push と /v2/bot/message/multicast を受け付け、届いた JSON を requests に貯める。
+    statuses に並べたステータスコードを順に返し、使い切ったら 200 を返す（429 には Retry-After を付ける）。
+    delay 秒だけ応答を遅らせることもできる。
+    """
+
+    def __init__(self, statuses: Optional[List[int]] = None, delay: float = 0, port: int = 0):
+        self.requests: List[dict] = []
+        self.statuses = list(statuses or [])
+        self.delay = delay
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                with fake._lock:
+                    status = fake.statuses.pop(0) if fake.statuses else 200
+                    fake.requests.append({"path": self.path, "status": status, "body": body})
+                if fake.delay:
+                    time.sleep(fake.delay)
+                self.send_response(status)
+                if status == 429:
+                    self.send_header("Retry-After", "1")
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(b"{}" if status == 200 else b'{"message":"fake error"}')
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+
+class FakeSmtpServer(_Background):
+    """EHLO / AUTH / MAIL / RCPT / DATA / QUIT だけを話す最小の SMTP サーバー。届いた本文を messages に貯め、QUIT の回数を quits に数える。"""
+
+    def __init__(self, port: int = 0):
+        self.messages: List[str] = []
+        self.logins = 0
+        self.quits = 0
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line: str) -> None:
+                self.wfile.write((line + "\r\n").encode())
+
+            def handle(self):
+                self.reply("220 fake smtp ready")
+                while True:
+                    raw = self.rfile.readline()
+                    if not raw:
+                        return
+                    cmd = raw.decode(errors="replace").strip()
+                    verb = cmd.split(" ", 1)[0].upper()
+                    if verb == "EHLO":
+                        self.reply("250-fake")
+                        self.reply("250 AUTH PLAIN LOGIN")
+                    elif verb == "AUTH":
+                        fake.logins += 1
+                        self.reply("235 ok")
+                    elif verb == "DATA":
+                        self.reply("354 go ahead")
+                        lines = []
+                        while True:
+                            line = self.rfile.readline().decode(errors="replace")
+                            if line.rstrip("\r\n") == "." or not line:
+                                break
+                            lines.append(line)
+                        fake.messages.append("".join(lines))
+                        self.reply("250 queued")
+                    elif verb == "QUIT":
+                        fake.quits += 1
+                        self.reply("221 bye")
+                        return
+                    else:
+                        self.reply("250 ok")
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self.server = Server(("127.0.0.1", port), Handler)
+
+
+class FakeProxy(_Background):
+    """
+    プロキシのふりをする HTTP サーバー。転送はせず、届いたリクエストに自分で答える（CONNECT は受け付けない）。
+    delay 秒遅らせる・status で失敗を返す・blocked で「海外アクセス遮断」のページを返すことができる。
+    """
+
+    def __init__(self, delay: float = 0, status: int = 200, blocked: bool = False, port: int = 0):
+        self.requests: List[str] = []
+        self.delay = delay
+        self.status = status
+        self.blocked = blocked
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _answer(self, with_body: bool) -> None:
+                fake.requests.append(f"{self.command} {self.path}")
+                if fake.delay:
+                    time.sleep(fake.delay)
+                body = ("Access from overseas is prohibited" if fake.blocked else "<html><li class='nextpage'>再診(婦人科)</li></html>").encode()
+                self.send_response(fake.status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if with_body:
+                    self.wfile.write(body)
+
+            def do_HEAD(self):
+                self._answer(False)
+
+            def do_GET(self):
+                self._answer(True)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+
+class FakeReserveSite(_Background):
+    """
+    クリニックの予約サイトと同じ手順の偽サイト:
+    トップ（li.nextpage の「再診(婦人科)」→「次へ」）→ カレンダー（「3/5 ○」のセル）→ 時間枠 → 入力 → 確認 → 完了。
+    available の日付の times の枠だけが空いている。完了した予約は completed に貯まり、その枠は埋まる。
+    """
+
+    def __init__(self, available: Iterable[str], full: Iterable[str] = (), times: Iterable[str] = ("10:00", "10:30"), port: int = 0):
+        self.slots: Dict[str, List[str]] = {d: list(times) for d in available}
+        self.full = sorted(set(full) - set(self.slots))
+        self.completed: List[dict] = []
+        self._lock = threading.Lock()
+        fake = self
+
+        def page(title: str, body: str) -> bytes:
+            return (
+                "<!DOCTYPE html><html lang='ja'><head><meta charset='utf-8'>"
+                f"<title>{title}</title></head><body><h1>{title}</h1>{body}</body></html>"
+            ).encode()
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, body: bytes, status: int = 200) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                q = {k: v[0] for k, v in parse_qs(url.query).items()}
+                esc = {k: html.escape(v, quote=True) for k, v in q.items()}
+                if url.path in ("/", "/sp/index.php"):
+                    self._send(page("予約メニュー", (
+                        "<ul><li class='nextpage' onclick=\"document.getElementById('next').style.display='inline'\">再診(婦人科)</li></ul>"
+                        "<a id='next' href='/calendar' style='display:none'>次へ</a>"
+                    )))
+                elif url.path == "/calendar":
+                    with fake._lock:
+                        days = sorted([(d, bool(t)) for d, t in fake.slots.items()] + [(d, False) for d in fake.full])
+                    cells = "".join(
+                        f"<td><a href='/slots?date={d}'>{int(d[5:7])}/{int(d[8:])} ○</a></td>" if ok
+                        else f"<td>{int(d[5:7])}/{int(d[8:])} ×</td>"
+                        for d, ok in days
+                    )
+                    self._send(page("日付の選択", f"<table><tr>{cells}</tr></table>"))
+                elif url.path == "/slots":
+                    with fake._lock:
+                        free = list(fake.slots.get(q.get("date", ""), []))
+                    items = "".join(f"<li><a href='/form?date={esc['date']}&time={t}'>{t} ○</a></li>" for t in free)
+                    self._send(page("時間の選択", f"<ul><li>9:30 ×</li>{items}</ul>"))
+                elif url.path == "/form":
+                    self._send(page("予約者の情報", (
+                        "<form action='/confirm' method='get'>"
+                        f"<input type='hidden' name='date' value='{esc.get('date', '')}'>"
+                        f"<input type='hidden' name='time' value='{esc.get('time', '')}'>"
+                        "<label>診察券番号 <input name='patient_no'></label>"
+                        "<label>電話番号 <input name='tel'></label>"
+                        "<button type='submit'>確認画面へ</button></form>"
+                    )))
+                elif url.path == "/confirm":
+                    if not q.get("patient_no") or not q.get("tel"):
+                        self._send(page("予約者の情報", "<p>診察券番号と電話番号を入力してください。</p>"))
+                        return
+                    hidden = "".join(f"<input type='hidden' name='{k}' value='{v}'>" for k, v in esc.items())
+                    self._send(page("内容をご確認ください", (
+                        f"<p>{esc['date']} {esc.get('time', '')} / 診察券番号 {esc['patient_no']}</p>"
+                        f"<form action='/complete' method='get'>{hidden}<button type='submit'>予約する</button></form>"
+                    )))
+                elif url.path == "/complete":
+                    with fake._lock:
+                        free = fake.slots.get(q.get("date", ""), [])
+                        if q.get("time") not in free:
+                            body = page("エラー", "<p>選択した枠は埋まりました。</p>")
+                        else:
+                            free.remove(q["time"])
+                            fake.completed.append(q)
+                            body = page("予約完了", f"<p>予約を受け付けました。予約番号: R{len(fake.completed):04d}</p>")
+                    self._send(body)
+                else:
+                    self._send(page("Not Found", ""), 404)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/sp/index.php"
+
+
+class FakeCompassSite(_Background):
+    """
+    コンパスのチケットカレンダーと同じ形の偽サイト（月送りはページ内の JS で、月ごとに /api/calendar を取得する）。
+    days は {日付: 残り枠数}（0 なら売切）。start の月（YYYY-MM）から表示し、?month=YYYY-MM でその月を直接開ける。
+    ページを開いた回数は page_loads に、月ごとのカレンダーの取得回数は month_loads に数える。
+    空きのある日のセルを押すと購入手続き（枚数・入力 → 確認 → 完了）に進む。完了した購入は completed に貯まり、
+    その日の残り枠数は枚数分だけ減る。
+    """
+
+    PATH = "/user/e/compass/tickets"
+
+    def __init__(self, days: Dict[str, int], start: str, port: int = 0):
+        self.days = dict(days)
+        self.start_month = start
+        self.page_loads = 0
+        self.month_loads: Dict[str, int] = {}
+        self.completed: List[dict] = []
+        self._lock = threading.Lock()
+        fake = self
+
+        def page(title: str, body: str) -> bytes:
+            return (
+                "<!DOCTYPE html><html lang='ja'><head><meta charset='utf-8'>"
+                f"<title>{title} | コンパス</title></head><body><h1>{title}</h1>{body}</body></html>"
+            ).encode()
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, body: bytes, content_type: str, status: int = 200) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _booking(self, path: str, q: Dict[str, str]) -> None:
+                esc = {k: html.escape(v, quote=True) for k, v in q.items()}
+                with fake._lock:
+                    remaining = fake.days.get(q.get("date", ""), 0)
+                if path == "/purchase":
+                    if not remaining:
+                        self._send(page("エラー", "<p>この日のチケットは売り切れました。</p>"), "text/html; charset=utf-8")
+                        return
+                    options = "".join(f"<option value='{n}'>{n} 枚</option>" for n in range(1, remaining + 1))
+                    self._send(page("チケットの購入", (
+                        "<form action='/purchase/confirm' method='get'>"
+                        f"<input type='hidden' name='date' value='{esc.get('date', '')}'>"
+                        f"<label>枚数 <select name='tickets'>{options}</select></label>"
+                        "<label>お名前 <input name='name'></label>"
+                        "<label>メールアドレス <input name='email'></label>"
+                        "<button type='submit'>次へ</button></form>"
+                    )), "text/html; charset=utf-8")
+                elif path == "/purchase/confirm":
+                    if not q.get("name") or not q.get("email"):
+                        self._send(page("チケットの購入", "<p>お名前とメールアドレスを入力してください。</p>"), "text/html; charset=utf-8")
+                        return
+                    hidden = "".join(f"<input type='hidden' name='{k}' value='{v}'>" for k, v in esc.items())
+                    self._send(page("内容をご確認ください", (
+                        f"<p>{esc['date']} / {esc.get('tickets', '')} 枚 / {esc['name']}</p>"
+                        f"<form action='/purchase/complete' method='get'>{hidden}<button type='submit'>購入する</button></form>"
+                    )), "text/html; charset=utf-8")
+                else:
+                    tickets = int(q.get("tickets", "0") or 0)
+                    with fake._lock:
+                        if not 0 < tickets <= fake.days.get(q.get("date", ""), 0):
+                            body = page("エラー", "<p>残りの枚数が足りませんでした。</p>")
+                        else:
+                            fake.days[q["date"]] -= tickets
+                            fake.completed.append(q)
+                            body = page("購入完了", f"<p>購入を受け付けました。予約番号: C{len(fake.completed):04d}</p>")
+                    self._send(body, "text/html; charset=utf-8")
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                month = query.get("month", fake.start_month)
+                if url.path in ("/purchase", "/purchase/confirm", "/purchase/complete"):
+                    self._booking(url.path, query)
+                elif url.path == FakeCompassSite.PATH:
+                    with fake._lock:
+                        fake.page_loads += 1
+                    self._send(_COMPASS_PAGE.replace("__MONTH__", html.escape(month)).encode(), "text/html; charset=utf-8")
+                elif url.path == "/api/calendar":
+                    with fake._lock:
+                        fake.month_loads[month] = fake.month_loads.get(month, 0) + 1
+                        days = [{"date": d, "remaining": n} for d, n in sorted(fake.days.items()) if d.startswith(month)]
+                    self._send(json.dumps({"month": month, "days": days}).encode(), "application/json")
+                else:
+                    self._send(b"not found", "text/plain", 404)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}{self.PATH}"
+
+
+# 月を切り替えるたびに /api/calendar を取得し、見出しとセルをまとめて描き直す
+_COMPASS_PAGE = """<!DOCTYPE html>
+<html lang="ja"><head><meta charset="utf-8"><title>チケット購入 | コンパス</title></head>
+<body>
+<header><a href="/user/e/compass">コンパス</a></header>
+<div class="calendar" id="calendar"></div>
+<script>
+let current = "__MONTH__";
+function shift(month, n) {
+  const [y, m] = month.split("-").map(Number);
+  const d = new Date(y, m - 1 + n, 1);
+  return d.getFullYear() + "-" + String(d.getMonth() + 1).padStart(2, "0");
+}
+async function show(month) {
+  const data = await (await fetch("/api/calendar?month=" + month)).json();
+  const [y, m] = month.split("-").map(Number);
+  const cells = data.days.map(d => {
+    const day = Number(d.date.slice(8));
+    return d.remaining > 0
+      ? `<td data-date="${d.date}" class="day" onclick="location.href='/purchase?date=${d.date}'">` +
+        `<span>${day}</span><span>○</span><span>残り${d.remaining}</span></td>`
+      : `<td data-date="${d.date}" class="day soldout"><span>${day}</span><span>×</span></td>`;
+  }).join("");
+  document.getElementById("calendar").innerHTML =
+    `<div class="calendar-header"><button class="prev" onclick="go(-1)">‹</button>` +
+    `<h2>${y}年${m}月</h2><button class="next" onclick="go(1)">›</button></div>` +
+    `<table><tr>${cells}</tr></table>`;
+  current = month;
+}
+function go(n) { show(shift(current, n)); }
+show(current);
+</script>
+</body></html>
+"""
+
+
+def serve_reserve() -> int:
+    first = date.today() + timedelta(days=7)
+    available = [first.isoformat(), (first + timedelta(days=2)).isoformat()]
+    site = FakeReserveSite(available, full=[(first + timedelta(days=1)).isoformat()]).start()
+    print("偽の予約サイトを起動しました。別のターミナルの 200.Projects/Clinic で次のように実行してください:", file=sys.stderr)
+    print(
+        f"CLINIC_URL={site.url} CLINIC_PROXIES=direct AUTO_BOOK=dry-run "
+        f"BOOKING_PROFILE=../Compass/booking.example.json CHECK_DATE={available[0]} python clinic_main.py"
+    )
+    seen = 0
+    try:
+        while True:
+            time.sleep(0.5)
+            for booking in site.completed[seen:]:
+                print(f"[予約] {booking.get('date')} {booking.get('time')}（診察券番号 {booking.get('patient_no')}）")
+            seen = len(site.completed)
+    except KeyboardInterrupt:
+        pass
+    site.stop()
+    return 0
+
+
+def main() -> int:
+    if "--reserve" in sys.argv:
+        return serve_reserve()
+    fail = int(sys.argv[sys.argv.index("--fail") + 1]) if "--fail" in sys.argv else 0
+    line = FakeLineServer(statuses=[500] * fail).start()
+    smtp = FakeSmtpServer().start()
+    print("偽サーバーを起動しました。別のターミナルで次の環境変数を付けて実行してください:", file=sys.stderr)
+    print(
+        f"LINE_API_BASE={line.url} LINE_CHANNEL_ACCESS_TOKEN=test LINE_USER_ID=Utest "
+        f"SMTP_HOST=127.0.0.1 SMTP_PORT={smtp.port} SMTP_SSL=0 "
+        "GMAIL_USER=me@example.com GMAIL_APP_PASSWORD=test"
+    )
+    seen_line = seen_mail = 0
+    try:
+        while True:
+            time.sleep(0.5)
+            for req in line.requests[seen_line:]:
+                print(f"[LINE] {req['path']} -> {req['status']}: {json.dumps(req['body'], ensure_ascii=False)}")
+            for msg in smtp.messages[seen_mail:]:
+                print(f"[SMTP] {len(msg)} bytes（ログイン {smtp.logins} 回目まで）")
+            seen_line, seen_mail = len(line.requests), len(smtp.messages)
+    except KeyboardInterrupt:
+        pass
+    line.stop()
+    smtp.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
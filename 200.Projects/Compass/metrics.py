@@ -0,0 +1,314 @@
+"""
+チェック1回ごとの計測値（ステップごとの所要時間・ページ移動の回数・判定したセル数・転送量・通知の所要時間）と、
+bench_startup.py で測った起動時間、自動予約（booking.py）の所要時間を
+JSON Lines か Prometheus の textfile に書き出す。どちらも環境変数で指定したときだけ書く。
+
+| 環境変数 | 内容 |
+|---|---|
+| METRICS_FILE | 1行1レコードの JSON を追記するファイル（実行をまたいで p50 / p95 を出せる） |
+| METRICS_PROM | node_exporter の textfile collector 用ファイル（直近の値で毎回書き換える。別のプロセスが書いた値は残す） |
+| CHECK_PROFILE | cprofile / pyinstrument を指定すると、その実行をプロファイルする |
+| CHECK_PROFILE_OUT | プロファイルの保存先（既定 profile.prof / profile.html） |
+
+    python metrics.py summary metrics.jsonl   # サイト・ステップごとの p50 / p95
+"""
+
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from common import Result, log
+from timing import StepTimer
+
+
+RUN_ID = os.environ.get("GITHUB_RUN_ID", "").strip() or f"{os.getpid()}-{int(time.time())}"
+
+_lock = threading.Lock()
+# Prometheus の textfile に書く直近の値: (メトリクス名, ラベル) -> 値
+_gauges: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+# このプロセスが丸ごと書き直す系列 (メトリクス名, ラベル)。textfile にある同じ名前・ラベルの値は、前の実行の残りとして消す
+_owned: Set[Tuple[str, Tuple[str, str]]] = set()
+_HELP = {
+    "checker_run_seconds": "直近のチェックの所要時間（秒）",
+    "checker_step_seconds": "直近のチェックのステップ種類ごとの所要時間（秒）",
+    "checker_count": "直近のチェックの件数（navigations / cells / bytes / requests / blocked）",
+    "checker_available_dates": "直近のチェックで空きありだった日数",
+    "checker_last_run_timestamp_seconds": "直近のチェックの終了時刻（UNIX 時刻）",
+    "checker_notify_seconds": "直近の通知の所要時間（秒）",
+    "checker_notify_success": "直近の通知が成功したか（1 / 0）",
+    "checker_startup_seconds": "直近に測った起動時間（秒）",
+    "checker_booking_seconds": "直近の自動予約で、空きの判定から確認画面に着くまでの時間（秒）",
+    "checker_booking_success": "直近の自動予約が確認画面（submit なら確定）まで進めたか（1 / 0）",
+}
+
+
+def step_kind(label: str) -> str:
+    """「month 2026-03」のようなステップ名を種類（month）にまとめる。"""
+    return label.split(" ", 1)[0]
+
+
+def _write_jsonl(record: dict) -> None:
+    path = os.environ.get("METRICS_FILE", "").strip()
+    if not path:
+        return
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def _series(name: str, labels: Tuple[Tuple[str, str], ...]) -> str:
+    label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+    return f"{name}{{{label_text}}}"
+
+
+def _read_prom(path: str) -> Dict[str, str]:
+    """textfile の {系列（名前とラベル）: 値} 。コメント行は読み飛ばす。"""
+    samples: Dict[str, str] = {}
+    if not os.path.exists(path):
+        return samples
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                series, _, value = line.rpartition(" ")
+                samples[series] = value
+    return samples
+
+
+@contextmanager
+def _file_lock(path: str) -> Iterator[None]:
+    """同じ textfile に書く別のプロセス（compass / clinic の cron、watch、bench_startup.py）と順番に書く。"""
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(f"{path}.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _write_prom() -> None:
+    """
+    直近の値を textfile に書く。ファイルは複数のプロセスで共有するので、
+    書いてある値を読み、このプロセスが持つ値だけを置き換えて書き戻す（他のサイト・通知先の値は残す）。
+    """
+    path = os.environ.get("METRICS_PROM", "").strip()
+    if not path:
+        return
+    owned = [(name, f'{k}="{v}"') for name, (k, v) in _owned]
+    with _file_lock(path):
+        samples = {
+            series: value for series, value in _read_prom(path).items()
+            if not any(series.startswith(name + "{") and label in series for name, label in owned)
+        }
+        for (name, labels), value in _gauges.items():
+            samples[_series(name, labels)] = repr(float(value))
+        by_name: Dict[str, List[str]] = defaultdict(list)
+        for series, value in sorted(samples.items()):
+            by_name[series.split("{", 1)[0]].append(f"{series} {value}")
+        lines = []
+        for name, lines_of_name in by_name.items():
+            lines += [f"# HELP {name} {_HELP.get(name, name)}", f"# TYPE {name} gauge", *lines_of_name]
+        # collector が書きかけのファイルを読まないよう、別名で書いてから置き換える
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, path)
+
+
+def _set(name: str, value: float, **labels: str) -> None:
+    _gauges[(name, tuple(sorted(labels.items())))] = value
+
+
+def record_check(timer: StepTimer, results: Result) -> None:
+    """1サイト分のチェックの計測値を書き出す（engine.run_job の最後に呼ぶ）。"""
+    total_ms = timer.elapsed_ms()
+    available = sum(1 for r in results.values() if r.available)
+    record = {
+        "ts": datetime.now().isoformat(timespec="seconds"),
+        "run_id": RUN_ID,
+        "kind": "check",
+        "site": timer.name,
+        "total_ms": round(total_ms, 1),
+        "budget_ms": timer.budget_ms,
+        "over_budget": timer.over_budget(),
+        "steps": [[label, round(ms, 1)] for label, ms in timer.steps],
+        "counters": dict(timer.counters),
+        "dates": len(results),
+        "available": available,
+    }
+    by_kind: Dict[str, float] = defaultdict(float)
+    for label, ms in timer.steps:
+        by_kind[step_kind(label)] += ms
+    with _lock:
+        _write_jsonl(record)
+        site = timer.name
+        # 前回あって今回無いステップ・件数を残さない（前の実行が textfile に書いた分も）
+        for key in [k for k in _gauges if k[0] in ("checker_step_seconds", "checker_count") and ("site", site) in k[1]]:
+            del _gauges[key]
+        _owned.update({("checker_step_seconds", ("site", site)), ("checker_count", ("site", site))})
+        _set("checker_run_seconds", total_ms / 1000, site=site)
+        for kind, ms in by_kind.items():
+            _set("checker_step_seconds", ms / 1000, site=site, step=kind)
+        for counter, value in timer.counters.items():
+            _set("checker_count", value, site=site, counter=counter)
+        _set("checker_available_dates", available, site=site)
+        _set("checker_last_run_timestamp_seconds", time.time(), site=site)
+        _write_prom()
+
+
+def record_notify(channel: str, ok: bool, seconds: float) -> None:
+    """通知先1つ分の送信結果と所要時間を書き出す（notify.Dispatcher から呼ぶ）。"""
+    record = {
+        "ts": datetime.now().isoformat(timespec="seconds"),
+        "run_id": RUN_ID,
+        "kind": "notify",
+        "channel": channel,
+        "ok": ok,
+        "total_ms": round(seconds * 1000, 1),
+    }
+    with _lock:
+        _write_jsonl(record)
+        _set("checker_notify_seconds", seconds, channel=channel)
+        _set("checker_notify_success", int(ok), channel=channel)
+        _write_prom()
+
+
+def record_startup(scenario: str, seconds: float) -> None:
+    """起動時間を1回分書き出す（bench_startup.py から呼ぶ）。"""
+    record = {
+        "ts": datetime.now().isoformat(timespec="seconds"),
+        "run_id": RUN_ID,
+        "kind": "startup",
+        "scenario": scenario,
+        "python": sys.version.split()[0],
+        "total_ms": round(seconds * 1000, 1),
+    }
+    with _lock:
+        _write_jsonl(record)
+        _set("checker_startup_seconds", seconds, scenario=scenario)
+        _write_prom()
+
+
+def record_booking(site: str, mode: str, ok: bool, hold_seconds: Optional[float], total_seconds: float) -> None:
+    """
+    自動予約1回分の結果を書き出す（booking.run から呼ぶ）。
+    hold_seconds は空きの判定から確認画面に着くまで（着けなかったら None）、total_seconds は確定までを含めた時間。
+    """
+    record = {
+        "ts": datetime.now().isoformat(timespec="seconds"),
+        "run_id": RUN_ID,
+        "kind": "booking",
+        "site": site,
+        "mode": mode,
+        "ok": ok,
+        "hold_ms": round(hold_seconds * 1000, 1) if hold_seconds is not None else None,
+        "total_ms": round(total_seconds * 1000, 1),
+    }
+    with _lock:
+        _write_jsonl(record)
+        if hold_seconds is not None:
+            _set("checker_booking_seconds", hold_seconds, site=site, mode=mode)
+        _set("checker_booking_success", int(ok), site=site, mode=mode)
+        _write_prom()
+
+
+@contextmanager
+def profiled(name: str) -> Iterator[None]:
+    """CHECK_PROFILE=cprofile / pyinstrument のときだけ、ブロック内をプロファイルして保存する。"""
+    mode = os.environ.get("CHECK_PROFILE", "").strip().lower()
+    out = os.environ.get("CHECK_PROFILE_OUT", "").strip()
+    if mode == "cprofile":
+        import cProfile
+        import pstats
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            path = out or "profile.prof"
+            profiler.dump_stats(path)
+            log(f"[{name}] プロファイルを {path} に保存しました（上位 15 件）:")
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(15)
+        return
+    if mode == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            log("pyinstrument がインストールされていないので、プロファイルせずに続行します。")
+            yield
+            return
+        profiler = Profiler(async_mode="enabled")
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            path = out or "profile.html"
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+            log(f"[{name}] プロファイルを {path} に保存しました。")
+        return
+    yield
+
+
+def percentile(values: List[float], p: float) -> float:
+    """最近傍法のパーセンタイル（p は 0〜100）。"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summary(path: str) -> int:
+    """METRICS_FILE の JSON Lines から、サイト・ステップ・通知先・起動・予約ごとの p50 / p95 を出す。"""
+    series: Dict[str, List[float]] = defaultdict(list)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get("kind") == "check":
+                site = record["site"]
+                series[f"{site} 合計"].append(record["total_ms"])
+                by_kind: Dict[str, float] = defaultdict(float)
+                for label, ms in record["steps"]:
+                    by_kind[step_kind(label)] += ms
+                for kind, ms in by_kind.items():
+                    series[f"{site} {kind}"].append(ms)
+            elif record.get("kind") == "notify":
+                series[f"通知 {record['channel']}"].append(record["total_ms"])
+            elif record.get("kind") == "startup":
+                series[f"起動 {record['scenario']}"].append(record["total_ms"])
+            elif record.get("kind") == "booking" and record.get("hold_ms") is not None:
+                series[f"予約 {record['site']}"].append(record["hold_ms"])
+    if not series:
+        print("記録がありません。")
+        return 1
+    width = max(len(k) for k in series)
+    print(f"{'':{width}}  {'件数':>4}  {'p50':>8}  {'p95':>8}")
+    for key in sorted(series):
+        values = series[key]
+        print(f"{key:{width}}  {len(values):>4}  {percentile(values, 50) / 1000:>7.2f}s  {percentile(values, 95) / 1000:>7.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if not args or args[0] != "summary":
+        print("使い方: python metrics.py summary [metrics.jsonl]", file=sys.stderr)
+        sys.exit(2)
+    sys.exit(summary(args[1] if len(args) > 1 else os.environ.get("METRICS_FILE", "") or "metrics.jsonl"))
@@ -0,0 +1,398 @@
+"""
+LINE / Gmail への通知をまとめて送るディスパッチャ。
+
+- 設定されている通知先に並行して送る（LINE と Gmail が互いを待たない）
+- LINE は requests.Session を、Gmail は SMTP 接続（ログイン済み）を使い回す
+- 複数日の空きは1通にまとめ、LINE は1回の push で最大5メッセージまで送る
+- 通信エラー・5xx・429 は間隔を空けて数回まで再送し、失敗は理由つきでログに出す
+- requests / smtplib / email は、その通知先へ初めて送るときに読み込む（通知しない実行の起動を軽くする）
+- 大勢への同報は multicast で 500 人ずつ送り、同時送信数を max_concurrency 本に抑える。
+  429 を受けたら Retry-After の間、すべての送信スレッドが待つ
+
+接続先は環境変数で差し替えられるので、fake_servers.py のローカル偽サーバーで確認できる:
+LINE_API_BASE（既定 https://api.line.me）、SMTP_HOST / SMTP_PORT / SMTP_SSL（既定 smtp.gmail.com / 465 / 1）。
+SMTP_SSL=0 のときは STARTTLS で暗号化してからログインする（SMTP_STARTTLS=0 で平文のまま。手元の偽サーバー用）
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+from common import log
+from metrics import record_notify
+
+if TYPE_CHECKING:
+    import smtplib
+
+    import requests
+
+
+LINE_API_BASE = "https://api.line.me"
+LINE_MAX_MESSAGES_PER_PUSH = 5
+LINE_MAX_TEXT_LENGTH = 5000
+LINE_MAX_RECIPIENTS_PER_MULTICAST = 500
+
+
+def _env(name: str, default: str = "") -> str:
+    return os.environ.get(name, "").strip() or default
+
+
+def _env_int(name: str, default: int) -> int:
+    """整数の環境変数。不正な値ならログに出して default を使う。"""
+    value = _env(name)
+    try:
+        return int(value) if value else default
+    except ValueError:
+        log(f"{name}={value!r} は整数ではないので、{default} を使います。")
+        return default
+
+
+def pack_texts(lines: List[str], limit: int = LINE_MAX_TEXT_LENGTH) -> List[str]:
+    """行のリストを、1通 limit 文字以内のテキストに詰めて分ける。"""
+    texts: List[str] = []
+    current = ""
+    for line in lines:
+        while len(line) > limit:
+            if current:
+                texts.append(current)
+                current = ""
+            texts.append(line[:limit])
+            line = line[limit:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit:
+            texts.append(current)
+            current = line
+        else:
+            current = candidate
+    if current:
+        texts.append(current)
+    return texts
+
+
+def retry(
+    send: Callable[[], "requests.Response"],
+    attempts: int = 3,
+    backoff: float = 0.5,
+    sleep: Callable[[float], None] = time.sleep,
+) -> "requests.Response":
+    """
+    send() を最大 attempts 回試す。通信エラー・5xx・429 のときは backoff × 2^n 秒
+    （429 で Retry-After があればその秒数）待って再送する。それ以外の応答はそのまま返す。
+    """
+    import requests
+
+    for attempt in range(attempts):
+        last = attempt == attempts - 1
+        try:
+            r = send()
+        except requests.RequestException:
+            if last:
+                raise
+            sleep(backoff * 2 ** attempt)
+            continue
+        if r.status_code == 429 or r.status_code >= 500:
+            if last:
+                return r
+            retry_after = r.headers.get("Retry-After", "")
+            sleep(float(retry_after) if retry_after.isdigit() else backoff * 2 ** attempt)
+            continue
+        return r
+    raise AssertionError("unreachable")
+
+
+def _timed(channel: str, send: Callable[[], bool]) -> bool:
+    """send() の成否と所要時間を metrics に記録する。"""
+    started = time.monotonic()
+    ok = send()
+    record_notify(channel, ok, time.monotonic() - started)
+    return ok
+
+
+class Dispatcher:
+    """通知先ごとの接続を保持し、同じ内容を全通知先へ並行して送る。"""
+
+    def __init__(
+        self,
+        line_token: str = "",
+        line_to: str = "",
+        gmail_user: str = "",
+        gmail_password: str = "",
+        mail_to: str = "",
+        line_api_base: str = LINE_API_BASE,
+        smtp_host: str = "smtp.gmail.com",
+        smtp_port: int = 465,
+        smtp_ssl: bool = True,
+        smtp_starttls: bool = True,
+        attempts: int = 3,
+        backoff: float = 0.5,
+        timeout: float = 10,
+        max_concurrency: int = 4,
+    ):
+        self.line_token = line_token
+        self.line_to = line_to
+        self.gmail_user = gmail_user
+        self.gmail_password = gmail_password
+        self.mail_to = mail_to or gmail_user
+        self.line_api_base = line_api_base.rstrip("/")
+        self.smtp_host = smtp_host
+        self.smtp_port = smtp_port
+        self.smtp_ssl = smtp_ssl
+        self.smtp_starttls = smtp_starttls
+        self.attempts = attempts
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_concurrency = max(1, max_concurrency)
+        self._session: Optional["requests.Session"] = None
+        self._session_lock = threading.Lock()
+        self._pause_until = 0.0
+        self._pause_lock = threading.Lock()
+        self._smtp: Optional["smtplib.SMTP"] = None
+        self._smtp_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "Dispatcher":
+        return cls(
+            line_token=_env("LINE_CHANNEL_ACCESS_TOKEN"),
+            line_to=_env("LINE_USER_ID"),
+            gmail_user=_env("GMAIL_USER"),
+            gmail_password=_env("GMAIL_APP_PASSWORD"),
+            mail_to=_env("NOTIFY_EMAIL"),
+            line_api_base=_env("LINE_API_BASE", LINE_API_BASE),
+            smtp_host=_env("SMTP_HOST", "smtp.gmail.com"),
+            smtp_port=_env_int("SMTP_PORT", 465),
+            smtp_ssl=_env("SMTP_SSL", "1").lower() in ("1", "true", "yes"),
+            smtp_starttls=_env("SMTP_STARTTLS", "1").lower() in ("1", "true", "yes"),
+            max_concurrency=_env_int("LINE_MAX_CONCURRENCY", 4),
+        )
+
+    @property
+    def line_enabled(self) -> bool:
+        return bool(self.line_token and self.line_to)
+
+    @property
+    def mail_enabled(self) -> bool:
+        return bool(self.gmail_user and self.gmail_password and self.mail_to)
+
+    # --- LINE ---
+
+    @property
+    def session(self) -> "requests.Session":
+        """LINE へ初めて送るときに作る、同時送信数ぶんの接続を持つセッション。"""
+        with self._session_lock:
+            if self._session is None:
+                import requests
+
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.max_concurrency)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+            return self._session
+
+    def _wait_rate_limit(self) -> None:
+        with self._pause_lock:
+            wait = self._pause_until - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+    def _line_post(self, path: str, payload: dict) -> "requests.Response":
+        def send() -> "requests.Response":
+            self._wait_rate_limit()
+            r = self.session.post(
+                f"{self.line_api_base}{path}",
+                headers={"Authorization": f"Bearer {self.line_token}"},
+                json=payload,
+                timeout=self.timeout,
+            )
+            if r.status_code == 429:
+                # 他のスレッドも Retry-After の間は送らないようにする
+                retry_after = r.headers.get("Retry-After", "")
+                pause = float(retry_after) if retry_after.isdigit() else self.backoff
+                with self._pause_lock:
+                    self._pause_until = max(self._pause_until, time.monotonic() + pause)
+            return r
+
+        return retry(send, attempts=self.attempts, backoff=self.backoff)
+
+    def send_line(self, texts: List[str], to: Optional[str] = None) -> bool:
+        """
+        テキストを1回の push あたり最大5メッセージにまとめて送る。
+        通信エラーも 5xx・429 と同じく間隔を空けて再送し、それでも届かなければ残りの push は続けて False を返す。
+        """
+        import requests
+
+        messages = [{"type": "text", "text": t} for t in texts]
+        ok = True
+        for i in range(0, len(messages), LINE_MAX_MESSAGES_PER_PUSH):
+            payload = {"to": to or self.line_to, "messages": messages[i:i + LINE_MAX_MESSAGES_PER_PUSH]}
+            try:
+                r = self._line_post("/v2/bot/message/push", payload)
+            except requests.RequestException as e:
+                log(f"LINE の送信に失敗しました（{self.attempts} 回試しました）: {e}")
+                ok = False
+                continue
+            if r.status_code != 200:
+                log(f"LINE の送信に失敗しました: HTTP {r.status_code} {r.text[:200]}")
+                ok = False
+        return ok
+
+    def reply(self, reply_token: str, texts: List[str]) -> bool:
+        """Webhook で受けたメッセージに返信する（reply token は1回だけ・最大5メッセージ）。"""
+        import requests
+
+        messages = [{"type": "text", "text": t} for t in texts[:LINE_MAX_MESSAGES_PER_PUSH]]
+        try:
+            r = self._line_post("/v2/bot/message/reply", {"replyToken": reply_token, "messages": messages})
+        except requests.RequestException as e:
+            log(f"LINE の返信に失敗しました: {e}")
+            return False
+        if r.status_code != 200:
+            log(f"LINE の返信に失敗しました: HTTP {r.status_code} {r.text[:200]}")
+            return False
+        return True
+
+    def _multicast_once(self, user_ids: List[str], messages: List[dict]) -> bool:
+        import requests
+
+        try:
+            r = self._line_post("/v2/bot/message/multicast", {"to": user_ids, "messages": messages})
+        except requests.RequestException as e:
+            log(f"LINE の一斉送信に失敗しました（{len(user_ids)} 人）: {e}")
+            return False
+        if r.status_code != 200:
+            log(f"LINE の一斉送信に失敗しました（{len(user_ids)} 人）: HTTP {r.status_code} {r.text[:200]}")
+            return False
+        return True
+
+    def multicast(self, user_ids: List[str], texts: List[str]) -> Dict[str, bool]:
+        """
+        user_ids 全員に同じテキストを送る。500 人 × 5 メッセージずつの呼び出しに分け、
+        最大 max_concurrency 本を並行して送る。戻り値: {user_id: 成否}
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        messages = [{"type": "text", "text": t} for t in texts]
+        calls = [
+            (user_ids[i:i + LINE_MAX_RECIPIENTS_PER_MULTICAST], messages[j:j + LINE_MAX_MESSAGES_PER_PUSH])
+            for i in range(0, len(user_ids), LINE_MAX_RECIPIENTS_PER_MULTICAST)
+            for j in range(0, len(messages), LINE_MAX_MESSAGES_PER_PUSH)
+        ]
+        result = {u: True for u in user_ids}
+        if not calls or not self.line_token:
+            return {u: False for u in user_ids}
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(calls))) as pool:
+            futures = [(ids, pool.submit(self._multicast_once, ids, msgs)) for ids, msgs in calls]
+            for ids, future in futures:
+                if not future.result():
+                    for u in ids:
+                        result[u] = False
+        record_notify("line_multicast", all(result.values()), time.monotonic() - started)
+        return result
+
+    # --- Gmail ---
+
+    def _connect_smtp(self) -> "smtplib.SMTP":
+        import smtplib
+
+        if self.smtp_ssl:
+            smtp = smtplib.SMTP_SSL(self.smtp_host, self.smtp_port, timeout=self.timeout)
+        else:
+            smtp = smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=self.timeout)
+            if self.smtp_starttls:
+                # パスワードを平文で送らないよう、ログインの前に暗号化する（STARTTLS が使えなければ送らない）
+                try:
+                    smtp.starttls()
+                except Exception:
+                    smtp.close()
+                    raise
+        smtp.login(self.gmail_user, self.gmail_password)
+        return smtp
+
+    def send_mail(self, subject: str, body: str) -> bool:
+        """ログイン済みの SMTP 接続を使い回して送る。切れていたら接続し直して再送する。"""
+        import smtplib
+        from email.mime.text import MIMEText
+        from email.utils import formatdate
+
+        msg = MIMEText(body, "plain", "utf-8")
+        msg["Subject"] = subject
+        msg["From"] = self.gmail_user
+        msg["To"] = self.mail_to
+        msg["Date"] = formatdate(localtime=True)
+        with self._smtp_lock:
+            for attempt in range(self.attempts):
+                try:
+                    if self._smtp is None:
+                        self._smtp = self._connect_smtp()
+                    self._smtp.sendmail(self.gmail_user, [self.mail_to], msg.as_string())
+                    return True
+                except smtplib.SMTPAuthenticationError as e:
+                    log(f"Gmail のログインに失敗しました: {e}")
+                    return False
+                except (smtplib.SMTPException, OSError) as e:
+                    self._close_smtp()
+                    if attempt == self.attempts - 1:
+                        log(f"Gmail の送信に失敗しました: {e}")
+                        return False
+                    time.sleep(self.backoff * 2 ** attempt)
+        return False
+
+    def _close_smtp(self) -> None:
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+    # --- まとめて送る ---
+
+    def dispatch(self, title: str, details: List[str], footer: str = "") -> Dict[str, bool]:
+        """
+        details（空きのあった日ごとの説明）を1通にまとめ、設定済みの通知先へ並行して送る。
+        戻り値: {"line": 成否, "gmail": 成否}（設定されていない通知先は含まない）
+        """
+        lines = [title, *details] + ([footer] if footer else [])
+        jobs = {}
+        if self.line_enabled:
+            jobs["line"] = lambda: self.send_line(pack_texts(lines))
+        if self.mail_enabled:
+            subject = f"{title.strip('【】')}: {details[0] if details else ''}"
+            if len(details) > 1:
+                subject += f" ほか{len(details) - 1}件"
+            jobs["gmail"] = lambda: self.send_mail(subject, "\n".join(lines))
+        if not jobs:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+            futures = {name: pool.submit(_timed, name, job) for name, job in jobs.items()}
+            return {name: f.result() for name, f in futures.items()}
+
+    def close(self) -> None:
+        self._close_smtp()
+        if self._session is not None:
+            self._session.close()
+
+
+_shared: Optional[Dispatcher] = None
+_shared_lock = threading.Lock()
+
+
+def get_dispatcher() -> Dispatcher:
+    """プロセス内で共有するディスパッチャ（常駐モードでも接続を使い回す）。"""
+    global _shared
+    with _shared_lock:
+        # 通知はスレッド（asyncio.to_thread や server のリクエスト）から呼ばれるので、作るのは1つだけにする
+        if _shared is None:
+            _shared = Dispatcher.from_env()
+        return _shared
+
+
+def close_dispatcher() -> None:
+    """共有のディスパッチャの接続（SMTP は QUIT する）を閉じる。engine / watcher が終わるときに呼ぶ。"""
+    global _shared
+    with _shared_lock:
+        if _shared is not None:
+            _shared.close()
+            _shared = None
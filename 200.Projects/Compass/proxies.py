@@ -0,0 +1,212 @@
+"""
+プロキシの候補をまとめて管理し、速くて生きているものから順に使うためのプール。
+
+- 候補は環境変数 <SITE>_PROXIES（カンマ区切り、例: CLINIC_PROXIES）か、
+  PROXY_CONFIG（既定 proxies.json）の {"clinic": ["http://...", ...]} から読む。<SITE>_PROXIES=direct ならプロキシを使わない
+- 候補へ HEAD リクエストを並行して送り（プローブ）、応答時間と成否をスコアとして state.db に残す
+- スコアは応答時間の移動平均を成功率で割ったもの（小さいほど良い）。実際のチェックの成否も反映する
+- PROXY_PROBE_TTL 秒（既定 300）以内にプローブした候補は、前回の結果を使う
+
+    python proxies.py clinic   # 候補をプローブして、スコアの良い順に表示する
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from common import log
+from state import DEFAULT_PATH
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS proxy_scores (
+    site TEXT NOT NULL,
+    proxy TEXT NOT NULL,
+    latency_ms REAL,
+    successes REAL NOT NULL,
+    failures REAL NOT NULL,
+    healthy INTEGER NOT NULL,
+    checked_at REAL NOT NULL,
+    PRIMARY KEY (site, proxy)
+) WITHOUT ROWID;
+"""
+
+PROBE_TIMEOUT = 5.0
+PROBE_TTL = 300.0
+LATENCY_ALPHA = 0.3  # 応答時間の移動平均で、新しい値に置く重み
+DECAY = 0.8  # 記録のたびに過去の成功・失敗の回数に掛ける（最近の様子を重く見る）
+
+
+def load_candidates(site: str, default: Optional[List[str]] = None) -> List[str]:
+    """site のプロキシ候補。環境変数 → 設定ファイル → default の順に探す。"""
+    env = os.environ.get(f"{site.upper()}_PROXIES", "").strip()
+    if env:
+        candidates = [p.strip() for p in env.split(",")]
+    else:
+        path = os.environ.get("PROXY_CONFIG", "").strip() or "proxies.json"
+        candidates = []
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                candidates = json.load(f).get(site, [])
+    return list(dict.fromkeys(p for p in candidates if p)) or list(default or [])
+
+
+def probe_ttl_from_env(default: float = PROBE_TTL) -> float:
+    try:
+        return float(os.environ.get("PROXY_PROBE_TTL", "").strip() or default)
+    except ValueError:
+        return default
+
+
+class ProxyScore:
+    """1つのプロキシの成績。"""
+
+    def __init__(self, proxy: str, latency_ms: Optional[float], successes: float, failures: float, healthy: bool, checked_at: float):
+        self.proxy = proxy
+        self.latency_ms = latency_ms
+        self.successes = successes
+        self.failures = failures
+        self.healthy = healthy
+        self.checked_at = checked_at
+
+    def success_rate(self) -> float:
+        # 記録が無いうちは 1/2 から始める
+        return (self.successes + 1) / (self.successes + self.failures + 2)
+
+    def score(self) -> float:
+        latency = self.latency_ms if self.latency_ms is not None else PROBE_TIMEOUT * 1000
+        return latency / self.success_rate()
+
+
+class ProxyPool:
+    """site のプロキシ候補と、その成績（state.db の proxy_scores）。スレッドをまたいで使える。"""
+
+    def __init__(
+        self,
+        site: str,
+        candidates: List[str],
+        probe_url: str,
+        path: Optional[str] = None,
+        probe_timeout: float = PROBE_TIMEOUT,
+        probe_ttl: Optional[float] = None,
+    ):
+        self.site = site
+        self.candidates = list(candidates)
+        self.probe_url = probe_url
+        self.probe_timeout = probe_timeout
+        self.probe_ttl = probe_ttl_from_env() if probe_ttl is None else probe_ttl
+        self.path = path or os.environ.get("STATE_DB", "").strip() or DEFAULT_PATH
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+
+    def scores(self) -> Dict[str, ProxyScore]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT proxy, latency_ms, successes, failures, healthy, checked_at FROM proxy_scores WHERE site = ?",
+                (self.site,),
+            ).fetchall()
+        return {row[0]: ProxyScore(row[0], row[1], row[2], row[3], bool(row[4]), row[5]) for row in rows}
+
+    def record(self, proxy: str, ok: bool, latency_ms: Optional[float] = None) -> None:
+        """プローブか実際のチェックの結果を1回分反映する。latency_ms は成功したプローブのときだけ渡す。"""
+        previous = self.scores().get(proxy)
+        successes = previous.successes * DECAY if previous else 0.0
+        failures = previous.failures * DECAY if previous else 0.0
+        latency = previous.latency_ms if previous else None
+        if ok:
+            successes += 1
+            if latency_ms is not None:
+                latency = latency_ms if latency is None else latency + LATENCY_ALPHA * (latency_ms - latency)
+        else:
+            failures += 1
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO proxy_scores (site, proxy, latency_ms, successes, failures, healthy, checked_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (site, proxy) DO UPDATE SET latency_ms = excluded.latency_ms,"
+                " successes = excluded.successes, failures = excluded.failures,"
+                " healthy = excluded.healthy, checked_at = excluded.checked_at",
+                (self.site, proxy, latency, successes, failures, int(ok), time.time()),
+            )
+
+    def probe_one(self, proxy: str) -> Tuple[bool, float, str]:
+        """proxy 経由で probe_url に HEAD を送る。戻り値: (使えそうか, 応答時間ミリ秒, 説明)"""
+        import requests
+
+        started = time.monotonic()
+        try:
+            r = requests.head(
+                self.probe_url,
+                proxies={"http": proxy, "https": proxy},
+                timeout=self.probe_timeout,
+                allow_redirects=False,
+            )
+        except requests.RequestException as e:
+            return False, (time.monotonic() - started) * 1000, type(e).__name__
+        elapsed = (time.monotonic() - started) * 1000
+        # 5xx はプロキシ自身のエラー（502 / 503 など）、407 は認証が要るので使えない
+        ok = r.status_code < 500 and r.status_code != 407
+        return ok, elapsed, f"HTTP {r.status_code}"
+
+    def probe(self, force: bool = False) -> None:
+        """PROBE_TTL 以内に調べていない候補へ、並行して HEAD を送って成績を更新する。"""
+        scores = self.scores()
+        now = time.time()
+        stale = [
+            p for p in self.candidates
+            if force or p not in scores or now - scores[p].checked_at >= self.probe_ttl
+        ]
+        if not stale:
+            return
+        with ThreadPoolExecutor(max_workers=min(8, len(stale))) as pool:
+            outcomes = list(zip(stale, pool.map(self.probe_one, stale)))
+        for proxy, (ok, elapsed, detail) in outcomes:
+            self.record(proxy, ok, elapsed if ok else None)
+            log(f"[{self.site}] プロキシ {proxy}: {'OK' if ok else 'NG'} {elapsed:.0f}ms（{detail}）")
+
+    def ranked(self) -> List[str]:
+        """使う順の候補。直近で生きていたものをスコアの良い順に、その後ろに残りを並べる。"""
+        self.probe()
+        scores = self.scores()
+
+        def key(proxy: str):
+            score = scores.get(proxy)
+            if score is None:
+                return (1, float("inf"))
+            return (0 if score.healthy else 1, score.score())
+
+        return sorted(self.candidates, key=key)
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def main() -> int:
+    from sites import SITES
+
+    if len(sys.argv) < 2 or sys.argv[1] not in SITES:
+        print(f"使い方: python proxies.py {{{' | '.join(SITES)}}}", file=sys.stderr)
+        return 2
+    site = SITES[sys.argv[1]]()
+    pool = site.proxy_pool()
+    if pool is None:
+        print(f"{site.name} はプロキシを使いません。")
+        return 0
+    pool.probe(force=True)
+    scores = pool.scores()
+    for proxy in pool.ranked():
+        s = scores[proxy]
+        latency = f"{s.latency_ms:.0f}ms" if s.latency_ms is not None else "-"
+        print(f"{'OK' if s.healthy else 'NG'}  {proxy:<32}  平均 {latency:>7}  成功率 {s.success_rate():.0%}  スコア {s.score():.0f}")
+    pool.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
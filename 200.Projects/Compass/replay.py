@@ -0,0 +1,185 @@
+"""
+サイトとの通信を HAR に記録し、ネットワークなしで同じチェックを再生するためのモジュール。
+
+- 記録: CHECK_RECORD_HAR=ディレクトリ を付けて実行すると、{site}.har に通信を、{site}.json に
+  対象日と判定結果（再生時の正解）を保存する。判定に使ったカレンダーの HTML も同じ場所に保存する
+- 再生: CHECK_REPLAY_HAR=ディレクトリ を付けると、ページの通信をすべて {site}.har から返し
+  （HAR に無いリクエストは中断する）、ページ内の時計も記録した時刻に固定する
+- どちらのときも API やスナップショットのキャッシュは使わず、ブラウザでの確認の経路を必ず通す
+
+    python replay.py record compass 2026-03-07,2026-03-14   # captures/ に記録する（ネットワークが必要）
+    python replay.py record clinic 2026-03-05 captures
+    python replay.py bench                                  # captures/ を再生して、日付ごとの正誤と所要時間を出す
+    python replay.py bench captures --runs 10
+
+{site}.json の expected を手で直せば、記録時の判定が誤っていた日付も正解として使える。
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from common import Result
+
+
+CAPTURE_DIR = "captures"
+
+
+def record_dir() -> Optional[str]:
+    return os.environ.get("CHECK_RECORD_HAR", "").strip() or None
+
+
+def replay_dir() -> Optional[str]:
+    return os.environ.get("CHECK_REPLAY_HAR", "").strip() or None
+
+
+def active() -> bool:
+    """記録中か再生中か（どちらもブラウザでの確認の経路だけを使う）。"""
+    return bool(record_dir() or replay_dir())
+
+
+def har_path(directory: str, site: str) -> str:
+    return os.path.join(directory, f"{site}.har")
+
+
+def meta_path(directory: str, site: str) -> str:
+    return os.path.join(directory, f"{site}.json")
+
+
+def load_meta(directory: str, site: str) -> dict:
+    with open(meta_path(directory, site), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def context_options(site: str) -> dict:
+    """記録中なら、ブラウザコンテキストの通信を HAR に書き出す設定。"""
+    directory = record_dir()
+    if not directory:
+        return {}
+    os.makedirs(directory, exist_ok=True)
+    return {"record_har_path": har_path(directory, site), "record_har_mode": "full"}
+
+
+async def prepare(context, site: str) -> None:
+    """再生中なら、コンテキストの通信を HAR から返すようにし、時計を記録した時刻に合わせる。"""
+    directory = replay_dir()
+    if not directory:
+        return
+    await context.route_from_har(har_path(directory, site), not_found="abort")
+    recorded_at = load_meta(directory, site).get("recorded_at")
+    if recorded_at:
+        # カレンダーが「今月」を基準に表示を決めても、記録したときと同じ月になるようにする
+        await context.clock.set_fixed_time(datetime.fromisoformat(recorded_at))
+
+
+def save_meta(site: str, dates: List[str], results: Result) -> None:
+    """記録中なら、対象日と判定結果を {site}.json に保存する（HAR と同じ時点の正解）。"""
+    directory = record_dir()
+    if not directory:
+        return
+    meta = {
+        "site": site,
+        "recorded_at": datetime.now().isoformat(timespec="seconds"),
+        "dates": sorted(dates),
+        "expected": {d: {"available": r.available, "detail": r.detail} for d, r in sorted(results.items())},
+    }
+    with open(meta_path(directory, site), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+def record(site_name: str, dates: List[str], directory: str) -> int:
+    os.environ["CHECK_RECORD_HAR"] = directory
+    os.environ.setdefault("CHECK_SAVE_HTML", directory)
+    from engine import check_site
+    from sites import SITES
+
+    results = check_site(SITES[site_name](), dates)
+    for d in sorted(results):
+        print(f"[{site_name}] {results[d].detail}")
+    print(f"{har_path(directory, site_name)} と {meta_path(directory, site_name)} に記録しました。")
+    return 0
+
+
+async def _replay(site_names: List[str], metas: Dict[str, dict], runs: int) -> Dict[str, List[Tuple[float, Result]]]:
+    """サイトごとに runs 回再生して [(所要秒, 結果)] を返す。Chromium は最初の1回だけ起動する。"""
+    from engine import Job, Pages, run_job
+    from sites import SITES
+
+    outcomes: Dict[str, List[Tuple[float, Result]]] = {name: [] for name in site_names}
+    pages = Pages()
+    try:
+        for name in site_names:
+            for _ in range(runs):
+                started = time.perf_counter()
+                results = await run_job(pages, Job(SITES[name](), metas[name]["dates"]))
+                outcomes[name].append((time.perf_counter() - started, results))
+    finally:
+        await pages.close()
+    return outcomes
+
+
+def bench(directory: str, runs: int) -> int:
+    """directory の記録をすべて再生し、日付ごとの正誤と所要時間の p50 / p95 を出す。"""
+    site_names = sorted(f[:-len(".har")] for f in os.listdir(directory) if f.endswith(".har") and os.path.exists(meta_path(directory, f[:-len(".har")])))
+    if not site_names:
+        print(f"{directory} に記録（{{site}}.har と {{site}}.json）がありません。", file=sys.stderr)
+        return 2
+    # 再生は必ずブラウザの経路を通し、手元の state.db やキャッシュを汚さない
+    os.environ.pop("CHECK_RECORD_HAR", None)
+    os.environ["CHECK_REPLAY_HAR"] = directory
+    os.environ["CALENDAR_CACHE_TTL"] = "0"
+    os.environ["STATE_DB"] = os.path.join(tempfile.mkdtemp(prefix="replay-"), "state.db")
+    from metrics import percentile
+
+    metas = {name: load_meta(directory, name) for name in site_names}
+    outcomes = asyncio.run(_replay(site_names, metas, runs))
+
+    failed = 0
+    for name in site_names:
+        expected = metas[name]["expected"]
+        for d in metas[name]["dates"]:
+            want = expected.get(d)
+            got = [results.get(d) for _, results in outcomes[name]]
+            wrong = [g for g in got if want is None or g is None or (g.available, g.detail) != (want["available"], want["detail"])]
+            if wrong:
+                failed += 1
+                print(f"[{name}] {d}  NG（{len(wrong)}/{len(got)} 回）")
+                print(f"    期待: {want['detail'] if want else '（正解なし）'}")
+                print(f"    実際: {wrong[0].detail if wrong[0] else '（結果なし）'}")
+            else:
+                print(f"[{name}] {d}  OK  {want['detail']}")
+        seconds = [s for s, _ in outcomes[name]]
+        # 1回目は Chromium の起動や初回の読み込みを含むので分けて出す
+        warm = seconds[1:] or seconds
+        print(
+            f"[{name}] {len(seconds)} 回再生: 1回目 {seconds[0] * 1000:.0f}ms / "
+            f"p50 {percentile(warm, 50) * 1000:.0f}ms / p95 {percentile(warm, 95) * 1000:.0f}ms"
+        )
+    total = sum(len(metas[name]["dates"]) for name in site_names)
+    print(f"正解 {total - failed}/{total} 日")
+    return 1 if failed else 0
+
+
+def main() -> int:
+    args = sys.argv[1:]
+    if len(args) >= 3 and args[0] == "record":
+        from common import parse_dates
+
+        return record(args[1], parse_dates(args[2]), args[3] if len(args) > 3 else CAPTURE_DIR)
+    if args and args[0] == "bench":
+        rest = [a for a in args[1:] if not a.startswith("--")]
+        runs = int(args[args.index("--runs") + 1]) if "--runs" in args else 5
+        if "--runs" in args:
+            rest.remove(args[args.index("--runs") + 1])
+        return bench(rest[0] if rest else CAPTURE_DIR, runs)
+    print("使い方: python replay.py record サイト 日付 [ディレクトリ] / python replay.py bench [ディレクトリ] [--runs N]", file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+"""
+空きが出やすい時間帯にチェックを集め、それ以外の時間は間隔を空ける適応型のスケジューラ。
+
+- state.db に残った「空きに変わった時刻」から、1日のうち空きが出やすい時間帯（15分刻み）を学ぶ
+  （新しい記録ほど重く、前後の枠にも少し広げる）
+- 対象日が近いほど（キャンセルが出やすいので）1日に使うチェック回数を増やし、遠ければ減らす
+- 1日のチェック回数は daily_budget × その日の割合（urgency）回を超えない。使い切ったら翌日0時まで待つ
+- どの時間帯も max_interval 秒に1回は確認する。ただし予算が少ないときは、その分に予算の半分（FLOOR_SHARE）までしか
+  使わず、間隔を max_interval より空けてでも残りを空きが出やすい時間帯に回す
+- 時計（now / sleep）を差し替えられるので、SimulatedClock で何日分でも一瞬で試せる
+
+常駐モードでは watch.json に "schedule": "adaptive" を書くと interval の代わりに使う。
+cron などで頻繁に起動する場合は CHECK_SCHEDULE=adaptive を付けると、まだ時間でない回は何もせずに終わる。
+
+    python scheduler.py                  # 今の学習結果で明日までの1日をシミュレーションする
+    python scheduler.py --days 3 --budget 144
+"""
+
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+
+from common import get_check_dates
+from state import StateStore
+
+
+BUCKET_MINUTES = 15
+BUCKETS = 24 * 60 // BUCKET_MINUTES
+BUCKET_SECONDS = BUCKET_MINUTES * 60
+LEARN_DAYS = 60
+DEFAULT_DAILY_BUDGET = 96
+# 学んだ重みに関係なく全部の時間帯へ薄く配る（max_interval を守る）のに使うのは、予算のこの割合まで
+FLOOR_SHARE = 0.5
+
+
+class SystemClock:
+    def now(self) -> datetime:
+        return datetime.now()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+
+class SimulatedClock:
+    """sleep すると時刻だけが進む時計（試験・シミュレーション用）。"""
+
+    def __init__(self, start: datetime):
+        self.current = start
+
+    def now(self) -> datetime:
+        return self.current
+
+    def sleep(self, seconds: float) -> None:
+        self.current += timedelta(seconds=seconds)
+
+
+def bucket_of(t: datetime) -> int:
+    return (t.hour * 60 + t.minute) // BUCKET_MINUTES
+
+
+def _midnight_after(t: datetime) -> datetime:
+    return datetime.combine(t.date() + timedelta(days=1), datetime.min.time())
+
+
+def learn_windows(events: List[datetime], now: datetime, half_life_days: float = 14.0) -> List[float]:
+    """
+    空きに変わった時刻の一覧から、時間帯ごとの重み（BUCKETS 個）を作る。
+    half_life_days 日前の記録は重み半分。前後の枠にも半分ずつ広げる。
+    """
+    weights = [0.0] * BUCKETS
+    for t in events:
+        age_days = max(0.0, (now - t).total_seconds() / 86400)
+        w = 0.5 ** (age_days / half_life_days)
+        b = bucket_of(t)
+        weights[b] += w
+        weights[(b - 1) % BUCKETS] += w / 2
+        weights[(b + 1) % BUCKETS] += w / 2
+    return weights
+
+
+class AdaptiveScheduler:
+    """次のチェックまでの待ち時間を決める。learn() で学んだ時間帯ほど短く、1日の回数は予算まで。"""
+
+    def __init__(
+        self,
+        daily_budget: int = DEFAULT_DAILY_BUDGET,
+        min_interval: float = 30,
+        max_interval: float = 3600,
+        hot_gain: float = 8.0,
+        half_life_days: float = 14.0,
+    ):
+        self.daily_budget = daily_budget
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.hot_gain = hot_gain
+        self.half_life_days = half_life_days
+        self.weights = [0.0] * BUCKETS
+
+    @classmethod
+    def from_config(cls, config: dict) -> "AdaptiveScheduler":
+        return cls(
+            daily_budget=int(config.get("daily_budget", DEFAULT_DAILY_BUDGET)),
+            min_interval=float(config.get("min_interval", 30)),
+            max_interval=float(config.get("max_interval", 3600)),
+        )
+
+    def learn(self, events: List[datetime], now: datetime) -> None:
+        self.weights = learn_windows(events, now, self.half_life_days)
+
+    def urgency(self, now: datetime, target_dates: List[str]) -> float:
+        """1日の予算のうち今日使う割合。対象日が3日以内なら全部、7日以内なら 3/4、それより先なら半分。"""
+        today = now.date()
+        ahead = [(date.fromisoformat(d) - today).days for d in target_dates]
+        ahead = [n for n in ahead if n >= 0]
+        if not ahead:
+            return 0.5
+        nearest = min(ahead)
+        if nearest <= 3:
+            return 1.0
+        if nearest <= 7:
+            return 0.75
+        return 0.5
+
+    def budget(self, now: datetime, target_dates: List[str]) -> float:
+        """今日使うチェック回数（daily_budget × urgency）。"""
+        return self.daily_budget * self.urgency(now, target_dates)
+
+    def _allocate(self, budget: float, scores: List[float]) -> List[float]:
+        """budget 回を scores に比例して割り振った、枠ごとのチェック間隔（秒）。"""
+        total = sum(scores)
+        checks = [budget * score / total for score in scores]
+        # 各枠の最低回数（max_interval に1回）。全部の枠の合計が予算の FLOOR_SHARE を超えるなら、そこまで減らす
+        floor = min(BUCKET_SECONDS / self.max_interval, budget * FLOOR_SHARE / len(scores)) if scores else 0.0
+        longest = BUCKET_SECONDS / floor if floor > 0 else float("inf")
+        # 最低回数に足りない枠へ回す分は、多めに割り振った枠から差し引いて予算内に収める
+        deficit = sum(floor - c for c in checks if c < floor)
+        surplus = sum(c - floor for c in checks if c > floor)
+        if deficit > 0 and surplus > 0:
+            keep = max(0.0, surplus - deficit) / surplus
+            checks = [floor + (c - floor) * keep if c > floor else floor for c in checks]
+        return [min(longest, max(self.min_interval, BUCKET_SECONDS / c if c > 0 else longest)) for c in checks]
+
+    def plan(self, now: datetime, target_dates: List[str], runs_today: int = 0) -> List[float]:
+        """
+        時間帯ごとのチェック間隔（秒）。今日の残りの予算を、残りの時間帯に学んだ重みの比で割り振る。
+        （今より前の時間帯は、明日の分として1日分の予算で計算する）
+        """
+        budget = self.budget(now, target_dates)
+        peak = max(self.weights)
+        scores = [1.0 + (self.hot_gain * w / peak if peak > 0 else 0.0) for w in self.weights]
+        current = bucket_of(now)
+        tomorrow = self._allocate(budget, scores)
+        today = self._allocate(max(0.0, budget - runs_today), scores[current:])
+        return tomorrow[:current] + today
+
+    def next_delay(self, now: datetime, target_dates: List[str], runs_today: int) -> float:
+        """次のチェックまでの秒数。今日の予算を使い切っていれば翌日0時まで待つ（0時には予算が戻る）。"""
+        until_midnight = (_midnight_after(now) - now).total_seconds()
+        if runs_today >= self.budget(now, target_dates):
+            return until_midnight
+        intervals = self.plan(now, target_dates, runs_today)
+        delay = min(intervals[bucket_of(now)], until_midnight)
+        # 待っている間に今より間隔の短い（空きが出やすい）時間帯が始まるなら、その始まりで起きる
+        boundary = now.replace(minute=now.minute - now.minute % BUCKET_MINUTES, second=0, microsecond=0)
+        boundary += timedelta(minutes=BUCKET_MINUTES)
+        while boundary < now + timedelta(seconds=delay):
+            if intervals[bucket_of(boundary)] < delay:
+                delay = (boundary - now).total_seconds()
+                break
+            boundary += timedelta(minutes=BUCKET_MINUTES)
+        return max(1.0, delay)
+
+    def due(self, now: datetime, last_run: Optional[datetime], target_dates: List[str], runs_today: int) -> bool:
+        """cron などから起動されたとき、今チェックすべきか。起動のゆらぎを見込んで間隔の9割で良しとする。"""
+        if runs_today >= self.budget(now, target_dates):
+            return False
+        if last_run is None:
+            return True
+        interval = self.plan(now, target_dates, runs_today)[bucket_of(now)]
+        return (now - last_run).total_seconds() >= interval * 0.9
+
+
+def runs_today(store: StateStore, sites: List[str], now: datetime) -> List[datetime]:
+    """今日チェックした時刻（サイトが複数あれば、いちばん多くチェックしたサイトの分）。"""
+    midnight = datetime.combine(now.date(), datetime.min.time())
+    per_site = [store.runs([site], midnight) for site in sites]
+    return max(per_site, key=len) if per_site else []
+
+
+def learn_from_store(scheduler: AdaptiveScheduler, store: StateStore, sites: List[str], now: datetime) -> None:
+    scheduler.learn([at for at, _ in store.transitions(sites, now - timedelta(days=LEARN_DAYS))], now)
+
+
+def budget_from_env() -> int:
+    try:
+        return int(os.environ.get("CHECK_DAILY_BUDGET", "").strip() or DEFAULT_DAILY_BUDGET)
+    except ValueError:
+        return DEFAULT_DAILY_BUDGET
+
+
+def gate(sites: List[str], target_dates: List[str], clock=None) -> bool:
+    """CHECK_SCHEDULE=adaptive のとき、今回チェックすべきかを返す（それ以外は常に True）。"""
+    if os.environ.get("CHECK_SCHEDULE", "").strip().lower() != "adaptive":
+        return True
+    now = (clock or SystemClock()).now()
+    scheduler = AdaptiveScheduler(daily_budget=budget_from_env())
+    store = StateStore()
+    try:
+        learn_from_store(scheduler, store, sites, now)
+        runs = runs_today(store, sites, now)
+    finally:
+        store.close()
+    return scheduler.due(now, runs[-1] if runs else None, target_dates, len(runs))
+
+
+def simulate(scheduler: AdaptiveScheduler, clock, days: float, target_dates: List[str]) -> List[datetime]:
+    """clock を進めながら scheduler の決めた時刻にチェックしたことにして、チェック時刻の一覧を返す。"""
+    end = clock.now() + timedelta(days=days)
+    checks: List[datetime] = []
+    while clock.now() < end:
+        now = clock.now()
+        checks.append(now)
+        today = [t for t in checks if t.date() == now.date()]
+        clock.sleep(scheduler.next_delay(now, target_dates, len(today)))
+    return checks
+
+
+def main() -> int:
+    args = sys.argv[1:]
+    days = float(args[args.index("--days") + 1]) if "--days" in args else 1.0
+    budget = int(args[args.index("--budget") + 1]) if "--budget" in args else budget_from_env()
+    sites = ["compass", "clinic"]
+    now = datetime.now()
+    scheduler = AdaptiveScheduler(daily_budget=budget)
+    store = StateStore()
+    try:
+        learn_from_store(scheduler, store, sites, now)
+        events = len(store.transitions(sites, now - timedelta(days=LEARN_DAYS)))
+    finally:
+        store.close()
+    targets = get_check_dates()
+    print(f"学習した「空きに変わった」記録: {events} 件 / 対象日: {', '.join(targets)} / 予算 {budget} 回/日")
+
+    checks = simulate(scheduler, SimulatedClock(now), days, targets)
+    per_hour = {}
+    for t in checks:
+        key = t.strftime("%m-%d %H時")
+        per_hour[key] = per_hour.get(key, 0) + 1
+    for key, n in per_hour.items():
+        print(f"{key}  {n:>3} 回  {'#' * n}")
+    print(f"合計 {len(checks)} 回（{days:g} 日）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
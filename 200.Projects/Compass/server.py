@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+チェック結果を外へ配信するローカルサーバー（get_line_user_id.py の Webhook サーバーを広げたもの）。
+
+- GET /status            最後に確認した (サイト, 日付) ごとの状況を JSON で返す（?site=compass で絞り込み）
+- GET /events            空き状況の変化（空きが出た・残り枠数が変わった・埋まった）を Server-Sent Events で流し続ける
+                          （?site= で絞り込み、Last-Event-ID で続きから）
+- POST /callback（任意のパス） LINE の Webhook。トークで次のコマンドを受け付ける
+    watch 2026-03-05                  コンパスの 2026-03-05 を購読に追加（日付は CHECK_DATES と同じ書式）。
+                                      最後の確認ですでに空いている日付は、その場でその人に送る
+    watch clinic 2026-03-05           サイトを指定して追加
+    unwatch [サイト] 日付             購読をやめる
+    list                              購読中の日付と最新の状況
+
+状況は state.db（STATE_DB）から読むので、チェック自体は cron・watch モード・fanout に任せ、
+ダッシュボードや他のボットはこのサーバーを購読すればよい。--check-every 秒を付けると、
+購読者（subscribers.json）全員分の fanout もこのプロセスで定期的に実行する。
+
+    python server.py                          # http://127.0.0.1:8080
+    python server.py --port 8090 --check-every 300
+    curl -N http://127.0.0.1:8080/events
+
+Webhook は LINE_CHANNEL_SECRET で署名（X-Line-Signature）を確かめる。未設定なら 403 で断る
+（手元で試すときだけ --allow-unsigned で署名なしのリクエストを受け付ける）。
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from common import Check, log, parse_dates
+from notify import get_dispatcher, pack_texts
+from sites import SITES
+from state import StateStore
+from subscribers import DeliveryLog, Registry
+
+
+PORT = 8080
+POLL_INTERVAL = 1.0  # state.db の変化を見に行く間隔（秒）
+HEARTBEAT_INTERVAL = 15.0  # SSE の接続を保つためのコメントを送る間隔（秒）
+BACKLOG = 1000  # Last-Event-ID から再送できるように覚えておく件数
+DEFAULT_SITE = "compass"
+SITE_NAMES = tuple(SITES)
+
+HELP_TEXT = "\n".join([
+    "使えるコマンド:",
+    "watch 2026-03-05（コンパス）",
+    "watch clinic 2026-03-05",
+    "unwatch 2026-03-05",
+    "list",
+])
+
+
+def status_json(sites: Optional[List[str]] = None) -> dict:
+    """{site: {日付: {available, slots, detail, updated_at}}}"""
+    store = StateStore()
+    try:
+        rows = store.latest(sites)
+    finally:
+        store.close()
+    result: Dict[str, dict] = {}
+    for site, date, available, slots, detail, updated_at in rows:
+        result.setdefault(site, {})[date] = {
+            "available": available,
+            "slots": slots,
+            "detail": detail,
+            "updated_at": updated_at,
+        }
+    return result
+
+
+class EventHub:
+    """
+    state.db の events（StateStore.update が通知と同じ判定で残した変化）を1つのスレッドで見張り、
+    SSE の接続ごとのキューへ配る。
+    接続が増えてもデータベースへの問い合わせは POLL_INTERVAL ごとに1回。
+    """
+
+    def __init__(self, poll_interval: float = POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.backlog: deque = deque(maxlen=BACKLOG)
+        self._subscribers: List[queue.Queue] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        store = StateStore()
+        try:
+            self.last_id = store.last_event_id()
+            # 再接続した購読者のために、直近の変化を少し覚えておく
+            for row in store.events_after(max(0, self.last_id - BACKLOG), BACKLOG):
+                self.backlog.append(self._event(row))
+        finally:
+            store.close()
+
+    @staticmethod
+    def _event(row: Tuple[int, str, str, bool, Optional[int], str, str]) -> dict:
+        event_id, site, date, available, slots, detail, observed_at = row
+        return {
+            "id": event_id, "site": site, "date": date, "available": available, "slots": slots,
+            "detail": detail, "observed_at": observed_at,
+        }
+
+    def subscribe(self, last_event_id: Optional[int] = None) -> Tuple[queue.Queue, List[dict]]:
+        """新しい購読者のキューと、last_event_id より後に起きていた変化（覚えている分）を返す。"""
+        q: queue.Queue = queue.Queue()
+        with self._lock:
+            self._subscribers.append(q)
+            missed = [e for e in self.backlog if last_event_id is not None and e["id"] > last_event_id]
+        return q, missed
+
+    def unsubscribe(self, q: queue.Queue) -> None:
+        with self._lock:
+            if q in self._subscribers:
+                self._subscribers.remove(q)
+
+    def poll_once(self, store: StateStore) -> int:
+        rows = store.events_after(self.last_id)
+        events = [self._event(row) for row in rows]
+        with self._lock:
+            for event in events:
+                self.backlog.append(event)
+                for q in self._subscribers:
+                    q.put(event)
+        if rows:
+            self.last_id = rows[-1][0]
+        return len(events)
+
+    def run(self) -> None:
+        store = StateStore()
+        try:
+            while not self._stop.wait(self.poll_interval):
+                try:
+                    self.poll_once(store)
+                except Exception as e:
+                    log(f"状態の読み取りに失敗しました: {e}")
+        finally:
+            store.close()
+
+    def start(self) -> "EventHub":
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+class Commands:
+    """LINE のトークで届いたコマンドを、購読者の一覧（subscribers.Registry）に反映する。"""
+
+    def __init__(self, registry: Registry):
+        self.registry = registry
+        self._lock = threading.Lock()
+
+    def handle(self, user_id: str, text: str) -> str:
+        """コマンドを実行して、返信する文を返す。"""
+        words = text.strip().split()
+        if not words:
+            return HELP_TEXT
+        command = words[0].lower()
+        if command == "list":
+            return self._list(user_id)
+        if command not in ("watch", "unwatch") or len(words) < 2:
+            return HELP_TEXT
+        site = words[1].lower() if words[1].lower() in SITE_NAMES else DEFAULT_SITE
+        dates = parse_dates(",".join(w for w in words[1:] if w.lower() not in SITE_NAMES))
+        if not dates:
+            return f"日付が読み取れませんでした（例: {command} 2026-03-05）。"
+        with self._lock:
+            if command == "watch":
+                changed = [d for d in dates if self.registry.add(user_id, site, d)]
+            else:
+                changed = [d for d in dates if self.registry.remove(user_id, site, d)]
+            if changed:
+                self.registry.save()
+        log(f"{user_id}: {command} {site} {', '.join(dates)}（変更 {len(changed)} 件）")
+        if command == "watch":
+            if not changed:
+                return "すでに購読しています。"
+            reply = f"{site} の {', '.join(dates)} を購読しました。空きが出たらお知らせします。"
+            if self._notify_open(user_id, site, changed):
+                reply += "\nすでに空きのある日付は、別のメッセージでお知らせしました。"
+            return reply
+        return f"{site} の {', '.join(changed)} の購読をやめました。" if changed else "購読していない日付です。"
+
+    def _notify_open(self, user_id: str, site: str, dates: List[str]) -> bool:
+        """
+        新しく購読した日付のうち、最後の確認で空いていたものをその人にだけすぐ送る。
+        届いたら fanout で同じ空きを二度送らないよう記録する。送ったら True。
+        """
+        status = status_json([site]).get(site, {})
+        details = {
+            d: Check(True, status[d]["detail"], status[d]["slots"]) for d in dates if d in status and status[d]["available"]
+        }
+        if not details:
+            return False
+        deliveries = DeliveryLog()
+        try:
+            details = {d: check for d, check in details.items() if deliveries.due(user_id, site, d, check.slots)}
+            if not details:
+                return False
+            target = SITES[site]()
+            if not get_dispatcher().send_line(pack_texts([target.title, *(details[d].detail for d in sorted(details)), target.url]), to=user_id):
+                # 届かなければ記録しない（次の fanout で送り直す）
+                return False
+            deliveries.mark(user_id, site, details)
+        finally:
+            deliveries.close()
+        return True
+
+    def _list(self, user_id: str) -> str:
+        with self._lock:
+            watches = sorted(self.registry.watches.get(user_id, set()))
+        if not watches:
+            return "購読中の日付はありません。"
+        status = status_json(sorted({site for site, _ in watches}))
+        lines = ["購読中:"]
+        for site, d in watches:
+            latest = status.get(site, {}).get(d)
+            lines.append(f"{site} {d}: {latest['detail'] if latest else 'まだ確認していません'}")
+        return "\n".join(lines)
+
+
+def verify_signature(secret: str, body: bytes, signature: str) -> bool:
+    digest = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).digest()
+    return hmac.compare_digest(base64.b64encode(digest).decode("ascii"), signature)
+
+
+def make_handler(hub: EventHub, commands: Commands, channel_secret: str = "", allow_unsigned: bool = False):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status: int, payload) -> None:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            sites = [s for s in parse_qs(url.query).get("site", []) if s]
+            if url.path == "/status":
+                self._send_json(200, status_json(sites or None))
+            elif url.path == "/events":
+                self._stream(sites)
+            else:
+                # LINE の Webhook URL 検証用（検証時は 200 を返す）
+                self._send_json(200, {"endpoints": ["/status", "/events"]})
+
+        def _stream(self, sites: List[str]) -> None:
+            last = self.headers.get("Last-Event-ID", "").strip()
+            q, missed = hub.subscribe(int(last) if last.isdigit() else None)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Connection", "keep-alive")
+            self.end_headers()
+            self.close_connection = True
+            try:
+                self.wfile.write(b"retry: 3000\n\n")
+                self.wfile.flush()
+                for event in missed:
+                    self._write_event(event, sites)
+                while True:
+                    try:
+                        event = q.get(timeout=HEARTBEAT_INTERVAL)
+                    except queue.Empty:
+                        self.wfile.write(b": keep-alive\n\n")
+                        self.wfile.flush()
+                        continue
+                    self._write_event(event, sites)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                hub.unsubscribe(q)
+
+        def _write_event(self, event: dict, sites: List[str]) -> None:
+            if sites and event["site"] not in sites:
+                return
+            data = json.dumps(event, ensure_ascii=False)
+            self.wfile.write(f"id: {event['id']}\nevent: availability\ndata: {data}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length) if length else b""
+            if channel_secret:
+                signed = verify_signature(channel_secret, body, self.headers.get("X-Line-Signature", ""))
+            else:
+                # 署名を確かめられないと、誰でも他人の購読を書き換えられるので断る
+                signed = allow_unsigned
+            if not signed:
+                self._send_json(403, {"success": False})
+                return
+            self._send_json(200, {"success": True})
+
+            try:
+                data = json.loads(body.decode("utf-8") or "{}")
+            except ValueError as e:
+                log(f"Parse error: {e}")
+                return
+            for event in data.get("events", []):
+                user_id = event.get("source", {}).get("userId")
+                if user_id:
+                    log(f"LINE User ID: {user_id}")
+                message = event.get("message", {})
+                if event.get("type") != "message" or message.get("type") != "text" or not user_id:
+                    continue
+                reply = commands.handle(user_id, message.get("text", ""))
+                if event.get("replyToken"):
+                    get_dispatcher().reply(event["replyToken"], [reply])
+
+        def log_message(self, format, *args):
+            log(f"[{self.log_date_time_string()}] {format % args}")
+
+    return Handler
+
+
+def make_server(
+    host: str = "127.0.0.1", port: int = PORT, registry: Optional[Registry] = None, allow_unsigned: bool = False
+) -> Tuple[ThreadingHTTPServer, EventHub]:
+    hub = EventHub().start()
+    commands = Commands(registry or Registry())
+    secret = os.environ.get("LINE_CHANNEL_SECRET", "").strip()
+    if not secret and allow_unsigned:
+        log("LINE_CHANNEL_SECRET が未設定です。--allow-unsigned なので、署名なしの Webhook も受け付けます。")
+    elif not secret:
+        log("LINE_CHANNEL_SECRET が未設定なので、Webhook は受け付けません（/status と /events だけ使えます）。")
+    server = ThreadingHTTPServer((host, port), make_handler(hub, commands, secret, allow_unsigned))
+    server.daemon_threads = True
+    return server, hub
+
+
+def _check_loop(every: float, path: Optional[str]) -> None:
+    from subscribers import run_fanout
+
+    while True:
+        try:
+            run_fanout(path)
+        except Exception as e:
+            log(f"fanout に失敗しました: {e}")
+        time.sleep(every)
+
+
+def main() -> int:
+    args = sys.argv[1:]
+    host = args[args.index("--host") + 1] if "--host" in args else "127.0.0.1"
+    port = int(args[args.index("--port") + 1]) if "--port" in args else int(os.environ.get("SERVER_PORT", "").strip() or PORT)
+    check_every = float(args[args.index("--check-every") + 1]) if "--check-every" in args else 0
+    registry = Registry()
+    server, hub = make_server(host, port, registry, allow_unsigned="--allow-unsigned" in args)
+    log(f"受付中 http://{host}:{port}  （/status, /events, LINE Webhook）")
+    if check_every > 0:
+        log(f"{check_every:.0f} 秒ごとに購読者（{registry.path}）全員分を確認します。")
+        threading.Thread(target=_check_loop, args=(check_every, registry.path), daemon=True).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    hub.stop()
+    server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,614 @@
+"""
+チェック対象のサイト（コンパス・クリニック）ごとの手順をまとめたプラグイン。
+
+各サイトは Site を継承し、次の手順を実装する（ページは playwright.async_api のもの）:
+
+- open:      ページを開いてカレンダーが出るところまで進める（失敗したら理由を返す）
+- navigate:  対象の年月までカレンダーを移動する
+- extract:   表示中のカレンダーのセルを1回でまとめて読み取る
+- classify:  セルを classifier で判定する
+- describe:  判定を Check(空きありか, 説明メッセージ, 残り枠数) にする。判定できなかった（エラー・遮断・セルが無い）ときは空きありかを None にする
+
+Site.check がこれらを「開く → 日付順に月ごとに移動・読み取り・判定」の順に呼ぶ。
+ブラウザの起動や並行実行は engine.py が受け持つ。
+
+自動予約（booking.py）に対応するサイトは、さらに次を実装する:
+
+- select_date: 空きのある日付を選ぶ
+- select_slot: 時間枠・枚数を選ぶ（無ければ何もしない）
+
+Site.hold が「日付・枠を選ぶ → 予約者の情報を入れる → 確認画面へ」、Site.submit が確定を行う。
+"""
+
+import os
+import re
+from itertools import groupby
+from typing import Dict, List, Optional, Tuple
+
+from backends import BackendError, backend_chain, check_with_fallback
+from booking import BookingError, button, click_button, click_first, fill_fields
+from browser_setup import screenshot, timeout_error
+from classifier import AVAILABLE, FULL, UNMARKED, classify_month_cells, slot_count
+from common import Check, Result, log
+from notify import get_dispatcher
+from proxies import ProxyPool, load_candidates
+from snapshots import get_snapshot_cache
+from timing import StepTimer, budget_from_env
+
+
+async def _save_html(page, name: str) -> None:
+    """CHECK_SAVE_HTML が設定されていれば、表示中のページを {name}.html で保存する（classifier のベンチ用）。"""
+    save_dir = os.environ.get("CHECK_SAVE_HTML", "").strip()
+    if not save_dir:
+        return
+    os.makedirs(save_dir, exist_ok=True)
+    html = await page.content()
+    with open(os.path.join(save_dir, f"{name}.html"), "w", encoding="utf-8") as f:
+        f.write(html)
+
+
+class SiteBlocked(Exception):
+    """プロキシ経由で開けなかった（遮断・タイムアウト）。別のプロキシなら続けられる。"""
+
+
+class Site:
+    """1サイト分のチェック手順と、通知文の見出し・URL。"""
+
+    name = ""
+    title = ""  # 通知の見出し
+    url = ""
+    context_options: dict = {}
+    # 1回のチェック（ページを開く〜判定）の予算。CHECK_BUDGET_MS で上書きできる
+    default_budget_ms = 30000
+
+    def budget_ms(self) -> float:
+        return budget_from_env(self.default_budget_ms)
+
+    def fast_check(self, dates: List[str]) -> Optional[Result]:
+        """ブラウザを使わずに判定できればその結果を返す。できなければ None（ブラウザで確認する）。"""
+        return None
+
+    def proxy_pool(self) -> Optional[ProxyPool]:
+        """プロキシを使うサイトは候補のプールを返す。既定では使わない。"""
+        return None
+
+    def proxy_candidates(self) -> List[Optional[str]]:
+        """
+        このチェックで試すプロキシを試す順に（None は直接つなぐ）。SiteBlocked のたびに次へ進む。
+        <SITE>_PROXIES=direct ならプロキシを使わない（手元の偽サイトで試すときなど）。
+        """
+        if os.environ.get(f"{self.name.upper()}_PROXIES", "").strip().lower() == "direct":
+            return [None]
+        pool = self.proxy_pool()
+        return list(pool.ranked()) if pool else [None]
+
+    def report_proxy(self, proxy: Optional[str], ok: bool) -> None:
+        """実際のチェックでプロキシが使えたかを成績に反映する。"""
+        pool = self.proxy_pool()
+        if pool and proxy:
+            pool.record(proxy, ok)
+
+    def close(self) -> None:
+        """チェックを終えるときに engine / watcher から呼ぶ。開いたままの接続（プロキシの成績など）を閉じる。"""
+
+    async def open(self, page, timer: StepTimer) -> Optional[str]:
+        """
+        ページを開いてカレンダーを表示する。続けられないときはその理由のメッセージを返す。
+        プロキシのせいで開けないときは SiteBlocked を投げる（engine が次のプロキシで開き直す）。
+        """
+        raise NotImplementedError
+
+    async def navigate(self, page, year: int, month: int, timer: StepTimer) -> Optional[List[dict]]:
+        """
+        カレンダーを year 年 month 月に移動する。
+        移動中に読み取ったセルがあればそれを返す（extract を省ける）。既定では何もしない。
+        """
+        return None
+
+    async def extract(self, page, timer: StepTimer) -> List[dict]:
+        """表示中のカレンダーのセル（classifier に渡す形の dict）を読み取る。"""
+        raise NotImplementedError
+
+    async def shows_month(self, page, year: int, month: int) -> bool:
+        """
+        表示中のカレンダーが year 年 month 月か。スナップショットは確かめられた月だけ残す。
+        月を移動できない・表示月を読めないサイトは False（ほかの月の表示を対象月として使い回さない）。
+        """
+        return False
+
+    def classify(self, cells: List[dict], year: int, month: int) -> Dict[int, Tuple[str, str]]:
+        return classify_month_cells(self.name, cells, year, month)
+
+    def describe(self, target_date: str, status: Optional[str], cell_text: str = "") -> Check:
+        raise NotImplementedError
+
+    def _months(self, dates: List[str]):
+        return groupby(sorted(set(dates)), key=lambda d: (int(d[:4]), int(d[5:7])))
+
+    def _judge(self, cells: List[dict], year: int, month: int, month_dates, results: Result, timer: StepTimer) -> None:
+        statuses = self.classify(cells, year, month)
+        for target_date in month_dates:
+            results[target_date] = self.describe(target_date, *statuses.get(int(target_date[8:]), (None, "")))
+            if results[target_date].available:
+                # 自動予約の所要時間は、チェックの終わりではなくこの時刻から測る
+                timer.mark(f"found {target_date}")
+
+    def cached_check(self, dates: List[str], timer: StepTimer) -> Optional[Result]:
+        """全部の月に TTL 以内のスナップショットがあれば、ブラウザを使わずに判定する。無ければ None。"""
+        cache = get_snapshot_cache()
+        results: Result = {}
+        for (year, month), month_dates in self._months(dates):
+            snapshot = cache.fresh(self.name, f"{year:04d}-{month:02d}")
+            if snapshot is None:
+                return None
+            timer.count("cells", len(snapshot.payload))
+            self._judge(snapshot.payload, year, month, month_dates, results, timer)
+        log(f"[{self.name}] TTL 以内に読んだカレンダーで判定しました。")
+        return results
+
+    async def read_month(self, page, year: int, month: int, timer: StepTimer) -> List[dict]:
+        """year 年 month 月へ移動して、その月のセルを読み取る。"""
+        with timer.step(f"month {year}-{month:02d}"):
+            cells = await self.navigate(page, year, month, timer)
+        with timer.step(f"cells {year}-{month:02d}"):
+            if not cells:
+                cells = await self.extract(page, timer)
+            await _save_html(page, f"{self.name}-{year}-{month:02d}")
+        return cells
+
+    async def check(self, page, dates: List[str], timer: StepTimer) -> Result:
+        """
+        日付順に各月へ一度ずつ移動し、月ごとのセル読み取り1回で全対象日を判定する。
+        TTL 以内のスナップショットがある月はページで読み直さない。
+        """
+        dates = sorted(set(dates))
+        cache = get_snapshot_cache()
+        opened = False
+        results: Result = {}
+        for (year, month), month_dates in self._months(dates):
+            key = f"{year:04d}-{month:02d}"
+            snapshot = cache.fresh(self.name, key)
+            if snapshot is not None:
+                log(f"[{self.name}] {key} は {snapshot.age():.0f} 秒前に読んだカレンダーを使います。")
+                cells = snapshot.payload
+            else:
+                if not opened:
+                    error = await self.open(page, timer)
+                    if error:
+                        return {d: Check(None, error) for d in dates}
+                    opened = True
+                cells = await self.read_month(page, year, month, timer)
+                if not await self.shows_month(page, year, month):
+                    log(f"[{self.name}] {key} の表示を確かめられないので、スナップショットには残しません。")
+                elif not cache.put(self.name, key, cells):
+                    log(f"[{self.name}] {key} のカレンダーは前回から変化なし。")
+            timer.count("cells", len(cells))
+            self._judge(cells, year, month, month_dates, results, timer)
+        log(f"[{self.name}] 判定しました。")
+        return results
+
+    # 自動予約で押すボタンの文言（正規表現）
+    book_next_text = r"確認|次へ"
+    book_submit_text = r"予約する|確定|申し込む|申込"
+    book_done_text = r"完了|受け付けました|予約番号"
+
+    async def select_date(self, page, target_date: str, timer: StepTimer) -> str:
+        """表示中のカレンダーで target_date を選ぶ。選んだセルの文言を返す。"""
+        raise BookingError("このサイトは自動予約に対応していません")
+
+    async def select_slot(self, page, profile: dict, timer: StepTimer) -> str:
+        """日付を選んだ後の時間枠・枚数を選ぶ。選んだものの説明を返す（無ければ空文字）。"""
+        return ""
+
+    async def hold(self, page, target_date: str, profile: dict, timer: StepTimer) -> str:
+        """
+        check に使ったページのまま target_date の予約を確認画面（確定ボタンの出る画面）まで進める。
+        進めなければ BookingError を投げる。戻り値は通知に載せる説明。
+        """
+        if page.url == "about:blank":
+            # スナップショットだけで判定して、ページをまだ開いていない
+            error = await self.open(page, timer)
+            if error:
+                raise BookingError(error)
+        await self.navigate(page, int(target_date[:4]), int(target_date[5:7]), timer)
+        await self.select_date(page, target_date, timer)
+        slot = await self.select_slot(page, profile, timer)
+        await fill_fields(page, profile.get("fields", {}), timer)
+        await click_button(page, self.book_next_text, timer, "確認画面へ進む")
+        if not await button(page, self.book_submit_text).count():
+            raise BookingError("確認画面に進めませんでした（入力内容か枠を確認してください）")
+        return f"{target_date}{' ' + slot if slot else ''} を確認画面まで進めました。"
+
+    async def submit(self, page, timer: StepTimer) -> str:
+        """hold の後の確認画面で予約を確定する。"""
+        await click_button(page, self.book_submit_text, timer, "予約の確定")
+        body = await page.inner_text("body")
+        if not re.search(self.book_done_text, body):
+            raise BookingError("予約の完了を確認できませんでした。サイトでご確認ください")
+        number = re.search(r"予約番号[:：\s]*([A-Za-z0-9-]+)", body)
+        return "予約が完了しました" + (f"（予約番号 {number.group(1)}）" if number else "") + "。"
+
+    def notify(self, details: List[str]) -> None:
+        """判定結果（日付ごとの説明）を1通にまとめ、設定されている通知先（Gmail / LINE）に並行して送る。"""
+        sent = get_dispatcher().dispatch(self.title, details, self.url)
+        names = {"gmail": "Gmail", "line": "LINE"}
+        for channel, ok in sent.items():
+            if ok:
+                print(f"{names[channel]} で通知を送信しました。", flush=True)
+            else:
+                log(f"{names[channel]} の送信に失敗しました。")
+        if not sent:
+            print("通知先が未設定です。Gmail: GMAIL_USER, GMAIL_APP_PASSWORD, NOTIFY_EMAIL または LINE を設定してください。")
+
+
+# --- コンパス ---
+
+COMPASS_URL = "https://art-ap.passes.jp/user/e/compass/tickets"
+
+
+def compass_month_url() -> str:
+    """
+    対象月のカレンダーを直接開ける URL（環境変数 COMPASS_MONTH_URL。月送りをしない）。{month} は YYYY-MM、{year} / {mon} も使える
+    例: https://art-ap.passes.jp/user/e/compass/tickets?month={month}
+    """
+    return os.environ.get("COMPASS_MONTH_URL", "").strip()
+
+
+CELL_SELECTOR = "td, li, [role='gridcell'], [role='button'], button, a"
+NAV_SELECTOR = "button:not([disabled]), a, [role='button']:not([aria-disabled='true'])"
+CALENDAR_READY_SELECTOR = "[data-date], td, [role='gridcell']"
+CALENDAR_ROOT_SELECTOR = "[class*='calendar'], [class*='Calendar'], [role='application']"
+# カレンダーの状態をまとめて返す:
+#   months: 画面に出ている「YYYY年M月」を出現順に [年, 月] で（カレンダー部分を先に見る）
+#   cells: 候補セル（td, li, gridcell, ボタン類）と data-date 付き要素を DOM 順に
+#          {text, date: data-date, cls: class, disabled, cell: 候補セルか}
+CALENDAR_MODEL_JS = r"""([cellSelector, rootSelector]) => {
+    const root = document.querySelector(rootSelector);
+    const text = (root ? root.innerText + " " : "") + (document.body.innerText || "");
+    const months = [];
+    for (const m of text.matchAll(/(\d{4})年(\d{1,2})月/g)) {
+        const y = Number(m[1]), mo = Number(m[2]);
+        if (!months.some(x => x[0] === y && x[1] === mo)) months.push([y, mo]);
+    }
+    const cells = [];
+    for (const el of document.querySelectorAll(cellSelector + ", [data-date]")) {
+        const text = (el.innerText || "").trim();
+        const date = el.getAttribute("data-date") || "";
+        if (!date && (!text || text.length > 50)) continue;
+        cells.push({
+            text,
+            date,
+            cls: el.getAttribute("class") || "",
+            disabled: Boolean(el.disabled || el.getAttribute("aria-disabled") === "true"),
+            cell: el.matches(cellSelector),
+        });
+    }
+    return {months, cells};
+}"""
+# 最初の「YYYY年M月」の表示が現れた（prev = [年, 月] と違う月に変わった）ら true
+MONTH_LABEL_CHANGED_JS = r"""([rootSelector, prev]) => {
+    const root = document.querySelector(rootSelector);
+    const text = (root ? root.innerText + " " : "") + (document.body.innerText || "");
+    const m = text.match(/(\d{4})年(\d{1,2})月/);
+    return m !== null && (prev === null || Number(m[1]) !== prev[0] || Number(m[2]) !== prev[1]);
+}"""
+
+
+class CompassSite(Site):
+    """国立科学博物館コンパス（ART PASS）のチケットカレンダー。"""
+
+    name = "compass"
+    title = "【コンパス空き情報】"
+    url = COMPASS_URL
+    context_options = {
+        "locale": "ja-JP",
+        "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    }
+
+    def fast_check(self, dates: List[str]) -> Optional[Result]:
+        """COMPASS_BACKEND が auto / http で API が使えれば、ブラウザを使わずに判定する。"""
+        mode = os.environ.get("COMPASS_BACKEND", "").strip().lower()
+        chain = backend_chain(mode)
+        if not chain:
+            return None
+        try:
+            return check_with_fallback(dates, chain, log=log)
+        except BackendError:
+            if mode == "http":
+                raise
+            return None
+
+    async def _read_calendar(self, page) -> Dict[str, list]:
+        """表示中のカレンダーを page.evaluate 1回で読み取る（要素ごとの往復をしない）。"""
+        return await page.evaluate(CALENDAR_MODEL_JS, [CELL_SELECTOR, CALENDAR_ROOT_SELECTOR])
+
+    async def _wait_for_month_label(self, page, prev: Optional[Tuple[int, int]], timer: StepTimer) -> None:
+        """月の表示が prev（年, 月）から変わる（prev が None なら現れる）まで待つ。固定の sleep の代わり。"""
+        try:
+            await page.wait_for_function(
+                MONTH_LABEL_CHANGED_JS,
+                arg=[CALENDAR_ROOT_SELECTOR, list(prev) if prev else None],
+                timeout=timer.timeout(5000),
+            )
+        except timeout_error():
+            log("カレンダーの表示が変わるのを待ちきれませんでした。現在の表示で続行します。")
+
+    def month_url(self, year: int, month: int) -> Optional[str]:
+        template = compass_month_url()
+        if not template:
+            return None
+        return template.format(month=f"{year:04d}-{month:02d}", year=f"{year:04d}", mon=f"{month:02d}")
+
+    async def _goto(self, page, url: str, timer: StepTimer) -> Optional[str]:
+        """url を開いてカレンダーの月表示を待つ。開けなければ理由のメッセージを返す。"""
+        try:
+            log("ページを開いています...")
+            # networkidle は SPA で永遠に待つことがあるので domcontentloaded に
+            with timer.step("goto"):
+                timer.count("navigations")
+                await page.goto(url, wait_until="domcontentloaded", timeout=timer.timeout(20000))
+        except timeout_error():
+            return "ページの読み込みがタイムアウトしました"
+        except Exception as e:
+            return f"ページを開けませんでした: {e}"
+
+        # カレンダーの月表示が描画されるまで待つ
+        with timer.step("calendar"):
+            await self._wait_for_month_label(page, None, timer)
+        log("カレンダーを確認しています...")
+        return None
+
+    async def open(self, page, timer: StepTimer) -> Optional[str]:
+        if compass_month_url():
+            # 月ごとの URL を navigate で直接開くので、トップページは開かない
+            return None
+        return await self._goto(page, COMPASS_URL, timer)
+
+    async def navigate(self, page, year: int, month: int, timer: StepTimer) -> Optional[List[dict]]:
+        """
+        対象月までカレンダーを移動し、最後に読み取ったセルを返す。
+        COMPASS_MONTH_URL があればその月を直接開き、開けなければトップページから月送りで移動する。
+        """
+        url = self.month_url(year, month)
+        if url:
+            error = await self._goto(page, url, timer)
+            if error:
+                log(f"月のページを直接開けませんでした（{error}）。トップページから月送りで移動します。")
+                error = await self._goto(page, COMPASS_URL, timer)
+                if error:
+                    raise RuntimeError(error)
+        model = await self._read_calendar(page)
+        max_clicks = 24
+        for _ in range(max_clicks):
+            months = [tuple(ym) for ym in model["months"]]
+            if (year, month) in months:
+                log(f"対象月 {year}-{month:02d} を表示しました。")
+                break
+            current = months[0] if months else None
+            try:
+                if current:
+                    if current < (year, month):
+                        # 次月へ（disabled でないボタンのみクリック）
+                        next_btns = page.locator(NAV_SELECTOR).filter(has_text=re.compile(r">|›|次"))
+                        n = await next_btns.count()
+                        if n >= 2:
+                            await next_btns.nth(1).click(timeout=5000)
+                        elif n == 1:
+                            await next_btns.first.click(timeout=5000)
+                        else:
+                            log("次月ボタンが無効のため、この月で続行します。")
+                            break
+                        log("次月へ移動しました。")
+                    elif current > (year, month):
+                        prev_btns = page.locator(NAV_SELECTOR).filter(has_text=re.compile(r"<|‹|前"))
+                        if await prev_btns.count() > 0:
+                            await prev_btns.first.click(timeout=5000)
+                        log("前月へ移動しました。")
+                    else:
+                        break
+                else:
+                    next_btns = page.locator(NAV_SELECTOR).filter(has_text=re.compile(r">|›"))
+                    if await next_btns.count() > 0:
+                        await next_btns.last.click(timeout=5000)
+                        log("次月へ移動しました。")
+                    else:
+                        break
+            except Exception as e:
+                log(f"月送りクリックでエラー: {e}")
+                break
+            timer.count("navigations")
+            await self._wait_for_month_label(page, current, timer)
+            model = await self._read_calendar(page)
+        return model["cells"]
+
+    async def extract(self, page, timer: StepTimer) -> List[dict]:
+        # セルがまだ描画されていなければ待ってから読む
+        try:
+            await page.wait_for_selector(CALENDAR_READY_SELECTOR, state="attached", timeout=timer.timeout(3000))
+        except timeout_error():
+            pass
+        log("対象日のセルを探しています...")
+        return (await self._read_calendar(page))["cells"]
+
+    async def shows_month(self, page, year: int, month: int) -> bool:
+        months = (await self._read_calendar(page))["months"]
+        return [year, month] in months
+
+    book_next_text = r"次へ|購入手続き|確認"
+    book_submit_text = r"購入する|申し込む|確定"
+    book_done_text = r"完了|受け付けました|購入番号|予約番号"
+
+    async def select_date(self, page, target_date: str, timer: StepTimer) -> str:
+        cell = page.locator(f"[data-date='{target_date}']")
+        if await cell.count():
+            await cell.first.click(timeout=timer.timeout(5000))
+            return target_date
+        # data-date が無いカレンダーは、日の数字だけのセルを探す（マークの無いセルも空きとみなす）
+        return await click_first(
+            page, CELL_SELECTOR, rf"^\s*{int(target_date[8:])}(?!\d)", timer, f"{target_date} のセル",
+            site=self.name, require_mark=False,
+        )
+
+    async def select_slot(self, page, profile: dict, timer: StepTimer) -> str:
+        tickets = profile.get("tickets")
+        if not tickets:
+            return ""
+        quantity = page.locator("select")
+        try:
+            await quantity.first.wait_for(state="attached", timeout=timer.timeout(5000))
+        except timeout_error():
+            raise BookingError("枚数の選択欄が見つかりませんでした")
+        await quantity.first.select_option(str(tickets), timeout=timer.timeout(5000))
+        return f"{tickets} 枚"
+
+    def describe(self, target_date: str, status: Optional[str], cell_text: str = "") -> Check:
+        if status == FULL:
+            return Check(False, f"{target_date} は空きなし（カレンダーでX/満員等の表示です）。")
+        if status in (AVAILABLE, UNMARKED):
+            slots = slot_count(cell_text)
+            if slots is not None:
+                return Check(True, f"{target_date} に空きがあります（残り{slots}枠）。サイトでご確認ください。", slots)
+            return Check(True, f"{target_date} に空きがあります。サイトでご確認ください。")
+        return Check(None, f"{target_date} のカレンダーセルを特定できませんでした。要サイト確認。")
+
+
+# --- クリニック ---
+
+CLINIC_URL = "https://matsumotowomens.reserve.ne.jp/sp/index.php"
+
+
+def clinic_url() -> str:
+    """開くページ。環境変数 CLINIC_URL で差し替えられる（fake_servers.py の偽の予約サイトで試すときなど）。"""
+    return os.environ.get("CLINIC_URL", "").strip() or CLINIC_URL
+
+
+# 海外アクセス制限を回避するための日本のプロキシ（CLINIC_PROXIES / proxies.json に候補が無いときに使う）
+# ※無料プロキシのため、繋がらない場合は候補を追加してください
+CLINIC_PROXY = "http://219.100.37.245:443"
+# トップページの描画完了（予約メニューか、海外アクセス遮断の表示が出た）
+TOP_READY_JS = "() => document.querySelector('li.nextpage') || document.body.innerText.includes('Access from overseas')"
+
+
+class ClinicSite(Site):
+    """松本レディースクリニックの予約カレンダー（再診(婦人科)）。"""
+
+    name = "clinic"
+    title = "🏥 クリニック空き情報"
+    # ブラウザは他のサイトと共有するので、プロキシは engine がコンテキスト単位で指定する
+    context_options = {
+        "user_agent": "Mozilla/5.0 (iPhone; CPU iPhone OS 15_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/15.0 Mobile/15E148 Safari/604.1",
+    }
+    # 無料プロキシ経由なので長めにとる（プロキシを切り替えて開き直す分も含む）
+    default_budget_ms = 90000
+    _pool: Optional[ProxyPool] = None
+
+    @property
+    def url(self) -> str:
+        return clinic_url()
+
+    def proxy_pool(self) -> ProxyPool:
+        if self._pool is None:
+            self._pool = ProxyPool(self.name, load_candidates(self.name, [CLINIC_PROXY]), clinic_url())
+        return self._pool
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    async def open(self, page, timer: StepTimer) -> Optional[str]:
+        log("1. トップページを開いています...")
+        with timer.step("goto"):
+            timer.count("navigations")
+            # プローブで応答したプロキシを使うので、遅いプロキシで予算を使い切らないよう短めに打ち切る
+            try:
+                await page.goto(self.url, wait_until="domcontentloaded", timeout=timer.timeout(30000))
+            except timeout_error():
+                raise SiteBlocked("ページの読み込みがタイムアウトしました")
+            except Exception as e:
+                raise SiteBlocked(f"ページを開けませんでした: {e}")
+            try:
+                await page.wait_for_function(TOP_READY_JS, timeout=timer.timeout(10000))
+            except timeout_error():
+                pass
+
+        # 状態確認用のスクリーンショット（CHECKER_DEBUG=1 のときだけ）
+        await screenshot(page, "clinic_debug.png")
+
+        # アクセス制限に引っかかっていないかテキストを確認
+        content = await page.inner_text("body")
+        if "Access from overseas is prohibited" in content:
+            await screenshot(page, "clinic_error_last.png", failed=True)
+            raise SiteBlocked("❌ エラー: プロキシが機能せず、海外アクセスとして遮断されました。")
+
+        log("2. 『再診(婦人科)』ボタンをクリック試行...")
+        # 構造に合わせてli.nextpageの中の要素を狙う
+        target = page.locator("li.nextpage").filter(has_text="再診(婦人科)").first
+        next_btn = page.locator("input[type='submit'], button, a").filter(has_text=re.compile(r"次へ")).first
+        if await target.count() == 0:
+            await screenshot(page, "clinic_error_last.png", failed=True)
+            return "❌ ボタンが見つかりませんでした。"
+        with timer.step("menu"):
+            timer.count("navigations")
+            await target.evaluate("node => node.click()")
+            log("   クリック命令を送信しました。")
+            # 『次へ』ボタンが出るまで待つ
+            try:
+                await next_btn.wait_for(state="visible", timeout=timer.timeout(10000))
+            except timeout_error():
+                pass
+
+        log("3. 『次へ』ボタンをクリックします...")
+        with timer.step("calendar"):
+            timer.count("navigations")
+            await next_btn.click(timeout=timer.timeout(10000))
+            # カレンダーのセルが描画されるまで待つ（networkidle や固定の sleep は使わない）
+            try:
+                await page.wait_for_load_state("domcontentloaded", timeout=timer.timeout(30000))
+                await page.wait_for_selector("td, .calendar_day", state="attached", timeout=timer.timeout(30000))
+            except timeout_error():
+                log("   カレンダーの表示を待ちきれませんでした。現在の表示で続行します。")
+        return None
+
+    async def extract(self, page, timer: StepTimer) -> List[dict]:
+        # カレンダーのセルは1回でまとめて読み、判定は classifier で行う
+        return await page.eval_on_selector_all(
+            "td, .calendar_day, li", "els => els.map(e => ({text: e.innerText || ''}))"
+        )
+
+    async def select_date(self, page, target_date: str, timer: StepTimer) -> str:
+        month, day = int(target_date[5:7]), int(target_date[8:])
+        return await click_first(
+            page, "td, .calendar_day", rf"(?<!\d){month}/{day}(?!\d)", timer, f"{target_date} の空きのあるセル", site=self.name
+        )
+
+    async def select_slot(self, page, profile: dict, timer: StepTimer) -> str:
+        # 希望の時間（profile の times）を順に、無ければ最初の空き枠を選ぶ
+        patterns = [rf"(?<!\d){re.escape(t)}" for t in profile.get("times", [])] or [r"\d{1,2}:\d{2}"]
+        for pattern in patterns:
+            try:
+                return await click_first(page, "td, li, a, button", pattern, timer, "空きのある時間枠", site=self.name)
+            except BookingError:
+                continue
+        raise BookingError("希望の時間に空きのある枠が見つかりませんでした")
+
+    def describe(self, target_date: str, status: Optional[str], cell_text: str = "") -> Check:
+        log(f"{target_date} のセルの判定: {status or 'セルなし'}")
+        if status == AVAILABLE:
+            return Check(True, f"【空きあり】{target_date} に予約可能な枠があります！")
+        if status is None:
+            # セルが無い（描画が間に合わない・表示月が違うなど）ときは、前回の状況を残す
+            return Check(None, f"{target_date} のセルが見つかりませんでした。要サイト確認。")
+        return Check(False, f"{target_date} は空きが見つかりませんでした。")
+
+    async def check(self, page, dates: List[str], timer: StepTimer) -> Result:
+        try:
+            return await super().check(page, dates, timer)
+        except SiteBlocked:
+            raise
+        except Exception as e:
+            await screenshot(page, "clinic_error_last.png", failed=True)
+            return {d: Check(None, f"実行エラー: {e}") for d in sorted(set(dates))}
+
+
+SITES = {site.name: site for site in (CompassSite, ClinicSite)}
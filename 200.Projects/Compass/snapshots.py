@@ -0,0 +1,126 @@
+"""
+(サイト, 年月) ごとのカレンダーの読み取り結果（スナップショット）を保存し、使い回すためのキャッシュ。
+
+- CALENDAR_CACHE_TTL 秒（既定 0 = 使わない）以内に読んだ月は、ページを開かずにそのまま判定に使う
+- 読み直した内容はハッシュで前回と比べ、変わっていなければ「変化なし」とわかる
+- API（backends.HttpBackend）は ETag を保存し、If-None-Match で 304 が返れば前回の JSON を使う
+- 同じ月の複数の日付は、1つのスナップショットで判定する
+
+保存先は状態ストアと同じ SQLite ファイル（STATE_DB、既定 state.db）。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from state import DEFAULT_PATH
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS calendar_snapshots (
+    site TEXT NOT NULL,
+    month TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    etag TEXT,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (site, month)
+) WITHOUT ROWID;
+"""
+
+
+def ttl_from_env(default: float = 0) -> float:
+    """環境変数 CALENDAR_CACHE_TTL（秒）を読む。未設定・不正なら default。"""
+    try:
+        return float(os.environ.get("CALENDAR_CACHE_TTL", "").strip() or default)
+    except ValueError:
+        return default
+
+
+def content_hash(payload) -> str:
+    return hashlib.sha1(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class Snapshot:
+    """1か月分の読み取り結果（ブラウザならセルのリスト、API なら JSON）。"""
+
+    def __init__(self, payload, hash: str, etag: Optional[str], fetched_at: float):
+        self.payload = payload
+        self.hash = hash
+        self.etag = etag
+        self.fetched_at = fetched_at
+
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+
+class SnapshotCache:
+    """(site, YYYY-MM) をキーにしたスナップショットの保存先。スレッドをまたいで使える。"""
+
+    def __init__(self, path: Optional[str] = None, ttl: Optional[float] = None):
+        self.path = path or os.environ.get("STATE_DB", "").strip() or DEFAULT_PATH
+        self.ttl = ttl_from_env() if ttl is None else ttl
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+
+    def get(self, site: str, month: str) -> Optional[Snapshot]:
+        """保存されているスナップショット（古さは問わない）。無ければ None。"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT payload, hash, etag, fetched_at FROM calendar_snapshots WHERE site = ? AND month = ?",
+                (site, month),
+            ).fetchone()
+        if row is None:
+            return None
+        payload, digest, etag, fetched_at = row
+        return Snapshot(json.loads(payload), digest, etag, fetched_at)
+
+    def is_fresh(self, snapshot: Optional[Snapshot]) -> bool:
+        return snapshot is not None and self.ttl > 0 and snapshot.age() < self.ttl
+
+    def fresh(self, site: str, month: str) -> Optional[Snapshot]:
+        """TTL 以内に読んだスナップショットがあれば返す。"""
+        snapshot = self.get(site, month)
+        return snapshot if self.is_fresh(snapshot) else None
+
+    def put(self, site: str, month: str, payload, etag: Optional[str] = None) -> bool:
+        """読み取り結果を保存する。前回の内容から変わっていれば（初回も）True。"""
+        digest = content_hash(payload)
+        previous = self.get(site, month)
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO calendar_snapshots (site, month, payload, hash, etag, fetched_at) VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (site, month) DO UPDATE SET payload = excluded.payload, hash = excluded.hash,"
+                " etag = excluded.etag, fetched_at = excluded.fetched_at",
+                (site, month, json.dumps(payload, ensure_ascii=False), digest, etag, time.time()),
+            )
+        return previous is None or previous.hash != digest
+
+    def touch(self, site: str, month: str) -> None:
+        """内容が変わっていないと確かめられた（304 など）ので、読んだ時刻だけ更新する。"""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE calendar_snapshots SET fetched_at = ? WHERE site = ? AND month = ?",
+                (time.time(), site, month),
+            )
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+_shared: Optional[SnapshotCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_snapshot_cache() -> SnapshotCache:
+    """プロセス内で共有するキャッシュ（常駐モードでも接続を使い回す）。"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = SnapshotCache()
+        return _shared
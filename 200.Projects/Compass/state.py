@@ -0,0 +1,173 @@
+"""
+(site, 日付) ごとの最後の空き状況を SQLite に保存し、変化したときだけ通知するための状態ストア。
+
+通知するのは「空きなし（または未記録）→ 空きあり」に変わったときと、空きのまま残り枠数が変わったとき。
+同じ空きが続いている間は、30分おきに同じ通知を送らない。
+判定できなかった結果（空きありかが None: エラー・遮断・セルが見つからないなど）は保存せず、前回の状況をそのまま残す。
+一時的な失敗をはさんでも「空きなし → 空きあり」に変わったことにならず、同じ空きを二度通知しない。
+
+空き状況が変わった時刻（transitions）とチェックした時刻（runs）も残し、scheduler.py がいつ空きが出やすいかを学ぶ。
+通知と同じ判定で起きた変化（空きが出た・残り枠数が変わった・埋まった）は events に残し、
+server.py は latest() と events_after() で、最新の状況と変化を外へ配信する。
+どの表も古い記録は update のたびに消す（runs は7日、transitions は90日より前、events は新しい EVENTS_KEEP 件を残す）。
+
+保存先は環境変数 STATE_DB（既定: state.db）。GitHub Actions では actions/cache で実行間に引き継ぐ。
+"""
+
+import os
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from common import Result
+
+
+DEFAULT_PATH = "state.db"
+RUNS_KEEP_DAYS = 7
+TRANSITIONS_KEEP_DAYS = 90  # scheduler.py が学ぶのは直近 60 日（LEARN_DAYS）の変化
+EVENTS_KEEP = 10000  # server.py が Last-Event-ID から再送する分（BACKLOG）より十分多く、新しい順に残す件数
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS availability (
+    site TEXT NOT NULL,
+    date TEXT NOT NULL,
+    available INTEGER NOT NULL,
+    slots INTEGER,
+    detail TEXT NOT NULL DEFAULT '',
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (site, date)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS transitions (
+    site TEXT NOT NULL,
+    date TEXT NOT NULL,
+    available INTEGER NOT NULL,
+    observed_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transitions_site_time ON transitions (site, observed_at);
+CREATE TABLE IF NOT EXISTS events (
+    site TEXT NOT NULL,
+    date TEXT NOT NULL,
+    available INTEGER NOT NULL,
+    slots INTEGER,
+    detail TEXT NOT NULL DEFAULT '',
+    observed_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    site TEXT NOT NULL,
+    checked_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_site_time ON runs (site, checked_at);
+"""
+
+
+class StateStore:
+    """(site, 日付) をキーにした空き状況の保存先。主キーがそのまま検索用の索引になる。"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.environ.get("STATE_DB", "").strip() or DEFAULT_PATH
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(SCHEMA)
+
+    def get_many(self, site: str, dates: List[str]) -> Dict[str, Tuple[bool, Optional[int]]]:
+        """{日付: (空きありか, 残り枠数)}。記録の無い日付は含まない。"""
+        if not dates:
+            return {}
+        placeholders = ",".join("?" * len(dates))
+        rows = self.conn.execute(
+            f"SELECT date, available, slots FROM availability WHERE site = ? AND date IN ({placeholders})",
+            [site, *dates],
+        )
+        return {date: (bool(available), slots) for date, available, slots in rows}
+
+    def update(self, site: str, results: Result) -> List[str]:
+        """
+        判定結果を保存し、通知すべき日付（空きに変わった・残り枠数が変わった）を返す。
+        枠数は Check.slots を使う（説明の文言からは読まない）。
+        空きありかが None（判定できなかった）の日付は、状況も変化の履歴も更新しない。
+        """
+        previous = self.get_many(site, list(results))
+        now = datetime.now().isoformat(timespec="seconds")
+        changed = []
+        rows = []
+        flips = []
+        events = []
+        for date, (available, detail, slots) in results.items():
+            if available is None:
+                continue
+            slots = slots if available else None
+            before = previous.get(date)
+            opened = available and (before is None or not before[0] or (slots is not None and before[1] != slots))
+            flipped = before is not None and before[0] != available
+            if opened:
+                changed.append(date)
+            if flipped:
+                flips.append((site, date, int(available), now))
+            if opened or flipped:
+                events.append((site, date, int(available), slots, detail, now))
+            rows.append((site, date, int(available), slots, detail, now))
+        with self.conn:
+            self.conn.executemany("INSERT INTO transitions (site, date, available, observed_at) VALUES (?, ?, ?, ?)", flips)
+            self.conn.executemany(
+                "INSERT INTO events (site, date, available, slots, detail, observed_at) VALUES (?, ?, ?, ?, ?, ?)", events
+            )
+            self.conn.execute("INSERT INTO runs (site, checked_at) VALUES (?, ?)", (site, now))
+            # チェック回数は当日分の予算にしか使わないので、古い記録は消す
+            cutoff = (datetime.now() - timedelta(days=RUNS_KEEP_DAYS)).isoformat(timespec="seconds")
+            self.conn.execute("DELETE FROM runs WHERE site = ? AND checked_at < ?", (site, cutoff))
+            cutoff = (datetime.now() - timedelta(days=TRANSITIONS_KEEP_DAYS)).isoformat(timespec="seconds")
+            self.conn.execute("DELETE FROM transitions WHERE site = ? AND observed_at < ?", (site, cutoff))
+            # 通し番号（rowid）は最大の行を残す限り増え続けるので、残した分の Last-Event-ID はそのまま使える
+            self.conn.execute("DELETE FROM events WHERE rowid <= (SELECT MAX(rowid) FROM events) - ?", (EVENTS_KEEP,))
+            self.conn.executemany(
+                "INSERT INTO availability (site, date, available, slots, detail, updated_at) VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (site, date) DO UPDATE SET available = excluded.available, slots = excluded.slots,"
+                " detail = excluded.detail, updated_at = excluded.updated_at",
+                rows,
+            )
+        return sorted(changed)
+
+    def transitions(self, sites: List[str], since: datetime, available: bool = True) -> List[Tuple[datetime, str]]:
+        """since 以降に空きあり（available=False なら空きなし）に変わった [(時刻, 日付)]（古い順）。"""
+        placeholders = ",".join("?" * len(sites))
+        rows = self.conn.execute(
+            f"SELECT observed_at, date FROM transitions WHERE site IN ({placeholders}) AND available = ?"
+            " AND observed_at >= ? ORDER BY observed_at",
+            [*sites, int(available), since.isoformat(timespec="seconds")],
+        )
+        return [(datetime.fromisoformat(at), date) for at, date in rows]
+
+    def latest(self, sites: Optional[List[str]] = None) -> List[Tuple[str, str, bool, Optional[int], str, str]]:
+        """最後に確認した状況 [(site, 日付, 空きありか, 残り枠数, 説明, 確認時刻)]（site・日付順）。"""
+        query = "SELECT site, date, available, slots, detail, updated_at FROM availability"
+        params: List[str] = []
+        if sites:
+            query += f" WHERE site IN ({','.join('?' * len(sites))})"
+            params = list(sites)
+        rows = self.conn.execute(query + " ORDER BY site, date", params)
+        return [(site, date, bool(available), slots, detail, at) for site, date, available, slots, detail, at in rows]
+
+    def events_after(self, last_id: int, limit: int = 1000) -> List[Tuple[int, str, str, bool, Optional[int], str, str]]:
+        """
+        通し番号が last_id より後の変化 [(通し番号, site, 日付, 空きありか, 残り枠数, 説明, 変化した時刻)]（古い順）。
+        update が通知すべきとした日付（初めての空き・残り枠数の変化を含む）と、空きなしに変わった日付が並ぶ。
+        """
+        rows = self.conn.execute(
+            "SELECT rowid, site, date, available, slots, detail, observed_at FROM events WHERE rowid > ? ORDER BY rowid LIMIT ?",
+            (last_id, limit),
+        )
+        return [(rowid, site, date, bool(available), slots, detail, at) for rowid, site, date, available, slots, detail, at in rows]
+
+    def last_event_id(self) -> int:
+        return self.conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM events").fetchone()[0]
+
+    def runs(self, sites: List[str], since: datetime) -> List[datetime]:
+        """since 以降にチェックした時刻（古い順）。"""
+        placeholders = ",".join("?" * len(sites))
+        rows = self.conn.execute(
+            f"SELECT checked_at FROM runs WHERE site IN ({placeholders}) AND checked_at >= ? ORDER BY checked_at",
+            [*sites, since.isoformat(timespec="seconds")],
+        )
+        return [datetime.fromisoformat(at) for (at,) in rows]
+
+    def close(self) -> None:
+        self.conn.close()
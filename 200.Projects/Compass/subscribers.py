@@ -0,0 +1,219 @@
+"""
+複数の LINE 利用者（購読者）に、それぞれが見たいサイト・日付の空きだけを届けるための仕組み。
+
+購読者の一覧（既定: 環境変数 SUBSCRIBERS_FILE または subscribers.json）:
+
+    {
+      "subscribers": [
+        {"user_id": "Uxxxx", "name": "山田", "targets": [
+          {"site": "compass", "dates": "2026-03-07,2026-03-14..2026-03-15"}
+        ]},
+        {"user_id": "Uyyyy", "targets": [{"site": "clinic", "dates": ["2026-03-05"]}]}
+      ]
+    }
+
+python main.py fanout [購読者ファイル] で、全員が見たい (サイト, 日付) をそれぞれ1回だけ確認し、
+まだその人に届けていない空きを、同じ内容を受け取る人ごとにまとめて multicast で送る。
+
+届けたかどうかは購読者ごとに state.db の deliveries に残す（サイト全体の「空きに変わった」では決めない）。
+そのため、すでに空いている日付をあとから購読した人にも届き、送信に失敗した人だけが次回に再送される。
+空きなしに戻った日付は記録を消し、また空いたら全員に届ける。残り枠数が変わったときも届け直す。
+"""
+
+import json
+import os
+import sqlite3
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from common import Check, log, parse_dates
+from notify import close_dispatcher, get_dispatcher, pack_texts
+from state import DEFAULT_PATH as STATE_PATH
+from state import StateStore
+
+
+DEFAULT_PATH = "subscribers.json"
+
+DELIVERY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS deliveries (
+    user_id TEXT NOT NULL,
+    site TEXT NOT NULL,
+    date TEXT NOT NULL,
+    slots INTEGER,
+    delivered_at TEXT NOT NULL,
+    PRIMARY KEY (user_id, site, date)
+) WITHOUT ROWID;
+"""
+
+# {user_id: {site: {日付: 判定結果}}}
+Pending = Dict[str, Dict[str, Dict[str, Check]]]
+
+
+class Registry:
+    """購読者 → (サイト, 日付) の対応表。"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.environ.get("SUBSCRIBERS_FILE", "").strip() or DEFAULT_PATH
+        # user_id -> {(site, date)}
+        self.watches: Dict[str, Set[Tuple[str, str]]] = defaultdict(set)
+        self.names: Dict[str, str] = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            for sub in data.get("subscribers", []):
+                user_id = sub["user_id"]
+                if sub.get("name"):
+                    self.names[user_id] = sub["name"]
+                for target in sub.get("targets", []):
+                    dates = target.get("dates", [])
+                    if isinstance(dates, list):
+                        dates = ",".join(dates)
+                    for d in parse_dates(dates):
+                        self.watches[user_id].add((target["site"], d))
+
+    def add(self, user_id: str, site: str, date: str) -> bool:
+        """購読を追加する。新しく追加されたら True。"""
+        if (site, date) in self.watches[user_id]:
+            return False
+        self.watches[user_id].add((site, date))
+        return True
+
+    def remove(self, user_id: str, site: str, date: str) -> bool:
+        if (site, date) not in self.watches.get(user_id, set()):
+            return False
+        self.watches[user_id].discard((site, date))
+        return True
+
+    def save(self) -> None:
+        subscribers = []
+        for user_id, watches in sorted(self.watches.items()):
+            by_site: Dict[str, List[str]] = defaultdict(list)
+            for site, d in sorted(watches):
+                by_site[site].append(d)
+            entry = {"user_id": user_id}
+            if user_id in self.names:
+                entry["name"] = self.names[user_id]
+            entry["targets"] = [{"site": site, "dates": dates} for site, dates in by_site.items()]
+            subscribers.append(entry)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"subscribers": subscribers}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+    def targets(self) -> List[dict]:
+        """全購読者が見たい (サイト, 日付) を重複なしで [{"site": ..., "dates": [...]}] にする。"""
+        by_site: Dict[str, Set[str]] = defaultdict(set)
+        for watches in self.watches.values():
+            for site, d in watches:
+                by_site[site].add(d)
+        return [{"site": site, "dates": sorted(dates)} for site, dates in sorted(by_site.items())]
+
+    def recipients(self, site: str, date: str) -> List[str]:
+        return sorted(u for u, watches in self.watches.items() if (site, date) in watches)
+
+
+class DeliveryLog:
+    """購読者ごとに、どの (サイト, 日付) の空きを（何枠の時点で）届けたか（state.db の deliveries）。"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.environ.get("STATE_DB", "").strip() or STATE_PATH
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(DELIVERY_SCHEMA)
+
+    def due(self, user_id: str, site: str, date: str, slots: Optional[int]) -> bool:
+        """(site, date) の空きを、まだ user_id に届けていないか（残り枠数 slots が変わった場合も含む）。"""
+        row = self.conn.execute(
+            "SELECT slots FROM deliveries WHERE user_id = ? AND site = ? AND date = ?", (user_id, site, date)
+        ).fetchone()
+        return row is None or (slots is not None and row[0] != slots)
+
+    def mark(self, user_id: str, site: str, details: Dict[str, Check]) -> None:
+        now = datetime.now().isoformat(timespec="seconds")
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO deliveries (user_id, site, date, slots, delivered_at) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (user_id, site, date) DO UPDATE SET slots = excluded.slots, delivered_at = excluded.delivered_at",
+                [(user_id, site, d, check.slots, now) for d, check in details.items()],
+            )
+
+    def clear(self, site: str, dates: Iterable[str]) -> None:
+        """空きなしに戻った日付の記録を消す（次に空いたらまた届ける）。"""
+        with self.conn:
+            self.conn.executemany("DELETE FROM deliveries WHERE site = ? AND date = ?", [(site, d) for d in dates])
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def pending_deliveries(registry: Registry, deliveries: DeliveryLog, open_now: Dict[str, Dict[str, Check]]) -> Pending:
+    """open_now（{site: {空きのある日付: 判定結果}}）のうち、購読者ごとにまだ届けていないもの。"""
+    pending: Pending = {}
+    for user_id in sorted(registry.watches):
+        for site_name in sorted(open_now):
+            details = {
+                d: check for d, check in sorted(open_now[site_name].items())
+                if (site_name, d) in registry.watches[user_id] and deliveries.due(user_id, site_name, d, check.slots)
+            }
+            if details:
+                pending.setdefault(user_id, {})[site_name] = details
+    return pending
+
+
+def plan_messages(pending: Pending, sites: Dict[str, object]) -> Dict[Tuple[str, ...], List[str]]:
+    """
+    購読者ごとの届ける空き（pending_deliveries の戻り値）を本文にし、同じ本文になる人をまとめる。
+    戻り値: {本文の行のタプル: [user_id, ...]}
+    """
+    groups: Dict[Tuple[str, ...], List[str]] = defaultdict(list)
+    for user_id in sorted(pending):
+        lines: List[str] = []
+        for site_name, details in sorted(pending[user_id].items()):
+            site = sites[site_name]
+            lines += [site.title, *(details[d].detail for d in sorted(details)), site.url]
+        groups[tuple(lines)].append(user_id)
+    return groups
+
+
+def run_fanout(path: Optional[str] = None) -> int:
+    """購読者全員分の (サイト, 日付) を1回ずつ確認し、まだ届けていない空きを該当者へ一斉送信する。"""
+    from engine import check_targets
+    from sites import SITES
+
+    registry = Registry(path)
+    targets = registry.targets()
+    if not targets:
+        log(f"購読者がいません（{registry.path}）。")
+        return 0
+    log(f"{len(registry.watches)} 人分・{sum(len(t['dates']) for t in targets)} 件の (サイト, 日付) を確認します。")
+
+    results = check_targets(targets)
+    store = StateStore()
+    deliveries = DeliveryLog()
+    try:
+        open_now = {}
+        for site_name, site_results in results.items():
+            for d, check in sorted(site_results.items()):
+                print(f"[{site_name}] {check.detail}", flush=True)
+            # state.db の最新の状況・変化の履歴（server.py / scheduler.py が使う）も更新しておく
+            store.update(site_name, site_results)
+            # 判定できなかった（None）日付は、届けた記録をそのまま残す
+            deliveries.clear(site_name, [d for d, check in site_results.items() if check.available is False])
+            open_now[site_name] = {d: check for d, check in site_results.items() if check.available}
+
+        pending = pending_deliveries(registry, deliveries, open_now)
+        sites = {name: SITES[name]() for name in open_now}
+        dispatcher = get_dispatcher()
+        for lines, user_ids in plan_messages(pending, sites).items():
+            sent = dispatcher.multicast(user_ids, pack_texts(list(lines)))
+            delivered = [u for u in user_ids if sent.get(u)]
+            # 届いた人だけ記録する。失敗した人には次回もう一度送る
+            for user_id in delivered:
+                for site_name, details in pending[user_id].items():
+                    deliveries.mark(user_id, site_name, details)
+            log(f"{len(user_ids)} 人に送信しました（成功 {len(delivered)} / 失敗 {len(user_ids) - len(delivered)}）。")
+    finally:
+        deliveries.close()
+        store.close()
+        close_dispatcher()
+    return 0
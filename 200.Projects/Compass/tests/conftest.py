@@ -0,0 +1,73 @@
+"""
+テストの共通設定。Compass/ のモジュールを読み込めるようにし、テストごとに作業ディレクトリと state.db を分ける。
+
+    cd 200.Projects/Compass && python -m pytest
+
+ブラウザを使うテスト（chromium フィクスチャ）は、Chromium を起動できなければ飛ばす。
+TEST_REQUIRE_BROWSER=1 なら飛ばさずに失敗にする（Actions ではこちら）。
+
+    playwright install chromium && TEST_REQUIRE_BROWSER=1 python -m pytest
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import notify  # noqa: E402
+import snapshots  # noqa: E402
+
+# 手元の設定がテストに混ざらないよう、テストの間は外しておく環境変数
+_ENV = [
+    "AUTO_BOOK", "BOOKING_BUDGET_MS", "BOOKING_PROFILE", "CALENDAR_CACHE_TTL", "CHECK_BUDGET_MS", "CHECK_RECORD_HAR", "CHECK_REPLAY_HAR",
+    "CHECK_SAVE_HTML", "CHECK_SCHEDULE", "CLINIC_PROXIES", "CLINIC_URL", "COMPASS_API_URL", "COMPASS_BACKEND", "COMPASS_MONTH_URL",
+    "GMAIL_APP_PASSWORD", "GMAIL_USER", "LINE_API_BASE", "LINE_CHANNEL_ACCESS_TOKEN", "LINE_CHANNEL_SECRET", "LINE_USER_ID",
+    "METRICS_FILE", "METRICS_PROM", "NOTIFY_EMAIL", "PROXY_CONFIG", "SUBSCRIBERS_FILE",
+]
+
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path, monkeypatch):
+    """作業ディレクトリを tmp_path にし、state.db もそこに作る。プロセス内で共有するキャッシュ・ディスパッチャも作り直す。"""
+    for name in _ENV:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("STATE_DB", str(tmp_path / "state.db"))
+    monkeypatch.setattr(snapshots, "_shared", None)
+    monkeypatch.setattr(notify, "_shared", None)
+    return tmp_path
+
+
+def _chromium_error():
+    """Chromium を起動できなければその理由、できれば None。"""
+    try:
+        from playwright.async_api import async_playwright
+    except ImportError as e:
+        return str(e)
+    from browser_setup import launch
+
+    async def probe():
+        async with async_playwright() as p:
+            browser = await launch(p)
+            await browser.close()
+
+    try:
+        asyncio.run(probe())
+    except Exception as e:
+        return str(e).splitlines()[0] if str(e) else type(e).__name__
+    return None
+
+
+@pytest.fixture(scope="session")
+def chromium():
+    """ブラウザを使うテスト用。起動できなければ飛ばす（TEST_REQUIRE_BROWSER=1 なら失敗にする）。"""
+    error = _chromium_error()
+    if error is None:
+        return
+    message = f"Chromium を起動できません（playwright install chromium か CHROMIUM_EXECUTABLE を設定してください）: {error}"
+    if os.environ.get("TEST_REQUIRE_BROWSER", "").strip() == "1":
+        pytest.fail(message)
+    pytest.skip(message)
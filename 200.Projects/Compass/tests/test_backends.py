@@ -0,0 +1,94 @@
+import json
+import os
+
+import pytest
+
+from backends import BackendError, HttpBackend, backend_chain, parse_calendar_json
+from common import Check
+from state import StateStore
+
+
+# compass_api/2026-03.json は手書きの応答（本物の API を記録したものではない）。よく見るキーの形を組み合わせてある
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "compass_api")
+
+
+def load(month):
+    with open(os.path.join(FIXTURES, f"{month}.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_parse_recorded_calendar():
+    assert parse_calendar_json(load("2026-03")) == {
+        "2026-03-05": (True, 3),
+        "2026-03-06": (False, 0),
+        "2026-03-07": (True, 12),
+        "2026-03-08": (True, None),
+    }
+
+
+def test_parse_date_keyed_calendar():
+    data = {"calendar": {"2026-03-05": {"remain": 4}, "2026-03-06": {"status": "満"}}}
+    assert parse_calendar_json(data) == {"2026-03-05": (True, 4), "2026-03-06": (False, None)}
+
+
+@pytest.mark.parametrize("status, available", [
+    ("×", False), ("X", False), ("sold out", False), ("SOLD_OUT", False), ("満席", False), ("unavailable", False),
+    ("○", True), ("残りわずか", True), ("available", True), ("few", True),
+    # 否定・0 の形は、空・残・available を含んでいても空きなし
+    ("空きなし", False), ("空席なし", False), ("残0", False), ("残り 0", False), ("残りなし", False), ("残なし", False),
+    ("not available", False), ("No Vacant", False), ("残10", True),
+    # 英語は単語ごとに見るので、"x" や "none" を含むだけの語は売切にしない
+    ("next", None), ("max", None), ("nonexistent", None),
+])
+def test_status_words_match_whole_tokens(status, available):
+    data = [{"date": "2026-03-05", "status": status}]
+    if available is None:
+        with pytest.raises(BackendError):
+            parse_calendar_json(data)
+    else:
+        assert parse_calendar_json(data) == {"2026-03-05": (available, None)}
+
+
+def test_parse_rejects_unknown_shape():
+    with pytest.raises(BackendError):
+        parse_calendar_json({"days": [{"note": "メンテナンス中"}]})
+
+
+def test_check_many_reports_slot_counts():
+    results = HttpBackend(fixture_dir=FIXTURES).check_many(["2026-03-05", "2026-03-06", "2026-03-08", "2026-03-09"])
+    assert results == {
+        "2026-03-05": Check(True, "2026-03-05 に空きがあります（残り3枠）。サイトでご確認ください。", 3),
+        "2026-03-06": Check(False, "2026-03-06 は空きなし（API の在庫表示です）。"),
+        "2026-03-08": Check(True, "2026-03-08 に空きがあります。サイトでご確認ください。"),
+        "2026-03-09": Check(None, "2026-03-09 の情報が API の応答にありませんでした。要サイト確認。"),
+    }
+
+
+def test_slot_change_on_api_path_is_notified(tmp_path):
+    data = load("2026-03")
+    fixtures = tmp_path / "api"
+    fixtures.mkdir()
+    backend = HttpBackend(fixture_dir=str(fixtures))
+    store = StateStore()
+    notified = []
+    for remaining in (2, 2, 1):
+        data["data"]["days"][0]["slots"][0]["remaining"] = remaining
+        (fixtures / "2026-03.json").write_text(json.dumps(data), encoding="utf-8")
+        notified.append(store.update("compass", backend.check_many(["2026-03-05"])))
+    store.close()
+    assert notified == [["2026-03-05"], [], ["2026-03-05"]]
+
+
+def test_backend_chain_only_holds_backends_tried_before_the_browser(monkeypatch):
+    # ブラウザでの判定は engine.run_job が受け持つので、chain には入らない
+    assert backend_chain("auto") == []
+    assert backend_chain("playwright") == []
+    assert [b.name for b in backend_chain("http")] == ["http"]
+    monkeypatch.setenv("COMPASS_API_FIXTURES", FIXTURES)
+    assert [b.name for b in backend_chain("auto")] == ["http"]
+    assert backend_chain("playwright") == []
+
+
+def test_api_url_is_read_when_the_chain_is_built(monkeypatch):
+    monkeypatch.setenv("COMPASS_API_URL", "http://127.0.0.1:9/calendar?month={month}")
+    assert [b.url_template for b in backend_chain("auto")] == ["http://127.0.0.1:9/calendar?month={month}"]
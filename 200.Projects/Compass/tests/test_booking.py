@@ -0,0 +1,181 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+import booking
+import engine
+import sites
+from common import Check
+from fake_servers import FakeCompassSite, FakeReserveSite
+from timing import StepTimer
+
+
+MAR5 = "2026-03-05"
+MAR6 = "2026-03-06"
+MAR7 = "2026-03-07"
+PROFILE = {
+    "clinic": {"times": ["10:30"], "fields": {"patient_no": "12345", "tel": "09000000000"}},
+    "compass": {"tickets": 2, "fields": {"name": "山田 花子", "email": "me@example.com"}},
+}
+
+
+@pytest.fixture
+def profile(monkeypatch):
+    with open("booking.json", "w", encoding="utf-8") as f:
+        json.dump(PROFILE, f)
+    monkeypatch.setenv("BOOKING_PROFILE", "booking.json")
+
+
+class TimeoutSite:
+    """hold / submit で、画面操作に使える待ち時間（timer.timeout(5000)）を記録するだけのサイト。届いた通知は notified に貯める。"""
+
+    name = "clinic"
+
+    def __init__(self, fail=False):
+        self.timeouts = []
+        self.notified = []
+        self.fail = fail
+
+    async def hold(self, page, target_date, profile, timer):
+        self.timeouts.append(timer.timeout(5000))
+        if self.fail:
+            raise booking.BookingError("時間枠が埋まっていました")
+        return f"{target_date} の確認画面まで進みました。"
+
+    def notify(self, details):
+        self.notified.append(details)
+
+    async def submit(self, page, timer):
+        self.timeouts.append(timer.timeout(5000))
+        return "予約を確定しました。"
+
+
+def run_booking(site, results, timer):
+    return asyncio.run(booking.run(site, None, results, timer))
+
+
+def test_booking_does_not_inherit_spent_check_budget(profile, monkeypatch):
+    monkeypatch.setenv("AUTO_BOOK", "submit")
+    spent = StepTimer("clinic", budget_ms=1)
+    time.sleep(0.01)
+    assert spent.over_budget()
+
+    site = TimeoutSite()
+    run_booking(site, {MAR5: Check(True, "空きあり")}, spent)
+    assert site.timeouts == [5000, 5000]
+    assert site.notified == [[f"{MAR5} の自動予約（submit）: 予約を確定しました。"]]
+    # チェックの内訳には予約全体が book として載る
+    assert [label for label, _ in spent.steps] == ["book"]
+
+
+def test_booking_budget_from_env(profile, monkeypatch):
+    monkeypatch.setenv("AUTO_BOOK", "dry-run")
+    monkeypatch.setenv("BOOKING_BUDGET_MS", "2000")
+    site = TimeoutSite()
+    run_booking(site, {MAR5: Check(True, "空きあり")}, StepTimer("clinic"))
+    assert 1900 < site.timeouts[0] <= 2000
+
+    monkeypatch.setenv("BOOKING_BUDGET_MS", "abc")
+    assert booking.budget_from_env() == booking.DEFAULT_BUDGET_MS
+
+
+def test_hold_time_starts_at_detection(profile, monkeypatch):
+    monkeypatch.setenv("AUTO_BOOK", "dry-run")
+    recorded = []
+    monkeypatch.setattr(booking, "record_booking", lambda *args: recorded.append(args))
+    timer = StepTimer("clinic")
+    timer.mark(f"found {MAR5}")
+    # 空きと判定してから、残りの月を読むなどしてチェックが終わるまでの時間も含める
+    time.sleep(0.2)
+    run_booking(TimeoutSite(), {MAR5: Check(True, "空きあり")}, timer)
+    site, mode, ok, held, total = recorded[0]
+    assert ok
+    assert held >= 0.2
+
+
+def test_failed_booking_is_notified(profile, monkeypatch):
+    # 予約の結果は、空き状況の通知（状況が変わったときだけ）に頼らず届ける
+    monkeypatch.setenv("AUTO_BOOK", "submit")
+    site = TimeoutSite(fail=True)
+    results = {MAR5: Check(True, "空きあり")}
+    assert run_booking(site, results, StepTimer("clinic")) == results
+    assert site.notified == [[f"{MAR5} の自動予約（submit）: 自動予約できませんでした: 時間枠が埋まっていました"]]
+
+
+# --- 偽の予約サイトを相手に、ブラウザで判定から予約まで通す ---
+
+@pytest.fixture
+def reserve(chromium, monkeypatch, profile):
+    """偽の予約サイト。ClinicSite の通知は送らずに notified に貯める。"""
+    with FakeReserveSite([MAR5, MAR7], full=[MAR6]) as fake:
+        monkeypatch.setenv("CLINIC_URL", fake.url)
+        monkeypatch.setenv("CLINIC_PROXIES", "direct")
+        fake.notified = []
+        monkeypatch.setattr(sites.ClinicSite, "notify", lambda self, details: fake.notified.append(details))
+        yield fake
+
+
+def check_clinic():
+    return engine.check_site(sites.ClinicSite(), [MAR5, MAR6])
+
+
+def test_dry_run_stops_at_confirmation(reserve, monkeypatch):
+    monkeypatch.setenv("AUTO_BOOK", "dry-run")
+    results = check_clinic()
+    assert results[MAR5].available is True
+    assert results[MAR6].available is False
+    assert len(reserve.notified) == 1
+    assert reserve.notified[0][0].startswith(f"{MAR5} の自動予約（dry-run）: ")
+    assert "dry-run" in reserve.notified[0][0]
+    assert reserve.completed == []
+
+
+def test_submit_books_the_preferred_slot_once(reserve, monkeypatch):
+    monkeypatch.setenv("AUTO_BOOK", "submit")
+    results = check_clinic()
+    assert results[MAR5].available is True
+    assert [(b["date"], b["time"], b["patient_no"]) for b in reserve.completed] == [(MAR5, "10:30", "12345")]
+
+    # 予約済みの日付は、次の実行で予約し直さない
+    check_clinic()
+    assert len(reserve.completed) == 1
+
+
+@pytest.fixture
+def compass(chromium, monkeypatch, profile):
+    """購入手続きのある偽のコンパス（2026年3月から表示）。CompassSite の通知は送らずに notified に貯める。"""
+    with FakeCompassSite({MAR5: 3, MAR6: 0}, start="2026-03") as fake:
+        monkeypatch.setattr(sites, "COMPASS_URL", fake.url)
+        fake.notified = []
+        monkeypatch.setattr(sites.CompassSite, "notify", lambda self, details: fake.notified.append(details))
+        yield fake
+
+
+def check_compass():
+    return engine.check_site(sites.CompassSite(), [MAR5, MAR6])
+
+
+def test_compass_dry_run_stops_at_confirmation(compass, monkeypatch):
+    monkeypatch.setenv("AUTO_BOOK", "dry-run")
+    results = check_compass()
+    assert results[MAR5].available is True
+    assert results[MAR6].available is False
+    assert compass.notified == [[f"{MAR5} の自動予約（dry-run）: {MAR5} 2 枚 を確認画面まで進めました。（dry-run のため確定していません）"]]
+    assert compass.completed == []
+    assert compass.days[MAR5] == 3
+
+
+def test_compass_submit_buys_tickets_once(compass, monkeypatch):
+    monkeypatch.setenv("AUTO_BOOK", "submit")
+    results = check_compass()
+    assert results[MAR5].available is True
+    assert [(b["date"], b["tickets"], b["name"], b["email"]) for b in compass.completed] == [
+        (MAR5, "2", "山田 花子", "me@example.com")
+    ]
+    assert compass.notified == [[f"{MAR5} の自動予約（submit）: 予約が完了しました（予約番号 C0001）。"]]
+
+    # 購入済みの日付は、残りがあっても次の実行で買い直さない
+    assert check_compass()[MAR5].slots == 1
+    assert len(compass.completed) == 1
@@ -0,0 +1,71 @@
+import asyncio
+from types import SimpleNamespace
+
+from browser_setup import TransferCounter, report_transfer
+from timing import StepTimer
+
+
+class FakeRequest:
+    """sizes() / response() だけを持つ、読み込みの終わったリクエスト。"""
+
+    def __init__(self, sizes=None, content_length=None):
+        self._sizes = sizes
+        self._headers = {"content-length": content_length} if content_length else {}
+
+    async def sizes(self):
+        # 本物と同じく、問い合わせの往復を挟んでから答える
+        await asyncio.sleep(0.01)
+        if self._sizes is None:
+            raise RuntimeError("Target page, context or browser has been closed")
+        return self._sizes
+
+    async def response(self):
+        return SimpleNamespace(headers=self._headers)
+
+
+def count(*requests):
+    counter = TransferCounter()
+
+    async def main():
+        for request in requests:
+            await counter.count(request)
+
+    asyncio.run(main())
+    return counter
+
+
+def test_counts_encoded_body_and_headers():
+    # gzip された chunked の応答: Content-Length は無いが、実際に受け取ったバイト数を数える
+    counter = count(FakeRequest({"responseBodySize": 4096, "responseHeadersSize": 312, "requestBodySize": 0}))
+    assert counter.bytes == 4096 + 312
+    assert counter.requests == 1
+
+
+def test_ignores_unknown_sizes_from_replay():
+    counter = count(FakeRequest({"responseBodySize": -1, "responseHeadersSize": -1}))
+    assert counter.bytes == 0
+    assert counter.requests == 1
+
+
+def test_falls_back_to_content_length():
+    counter = count(FakeRequest(content_length="2048"), FakeRequest(content_length=None))
+    assert counter.bytes == 2048
+    assert counter.requests == 2
+    assert counter.summary() == "転送 2KB（2 件、ブロック 0 件）"
+
+
+def test_report_waits_for_pending_sizes():
+    # requestfinished のハンドラはすぐ戻るので、報告の前に数え終わるのを待たないと取りこぼす
+    counter = TransferCounter()
+    page = SimpleNamespace(context=SimpleNamespace(transfer=counter))
+    timer = StepTimer("compass")
+
+    async def main():
+        for _ in range(3):
+            counter.on_request_finished(FakeRequest({"responseBodySize": 1000, "responseHeadersSize": 24}))
+        await report_transfer(page, "compass", timer)
+
+    asyncio.run(main())
+    assert timer.counters["bytes"] == 3 * 1024
+    assert timer.counters["requests"] == 3
+    assert counter.bytes == 0
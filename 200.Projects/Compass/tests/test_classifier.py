@@ -0,0 +1,72 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from classifier import AVAILABLE, FULL, UNMARKED, bench, cells_from_html, classify_dates, slot_count
+from common import Check
+from sites import ClinicSite, CompassSite
+
+
+FIXTURES = Path(__file__).parent / "fixtures" / "classifier"
+SNAPSHOTS = sorted(FIXTURES.glob("*.html"))
+
+
+def site_of(path: Path) -> str:
+    return path.name.split("-", 1)[0]
+
+
+def expected_of(path: Path) -> dict:
+    return json.loads(path.with_suffix(".expected.json").read_text(encoding="utf-8"))
+
+
+@pytest.mark.parametrize("path", SNAPSHOTS, ids=[p.stem for p in SNAPSHOTS])
+def test_snapshot_classification(path):
+    cells = cells_from_html(path.read_text(encoding="utf-8"))
+    expected = expected_of(path)
+    assert classify_dates(site_of(path), cells, list(expected)) == expected
+
+
+@pytest.mark.parametrize("site", ["compass", "clinic"])
+def test_bench_cli_agrees(site, capsys):
+    paths = [str(p) for p in SNAPSHOTS if site_of(p) == site]
+    assert paths
+    assert bench(paths, site=site, repeat=1) == 0
+    assert "正解率 100.0%" in capsys.readouterr().out
+
+
+def test_other_month_cell_does_not_leak():
+    cells = cells_from_html(
+        "<table><tr><td data-date='2026-02-28'>28 ○</td><td data-date='2026-03-01'>1 ×</td></tr></table>"
+    )
+    assert classify_dates("compass", cells, ["2026-03-28", "2026-03-01"]) == {"2026-03-28": None, "2026-03-01": FULL}
+
+
+def test_slot_count_is_not_read_as_a_day():
+    # 3日のセルは ×。10日のセルの「残り 3」が3日として読まれると、3日が空きに上書きされる
+    cells = cells_from_html("<table><tr><td>3 ×</td><td>10 残り 3</td></tr></table>")
+    assert classify_dates("compass", cells, ["2026-03-03", "2026-03-10"]) == {
+        "2026-03-03": FULL,
+        "2026-03-10": AVAILABLE,
+    }
+    cells = cells_from_html("<table><tr><td>10 残り 3</td><td>3 ×</td></tr></table>")
+    assert classify_dates("compass", cells, ["2026-03-03"]) == {"2026-03-03": FULL}
+
+
+@pytest.mark.parametrize(
+    "text, count",
+    [("5 残り3", 3), ("残 12", 12), ("あと1", 1), ("5 ○", None), ("", None)],
+)
+def test_slot_count(text, count):
+    assert slot_count(text) == count
+
+
+def test_describe_messages():
+    compass = CompassSite()
+    assert compass.describe("2026-03-05", AVAILABLE, "5 残り3") == Check(
+        True, "2026-03-05 に空きがあります（残り3枠）。サイトでご確認ください。", 3
+    )
+    assert compass.describe("2026-03-06", UNMARKED, "6")[0] is True
+    assert compass.describe("2026-03-07", FULL, "7 ×")[0] is False
+    assert compass.describe("2026-03-08", None)[0] is None
+    assert ClinicSite().describe("2026-03-05", AVAILABLE, "3/5 ○")[0] is True
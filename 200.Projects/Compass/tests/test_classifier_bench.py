@@ -0,0 +1,19 @@
+"""判定の速度（pytest-benchmark が入っているときだけ）。python -m pytest tests/test_classifier_bench.py --benchmark-only"""
+
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from classifier import cells_from_html, classify_month  # noqa: E402
+
+
+FIXTURES = Path(__file__).parent / "fixtures" / "classifier"
+
+
+@pytest.mark.parametrize("name", ["compass-dated-2026-03", "compass-text-2026-03", "clinic-2026-03"])
+def test_classify_month_speed(benchmark, name):
+    cells = cells_from_html((FIXTURES / f"{name}.html").read_text(encoding="utf-8"))
+    result = benchmark(classify_month, name.split("-", 1)[0], cells, 2026, 3)
+    assert result
@@ -0,0 +1,20 @@
+from common import get_check_date, parse_dates
+
+
+def test_dates_are_zero_padded():
+    # 後段は d[5:7]・d[8:] で月と日を切り出すので、ゼロ埋めしていない入力もそろえておく
+    assert parse_dates("2026-3-5, 2026-03-07") == ["2026-03-05", "2026-03-07"]
+    assert parse_dates("2026-3-30..2026-4-1") == ["2026-03-30", "2026-03-31", "2026-04-01"]
+
+
+def test_same_day_written_twice_is_checked_once():
+    assert parse_dates("2026-03-05 2026-3-5") == ["2026-03-05"]
+
+
+def test_unreadable_token_is_skipped():
+    assert parse_dates("2026-03-05, 2026-02-30, tomorrow") == ["2026-03-05"]
+
+
+def test_check_date_is_zero_padded(monkeypatch):
+    monkeypatch.setenv("CHECK_DATE", "2026-3-5")
+    assert get_check_date() == "2026-03-05"
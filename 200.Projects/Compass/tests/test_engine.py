@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+
+from engine import jobs_from_targets
+
+
+COMPASS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# API で判定できる実行（fast_check が答える）を、まっさらなプロセスで動かす
+FAST_PATH = """
+import sys
+
+from common import Check
+from engine import check_site
+from sites import CompassSite
+
+class ApiSite(CompassSite):
+    def fast_check(self, dates):
+        return {d: Check(True, f"{d} に空きがあります。") for d in dates}
+
+results = check_site(ApiSite(), ["2026-03-05"])
+assert results["2026-03-05"][0], results
+print(sorted(m for m in ("playwright", "greenlet") if m in sys.modules))
+"""
+
+
+def test_fast_path_does_not_start_playwright():
+    out = subprocess.run(
+        [sys.executable, "-c", FAST_PATH], cwd=COMPASS_DIR, capture_output=True, text=True, timeout=60,
+        env=dict(os.environ, PYTHONPATH=COMPASS_DIR),
+    )
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.strip().splitlines()[-1] == "[]"
+
+
+def test_jobs_skip_unknown_sites():
+    jobs = jobs_from_targets([
+        {"site": "compass", "dates": ["2026-03-06"]},
+        {"site": "museum", "dates": ["2026-03-05"]},
+        {"site": "compass", "dates": ["2026-03-05"]},
+    ])
+    assert [(job.site.name, job.dates) for job in jobs] == [("compass", ["2026-03-05", "2026-03-06"])]
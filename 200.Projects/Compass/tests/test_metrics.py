@@ -0,0 +1,89 @@
+import pytest
+
+import metrics
+from common import Check
+from timing import StepTimer
+
+
+@pytest.fixture
+def prom(tmp_path, monkeypatch):
+    path = tmp_path / "checker.prom"
+    monkeypatch.setenv("METRICS_PROM", str(path))
+    new_process(monkeypatch)
+    return path
+
+
+def new_process(monkeypatch):
+    """別のプロセスから書いたことにする（プロセス内で覚えている値を空にする）。"""
+    monkeypatch.setattr(metrics, "_gauges", {})
+    monkeypatch.setattr(metrics, "_owned", set())
+
+
+def check(site, steps, counters=None):
+    timer = StepTimer(site)
+    for label in steps:
+        with timer.step(label):
+            pass
+    for name, n in (counters or {}).items():
+        timer.count(name, n)
+    metrics.record_check(timer, {"2026-03-05": Check(True, "空きあり", 2), "2026-03-06": Check(False, "空きなし")})
+
+
+def samples(path):
+    return {line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1]) for line in path.read_text().splitlines() if not line.startswith("#")}
+
+
+@pytest.mark.parametrize("p, expected", [(0, 1), (50, 5), (90, 9), (95, 10), (100, 10)])
+def test_percentile_nearest_rank(p, expected):
+    assert metrics.percentile(list(range(10, 0, -1)), p) == expected
+
+
+def test_percentile_of_few_values():
+    assert metrics.percentile([], 95) == 0.0
+    assert metrics.percentile([3.5], 50) == 3.5
+    assert metrics.percentile([1, 2], 50) == 1
+
+
+def test_textfile_keeps_other_processes(prom, monkeypatch):
+    check("compass", ["open", "month 2026-03"], {"navigations": 2})
+    new_process(monkeypatch)
+    check("clinic", ["open"])
+    new_process(monkeypatch)
+    metrics.record_notify("line", True, 0.25)
+
+    values = samples(prom)
+    assert values['checker_available_dates{site="compass"}'] == 1
+    assert values['checker_available_dates{site="clinic"}'] == 1
+    assert values['checker_count{counter="navigations",site="compass"}'] == 2
+    assert values['checker_notify_success{channel="line"}'] == 1
+    assert values['checker_notify_seconds{channel="line"}'] == 0.25
+    # HELP / TYPE はメトリクスごとに1回だけ
+    text = prom.read_text()
+    assert text.count("# TYPE checker_available_dates gauge") == 1
+    assert text.count("# HELP checker_step_seconds ") == 1
+
+
+def test_next_run_replaces_its_own_steps(prom, monkeypatch):
+    check("compass", ["open", "month 2026-03", "month 2026-04"], {"navigations": 3})
+    check("clinic", ["open", "calendar"])
+    new_process(monkeypatch)
+    check("compass", ["fast"])
+
+    values = samples(prom)
+    # 前の実行にあって今回無いステップ・件数は消え、他のサイトの分は残る
+    assert [s for s in values if s.startswith("checker_step_seconds") and 'site="compass"' in s] == [
+        'checker_step_seconds{site="compass",step="fast"}'
+    ]
+    assert 'checker_count{counter="navigations",site="compass"}' not in values
+    assert 'checker_step_seconds{site="clinic",step="calendar"}' in values
+
+
+def test_summary_reports_percentiles(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv("METRICS_FILE", str(tmp_path / "metrics.jsonl"))
+    for _ in range(3):
+        check("compass", ["open", "month 2026-03"])
+    assert metrics.summary(str(tmp_path / "metrics.jsonl")) == 0
+    out = capsys.readouterr().out
+    assert "compass 合計" in out
+    assert "compass month" in out
+    assert "   3  " in out
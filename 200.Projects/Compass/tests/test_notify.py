@@ -0,0 +1,187 @@
+import threading
+import time
+
+import pytest
+import requests
+
+import notify
+from fake_servers import FakeLineServer, FakeSmtpServer
+from notify import LINE_MAX_RECIPIENTS_PER_MULTICAST, Dispatcher, close_dispatcher, get_dispatcher
+
+
+def line_dispatcher(line, **kwargs):
+    return Dispatcher(line_token="t", line_to="U1", line_api_base=line.url, backoff=0.01, **kwargs)
+
+
+@pytest.mark.parametrize("statuses", [[500], [502, 503], [429]])
+def test_line_retries_server_errors_and_rate_limit(statuses):
+    with FakeLineServer(statuses=list(statuses)) as line:
+        assert line_dispatcher(line).send_line(["空きがあります"])
+    assert [r["status"] for r in line.requests] == [*statuses, 200]
+    assert all(r["body"]["messages"] == [{"type": "text", "text": "空きがあります"}] for r in line.requests)
+
+
+def test_line_gives_up_after_attempts():
+    with FakeLineServer(statuses=[500, 500, 500, 500]) as line:
+        assert not line_dispatcher(line, attempts=3).send_line(["空きがあります"])
+    assert len(line.requests) == 3
+
+
+def test_line_does_not_retry_client_errors():
+    with FakeLineServer(statuses=[400]) as line:
+        assert not line_dispatcher(line).send_line(["空きがあります"])
+    assert len(line.requests) == 1
+
+
+def flaky_post(dispatcher, failures):
+    """最初の failures 回だけ接続エラーにする session.post に差し替える。"""
+    post = dispatcher.session.post
+    calls = []
+
+    def send(*args, **kwargs):
+        calls.append(args[0])
+        if len(calls) <= failures:
+            raise requests.ConnectionError("connection reset")
+        return post(*args, **kwargs)
+
+    dispatcher.session.post = send
+    return calls
+
+
+def test_line_retries_connection_errors():
+    with FakeLineServer() as line:
+        d = line_dispatcher(line)
+        calls = flaky_post(d, failures=2)
+        assert d.send_line(["空きがあります"])
+    assert len(calls) == 3
+    assert len(line.requests) == 1
+
+
+def test_unreachable_push_does_not_stop_the_rest():
+    with FakeLineServer() as line:
+        d = line_dispatcher(line, attempts=2)
+        flaky_post(d, failures=2)
+        assert not d.send_line([f"{i}" for i in range(7)])
+    # 最初の push（5件）は2回とも届かず、残りの2件は送っている
+    assert [len(r["body"]["messages"]) for r in line.requests] == [2]
+
+
+def test_push_packs_five_messages_per_call():
+    with FakeLineServer() as line:
+        assert line_dispatcher(line).send_line([f"{i}" for i in range(7)])
+    assert [len(r["body"]["messages"]) for r in line.requests] == [5, 2]
+
+
+def test_multicast_chunks_recipients():
+    user_ids = [f"U{i:04d}" for i in range(2 * LINE_MAX_RECIPIENTS_PER_MULTICAST + 1)]
+    with FakeLineServer() as line:
+        result = line_dispatcher(line).multicast(user_ids + user_ids[:10], ["空きがあります"])
+    assert all(r["path"] == "/v2/bot/message/multicast" for r in line.requests)
+    chunks = sorted((r["body"]["to"] for r in line.requests), key=len, reverse=True)
+    assert [len(c) for c in chunks] == [500, 500, 1]
+    assert sorted(u for c in chunks for u in c) == user_ids
+    assert result == {u: True for u in user_ids}
+
+
+def test_multicast_reports_failed_chunk_per_user():
+    user_ids = [f"U{i:04d}" for i in range(LINE_MAX_RECIPIENTS_PER_MULTICAST + 3)]
+    with FakeLineServer(statuses=[400]) as line:
+        result = line_dispatcher(line, max_concurrency=1).multicast(user_ids, ["空きがあります"])
+    failed = {u for u, ok in result.items() if not ok}
+    assert failed == set(line.requests[0]["body"]["to"])
+    assert len(failed) == LINE_MAX_RECIPIENTS_PER_MULTICAST
+
+
+def test_smtp_logs_in_once_for_several_mails():
+    with FakeSmtpServer() as smtp:
+        d = Dispatcher(
+            gmail_user="a@example.com", gmail_password="p",
+            smtp_host="127.0.0.1", smtp_port=smtp.port, smtp_ssl=False, smtp_starttls=False, backoff=0.01,
+        )
+        try:
+            for i in range(3):
+                assert d.send_mail(f"空き {i}", "2026-03-05 に空きがあります。")
+        finally:
+            d.close()
+    assert smtp.logins == 1
+    assert len(smtp.messages) == 3
+
+
+def test_dispatch_sends_one_message_to_each_channel():
+    with FakeLineServer() as line, FakeSmtpServer() as smtp:
+        d = Dispatcher(
+            line_token="t", line_to="U1", line_api_base=line.url,
+            gmail_user="a@example.com", gmail_password="p",
+            smtp_host="127.0.0.1", smtp_port=smtp.port, smtp_ssl=False, smtp_starttls=False,
+        )
+        try:
+            sent = d.dispatch("【空き】", ["2026-03-05 に空きがあります。", "2026-03-06 に空きがあります。"])
+        finally:
+            d.close()
+    assert sent == {"line": True, "gmail": True}
+    assert len(line.requests) == 1
+    assert line.requests[0]["body"]["messages"][0]["text"].count("に空きがあります") == 2
+    assert len(smtp.messages) == 1
+
+
+def test_smtp_does_not_log_in_without_starttls():
+    # 平文の接続でも STARTTLS を求め、使えないサーバーにはパスワードを送らない
+    with FakeSmtpServer() as smtp:
+        d = Dispatcher(
+            gmail_user="a@example.com", gmail_password="p",
+            smtp_host="127.0.0.1", smtp_port=smtp.port, smtp_ssl=False, backoff=0.01,
+        )
+        try:
+            assert not d.send_mail("空き", "2026-03-05 に空きがあります。")
+        finally:
+            d.close()
+    assert smtp.logins == 0
+    assert smtp.messages == []
+
+
+def test_shared_dispatcher_is_created_once_across_threads(monkeypatch):
+    created = []
+
+    def from_env():
+        created.append(1)
+        # 作るのに時間がかかっても、後から来たスレッドは同じものを待って使う
+        time.sleep(0.05)
+        return Dispatcher()
+
+    monkeypatch.setattr(Dispatcher, "from_env", staticmethod(from_env))
+    got = []
+    threads = [threading.Thread(target=lambda: got.append(get_dispatcher())) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(created) == 1
+    assert all(d is got[0] for d in got)
+
+
+def test_close_dispatcher_quits_shared_smtp(monkeypatch):
+    with FakeSmtpServer() as smtp:
+        for name, value in [
+            ("GMAIL_USER", "a@example.com"), ("GMAIL_APP_PASSWORD", "p"), ("SMTP_HOST", "127.0.0.1"),
+            ("SMTP_PORT", str(smtp.port)), ("SMTP_SSL", "0"), ("SMTP_STARTTLS", "0"),
+        ]:
+            monkeypatch.setenv(name, value)
+        assert get_dispatcher().send_mail("空き", "2026-03-05 に空きがあります。")
+        close_dispatcher()
+        assert notify._shared is None
+        # 閉じたあとに送るときは、新しく作り直して接続する
+        assert get_dispatcher().send_mail("空き", "2026-03-06 に空きがあります。")
+        close_dispatcher()
+        deadline = time.monotonic() + 2
+        while smtp.quits < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    assert smtp.logins == 2
+    assert smtp.quits == 2
+
+
+def test_invalid_numbers_in_env_fall_back(monkeypatch):
+    monkeypatch.setenv("SMTP_PORT", "587/tcp")
+    monkeypatch.setenv("LINE_MAX_CONCURRENCY", "many")
+    d = Dispatcher.from_env()
+    assert d.smtp_port == 465
+    assert d.max_concurrency == 4
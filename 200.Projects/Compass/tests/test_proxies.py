@@ -0,0 +1,171 @@
+import asyncio
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+import engine
+from common import Check
+from fake_servers import FakeProxy
+from proxies import DECAY, ProxyPool
+from sites import ClinicSite, Site, SiteBlocked
+from timing import StepTimer
+
+
+MAR5 = "2026-03-05"
+PROBE_URL = "http://clinic.test/sp/index.php"
+
+
+@pytest.fixture
+def proxies():
+    """速い・遅い・503 を返すスタブのプロキシ。"""
+    fakes = {"fast": FakeProxy(), "slow": FakeProxy(delay=0.3), "dead": FakeProxy(status=503)}
+    for fake in fakes.values():
+        fake.start()
+    yield fakes
+    for fake in fakes.values():
+        fake.stop()
+
+
+def make_pool(candidates):
+    return ProxyPool("clinic", candidates, PROBE_URL, probe_timeout=2.0, probe_ttl=300)
+
+
+def test_record_decays_older_outcomes():
+    pool = make_pool(["http://p"])
+    pool.record("http://p", False)
+    pool.record("http://p", False)
+    pool.record("http://p", True, latency_ms=100)
+    score = pool.scores()["http://p"]
+    assert score.failures == pytest.approx(DECAY * DECAY + DECAY)
+    assert score.successes == pytest.approx(1.0)
+    assert score.healthy
+
+    # 失敗が古くなるほど成功率は戻る
+    before = score.success_rate()
+    pool.record("http://p", True, latency_ms=100)
+    assert pool.scores()["http://p"].success_rate() > before
+
+
+def test_ranked_prefers_fast_healthy_proxy(proxies):
+    unreachable = "http://127.0.0.1:9"
+    candidates = [unreachable, proxies["dead"].url, proxies["slow"].url, proxies["fast"].url]
+    pool = make_pool(candidates)
+    ranked = pool.ranked()
+    assert ranked[:2] == [proxies["fast"].url, proxies["slow"].url]
+    assert set(ranked[2:]) == {unreachable, proxies["dead"].url}
+    assert proxies["fast"].requests == [f"HEAD {PROBE_URL}"]
+
+    # TTL 以内は前回のプローブを使う
+    pool.ranked()
+    assert len(proxies["fast"].requests) == 1
+
+
+class StubPages:
+    """ブラウザの代わりに、どのプロキシで開いたかだけを持つページを返す。"""
+
+    def __init__(self):
+        self.opened = []
+
+    async def page(self, site, proxy=None):
+        self.opened.append(proxy)
+        return SimpleNamespace(proxy=proxy, context=SimpleNamespace())
+
+    async def release(self, site, page, broken=False):
+        pass
+
+
+class BlockedSite(Site):
+    """blocked のプロキシ経由だと遮断されるサイト。"""
+
+    name = "clinic"
+
+    def __init__(self, pool, blocked):
+        self.pool = pool
+        self.blocked = blocked
+
+    def proxy_pool(self):
+        return self.pool
+
+    async def check(self, page, dates, timer):
+        if page.proxy in self.blocked:
+            raise SiteBlocked("Access from overseas is prohibited")
+        return {d: Check(True, f"{d} に空きがあります（{page.proxy}）") for d in dates}
+
+
+def check_in_browser(site, pages):
+    return asyncio.run(engine._check_in_browser(pages, site, [MAR5], StepTimer("clinic")))
+
+
+def test_failover_excludes_blocked_proxy_mid_run(proxies):
+    fast, slow = proxies["fast"].url, proxies["slow"].url
+    pool = make_pool([slow, fast])
+    site = BlockedSite(pool, blocked={fast})
+    pages = StubPages()
+
+    results = check_in_browser(site, pages)
+    assert pages.opened == [fast, slow]
+    assert results[MAR5] == Check(True, f"{MAR5} に空きがあります（{slow}）")
+
+    # 遮断されたプロキシは失敗が記録され、次の実行では後ろに回る
+    scores = pool.scores()
+    assert not scores[fast].healthy
+    assert scores[slow].healthy
+    assert pool.ranked() == [slow, fast]
+
+
+def test_all_proxies_blocked_reports_unknown(proxies):
+    fast, slow = proxies["fast"].url, proxies["slow"].url
+    site = BlockedSite(make_pool([fast, slow]), blocked={fast, slow})
+    pages = StubPages()
+    results = check_in_browser(site, pages)
+    assert pages.opened == [fast, slow]
+    assert results[MAR5].available is None
+
+
+def test_unreadable_page_does_not_count_as_success(proxies):
+    fast = proxies["fast"].url
+    pool = make_pool([fast])
+    pool.ranked()
+    before = pool.scores()[fast].successes
+
+    class NoCalendarSite(BlockedSite):
+        async def check(self, page, dates, timer):
+            return {d: Check(None, f"{d} のセルが見つかりませんでした。") for d in dates}
+
+    results = check_in_browser(NoCalendarSite(pool, blocked=set()), StubPages())
+    assert results[MAR5].available is None
+    # 1日も判定できなかったページでは、プロキシの成績を良くしない
+    assert pool.scores()[fast].successes == before
+
+    check_in_browser(BlockedSite(pool, blocked=set()), StubPages())
+    assert pool.scores()[fast].successes > before
+
+
+def test_direct_skips_pool(proxies, monkeypatch):
+    monkeypatch.setenv("CLINIC_PROXIES", "direct")
+    site = ClinicSite()
+    assert site.proxy_candidates() == [None]
+    assert site._pool is None
+
+    pages = StubPages()
+    results = check_in_browser(BlockedSite(None, blocked=set()), pages)
+    assert pages.opened == [None]
+    assert results[MAR5].available is True
+
+
+def test_check_closes_the_pool_connection(proxies, monkeypatch):
+    monkeypatch.setenv("CLINIC_PROXIES", proxies["fast"].url)
+    pools = []
+
+    class PooledSite(ClinicSite):
+        def fast_check(self, dates):
+            pools.append(self.proxy_pool())
+            return {d: Check(False, f"{d} は空きが見つかりませんでした。") for d in dates}
+
+    site = PooledSite()
+    assert engine.check_site(site, [MAR5])[MAR5].available is False
+    # 常駐モードでもプロセスが終わるまで state.db を開いたままにしない
+    assert site._pool is None
+    with pytest.raises(sqlite3.ProgrammingError):
+        pools[0].scores()
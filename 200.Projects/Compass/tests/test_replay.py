@@ -0,0 +1,91 @@
+import json
+import os
+
+import pytest
+
+import engine
+import replay
+import sites
+from fake_servers import FakeCompassSite, FakeReserveSite
+
+
+MAR5 = "2026-03-05"
+MAR6 = "2026-03-06"
+# tests/fixtures/captures の clinic.har は、この URL で動かした FakeReserveSite([MAR5], full=[MAR6]) を記録したもの
+CAPTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "captures")
+CAPTURE_URL = "http://127.0.0.1:18765/sp/index.php"
+# compass.har は、このポートで動かした FakeCompassSite(COMPASS_DAYS, start="2026-02") の応答から作ったもの
+COMPASS_CAPTURE_PORT = 18766
+COMPASS_DAYS = {MAR5: 3, MAR6: 0, "2026-03-20": 1, "2026-04-03": 2}
+
+
+@pytest.fixture
+def har_env(chromium, monkeypatch):
+    # replay.bench が書き換える環境変数も、テストの後で元に戻す
+    for name in ("CHECK_RECORD_HAR", "CHECK_REPLAY_HAR", "CHECK_SAVE_HTML", "CALENDAR_CACHE_TTL", "CLINIC_PROXIES"):
+        monkeypatch.setenv(name, "")
+    monkeypatch.setenv("STATE_DB", os.environ["STATE_DB"])
+    return monkeypatch
+
+
+def check_clinic():
+    return engine.check_site(sites.ClinicSite(), [MAR5, MAR6])
+
+
+def test_record_then_replay_without_network(har_env, tmp_path):
+    captures = tmp_path / "captures"
+    with FakeReserveSite([MAR5], full=[MAR6]) as fake:
+        har_env.setenv("CLINIC_URL", fake.url)
+        har_env.setenv("CLINIC_PROXIES", "direct")
+        har_env.setenv("CHECK_RECORD_HAR", str(captures))
+        har_env.setenv("CHECK_SAVE_HTML", str(tmp_path / "html"))
+        recorded = check_clinic()
+    assert recorded[MAR5].available is True
+    assert recorded[MAR6].available is False
+    meta = replay.load_meta(str(captures), "clinic")
+    assert meta["dates"] == [MAR5, MAR6]
+    assert meta["expected"][MAR5] == {"available": True, "detail": recorded[MAR5].detail}
+
+    # サーバーを止めたあとでも、HAR から同じ判定になる
+    har_env.setenv("CHECK_RECORD_HAR", "")
+    har_env.setenv("CHECK_REPLAY_HAR", str(captures))
+    assert check_clinic() == recorded
+
+
+def test_compass_replays_the_same_results_from_har_alone(har_env, tmp_path):
+    captures = tmp_path / "captures"
+    dates = sorted(COMPASS_DAYS)
+    with FakeCompassSite(COMPASS_DAYS, start="2026-02") as fake:
+        har_env.setattr(sites, "COMPASS_URL", fake.url)
+        har_env.setenv("CHECK_RECORD_HAR", str(captures))
+        recorded = engine.check_site(sites.CompassSite(), dates)
+        # 月送り（2月 → 3月 → 4月）の /api/calendar も HAR に入っている
+        assert fake.month_loads == {"2026-02": 1, "2026-03": 1, "2026-04": 1}
+    assert recorded[MAR5].available is True
+    assert recorded[MAR6].available is False
+    assert replay.load_meta(str(captures), "compass")["dates"] == dates
+
+    har_env.setenv("CHECK_RECORD_HAR", "")
+    har_env.setenv("CHECK_REPLAY_HAR", str(captures))
+    assert engine.check_site(sites.CompassSite(), dates) == recorded
+
+
+def test_replay_without_capture_is_unknown(har_env, tmp_path):
+    captures = tmp_path / "captures"
+    captures.mkdir()
+    # カレンダーの無い HAR（トップページも含まない）では、何も判定できない
+    (captures / "clinic.har").write_text(json.dumps({"log": {"version": "1.2", "entries": []}}), encoding="utf-8")
+    (captures / "clinic.json").write_text(json.dumps({"site": "clinic", "dates": [MAR5], "expected": {}}), encoding="utf-8")
+    har_env.setenv("CLINIC_URL", CAPTURE_URL)
+    har_env.setenv("CHECK_REPLAY_HAR", str(captures))
+    assert check_clinic()[MAR5].available is None
+
+
+def test_bench_replays_checked_in_capture(har_env, capsys):
+    har_env.setenv("CLINIC_URL", CAPTURE_URL)
+    har_env.setattr(sites, "COMPASS_URL", f"http://127.0.0.1:{COMPASS_CAPTURE_PORT}{FakeCompassSite.PATH}")
+    assert replay.bench(CAPTURES, runs=2) == 0
+    out = capsys.readouterr().out
+    assert f"[clinic] {MAR5}  OK" in out
+    assert "[compass] 2026-04-03  OK" in out
+    assert "正解 6/6 日" in out
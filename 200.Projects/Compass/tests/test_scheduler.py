@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from scheduler import AdaptiveScheduler, SimulatedClock, gate, simulate
+
+
+START = datetime(2026, 3, 1, 0, 0)
+# 毎晩 21:00 ごろに空きが出ていた記録
+EVENTS = [datetime(2026, 2, 28 - i, 21, 0) for i in range(10)]
+TARGETS = ["2026-03-03"]
+
+
+def run_day(budget):
+    scheduler = AdaptiveScheduler(daily_budget=budget)
+    scheduler.learn(EVENTS, START)
+    return simulate(scheduler, SimulatedClock(START), 1, TARGETS)
+
+
+def in_hot_window(checks):
+    return [t for t in checks if 20 <= t.hour < 22]
+
+
+@pytest.mark.parametrize("budget", [10, 20])
+def test_small_budget_still_reaches_the_hot_window(budget):
+    checks = run_day(budget)
+    assert len(checks) <= budget
+    # 予算の半分までを全体に薄く配り、残りは学んだ時間帯へ回す（一律の毎時チェックで使い切らない）
+    assert len(in_hot_window(checks)) >= budget // 4
+    assert checks[1] - checks[0] > timedelta(hours=1)
+
+
+def test_default_budget_keeps_max_interval():
+    checks = run_day(96)
+    assert len(checks) <= 96
+    gaps = [(b - a).total_seconds() for a, b in zip(checks, checks[1:])]
+    assert max(gaps) <= 3600
+    hot = in_hot_window(checks)
+    assert len(hot) / 2 > len(checks) / 24  # 空きの出やすい2時間は平均より密にチェックする
+
+
+def test_gate_is_open_without_adaptive_schedule():
+    assert gate(["compass"], TARGETS) is True
+
+
+@pytest.mark.parametrize("runs", [48, 50, 96])
+def test_spent_budget_waits_until_midnight(runs):
+    # 対象日が7日より先なら、1日に使うのは予算の半分（96 回なら 48 回）まで
+    scheduler = AdaptiveScheduler(96)
+    now = datetime(2026, 3, 1, 12)
+    assert scheduler.next_delay(now, ["2026-04-30"], runs) == 12 * 3600
+    assert not scheduler.due(now, now - timedelta(hours=3), ["2026-04-30"], runs)
+
+
+def test_far_target_week_long_simulation():
+    scheduler = AdaptiveScheduler(96)
+    scheduler.learn(EVENTS, START)
+    checks = simulate(scheduler, SimulatedClock(START), 7, ["2026-04-30"])
+    per_day = {}
+    for t in checks:
+        per_day[t.date()] = per_day.get(t.date(), 0) + 1
+    assert len(per_day) == 7
+    assert max(per_day.values()) <= 48
@@ -0,0 +1,183 @@
+import base64
+import hashlib
+import hmac
+import http.client
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from common import Check
+from fake_servers import FakeLineServer
+from server import Commands, EventHub, make_handler
+from state import StateStore
+from subscribers import Registry
+
+
+MAR5 = "2026-03-05"
+SECRET = "test-secret"
+
+
+def opened(slots):
+    return Check(True, f"{MAR5} に空きがあります（残り{slots}枠）。サイトでご確認ください。", slots)
+
+
+@pytest.fixture
+def line(monkeypatch):
+    with FakeLineServer() as server:
+        monkeypatch.setenv("LINE_API_BASE", server.url)
+        monkeypatch.setenv("LINE_CHANNEL_ACCESS_TOKEN", "test")
+        yield server
+
+
+@pytest.fixture
+def server(line):
+    """署名を確かめる設定で server.py のハンドラを動かし、(host, port) を返す。変化は 0.05 秒おきに見に行く。"""
+    hub = EventHub(poll_interval=0.05).start()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(hub, Commands(Registry()), SECRET))
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd.server_address
+    httpd.shutdown()
+    httpd.server_close()
+    hub.stop()
+
+
+def update(results):
+    store = StateStore()
+    try:
+        return store.update("compass", results)
+    finally:
+        store.close()
+
+
+def get_json(address, path):
+    conn = http.client.HTTPConnection(*address, timeout=5)
+    try:
+        conn.request("GET", path)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        conn.close()
+
+
+def post_webhook(address, body, signature=None):
+    headers = {"Content-Type": "application/json"}
+    if signature is not None:
+        headers["X-Line-Signature"] = signature
+    conn = http.client.HTTPConnection(*address, timeout=5)
+    try:
+        conn.request("POST", "/callback", body=body, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    finally:
+        conn.close()
+
+
+def sign(body):
+    return base64.b64encode(hmac.new(SECRET.encode("utf-8"), body, hashlib.sha256).digest()).decode("ascii")
+
+
+def text_message(user_id, text):
+    return json.dumps({"events": [{
+        "type": "message", "replyToken": "reply-1", "source": {"userId": user_id},
+        "message": {"type": "text", "text": text},
+    }]}).encode("utf-8")
+
+
+class EventStream:
+    """/events に接続し、届いた SSE を1件ずつ dict で読む。"""
+
+    def __init__(self, address, last_event_id=None):
+        self.conn = http.client.HTTPConnection(*address, timeout=5)
+        headers = {"Last-Event-ID": str(last_event_id)} if last_event_id is not None else {}
+        self.conn.request("GET", "/events?site=compass", headers=headers)
+        self.response = self.conn.getresponse()
+        assert self.response.status == 200
+        assert self.response.readline() == b"retry: 3000\n"
+
+    def next(self):
+        fields = {}
+        while True:
+            line = self.response.readline().decode("utf-8").rstrip("\n")
+            if not line:
+                if "data" in fields:
+                    return json.loads(fields["data"])
+                continue
+            if not line.startswith(":"):
+                key, _, value = line.partition(": ")
+                fields[key] = value
+
+    def close(self):
+        self.conn.close()
+
+
+def test_status_returns_latest_check(server):
+    update({MAR5: opened(3)})
+    status, body = get_json(server, "/status?site=compass")
+    assert status == 200
+    assert body["compass"][MAR5]["available"] is True
+    assert body["compass"][MAR5]["slots"] == 3
+    assert body["compass"][MAR5]["detail"] == opened(3).detail
+    assert get_json(server, "/status?site=clinic") == (200, {})
+
+
+def test_events_follow_the_notification_logic(server):
+    stream = EventStream(server)
+    try:
+        # 初めての空き（前回の記録なし）も、空きのままの枠数の変化も流れる。同じ状況の繰り返しは流れない
+        update({MAR5: opened(3)})
+        first = stream.next()
+        update({MAR5: opened(3)})
+        update({MAR5: opened(1)})
+        update({MAR5: Check(False, f"{MAR5} は空きなし（カレンダーでX/満員等の表示です）。")})
+        events = [first, stream.next(), stream.next()]
+    finally:
+        stream.close()
+    assert [(e["date"], e["available"], e["slots"]) for e in events] == [(MAR5, True, 3), (MAR5, True, 1), (MAR5, False, None)]
+    assert events[1]["detail"] == opened(1).detail
+
+    # 切断していた購読者には、Last-Event-ID より後の変化を再送する
+    stream = EventStream(server, last_event_id=first["id"])
+    try:
+        assert [stream.next()["id"] for _ in range(2)] == [events[1]["id"], events[2]["id"]]
+    finally:
+        stream.close()
+
+
+def test_signed_webhook_runs_command(server, line):
+    body = text_message("Ua", f"watch {MAR5}")
+    assert post_webhook(server, body, sign(body)) == 200
+    # 返信は 200 を返したあとに送るので、届くまで待つ
+    deadline = time.monotonic() + 5
+    while not line.requests and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert [r["path"] for r in line.requests] == ["/v2/bot/message/reply"]
+    assert "購読しました" in line.requests[0]["body"]["messages"][0]["text"]
+    assert Registry().watches["Ua"] == {("compass", MAR5)}
+
+
+@pytest.mark.parametrize("signature", [None, "", sign(b"{}")], ids=["missing", "empty", "other-body"])
+def test_unsigned_webhook_is_rejected(server, line, signature):
+    body = text_message("Ua", f"watch {MAR5}")
+    assert post_webhook(server, body, signature) == 403
+    time.sleep(0.1)
+    assert line.requests == []
+    assert "Ua" not in Registry().watches
+
+
+@pytest.mark.parametrize("allow_unsigned, status", [(False, 403), (True, 200)], ids=["rejected", "opted-in"])
+def test_webhook_without_secret_needs_opt_in(line, allow_unsigned, status):
+    hub = EventHub(poll_interval=0.05).start()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(hub, Commands(Registry()), "", allow_unsigned))
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    try:
+        assert post_webhook(httpd.server_address, text_message("Ua", "list")) == status
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+        hub.stop()
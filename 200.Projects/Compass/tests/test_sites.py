@@ -0,0 +1,81 @@
+import pytest
+
+import engine
+import sites
+import snapshots
+from common import Check
+from fake_servers import FakeCompassSite
+
+
+DAYS = {"2026-03-05": 3, "2026-03-06": 0, "2026-03-20": 1, "2026-04-03": 2}
+TARGETS = ["2026-04-03", "2026-03-20", "2026-03-05", "2026-03-06"]
+
+
+@pytest.fixture
+def compass(chromium, monkeypatch):
+    """2026年2月から表示する偽のコンパス。チェックごとのページ移動の回数を navigations に、月ごとの読み取りを months に拾う。"""
+    navigations = []
+    months = []
+    transferred = []
+
+    def record_check(timer, results):
+        navigations.append(timer.counters.get("navigations", 0))
+        months.append([label.split()[1] for label, _ in timer.steps if label.startswith("month ")])
+        transferred.append(timer.counters.get("bytes", 0))
+
+    monkeypatch.setattr(engine, "record_check", record_check)
+    with FakeCompassSite(DAYS, start="2026-02") as fake:
+        monkeypatch.setattr(sites, "COMPASS_URL", fake.url)
+        fake.navigations = navigations
+        fake.months = months
+        fake.transferred = transferred
+        yield fake
+
+
+def check(dates=TARGETS):
+    return engine.check_site(sites.CompassSite(), dates)
+
+
+def assert_results(results):
+    assert results == {
+        "2026-03-05": Check(True, "2026-03-05 に空きがあります（残り3枠）。サイトでご確認ください。", 3),
+        "2026-03-06": Check(False, "2026-03-06 は空きなし（カレンダーでX/満員等の表示です）。"),
+        "2026-03-20": Check(True, "2026-03-20 に空きがあります（残り1枠）。サイトでご確認ください。", 1),
+        "2026-04-03": Check(True, "2026-04-03 に空きがあります（残り2枠）。サイトでご確認ください。", 2),
+    }
+
+
+def test_each_month_is_loaded_once(compass):
+    assert_results(check())
+    # ページを開くのは1回。月送りは 2月 → 3月 → 4月 の一度ずつで、3月の3日分は同じ表示から判定する
+    assert compass.page_loads == 1
+    assert compass.month_loads == {"2026-02": 1, "2026-03": 1, "2026-04": 1}
+    assert compass.navigations == [3]
+    assert compass.months == [["2026-03", "2026-04"]]
+    # ページ1回と月のカレンダー3回分の応答（本文 + ヘッダー）は、コンテキストを閉じる前に数え終わっている
+    assert compass.transferred[0] > 3 * 100
+
+
+def test_month_url_opens_each_month_directly(compass, monkeypatch):
+    monkeypatch.setenv("COMPASS_MONTH_URL", compass.url + "?month={month}")
+    assert_results(check())
+    assert compass.page_loads == 2
+    assert compass.month_loads == {"2026-03": 1, "2026-04": 1}
+    assert compass.navigations == [2]
+    assert compass.months == [["2026-03", "2026-04"]]
+
+
+def test_previous_month_is_reached_backwards(compass):
+    compass.start_month = "2026-05"
+    results = check(["2026-04-03"])
+    assert results["2026-04-03"].available is True
+    assert compass.month_loads == {"2026-05": 1, "2026-04": 1}
+
+
+def test_only_a_confirmed_month_is_cached(compass, monkeypatch):
+    monkeypatch.setenv("CALENDAR_CACHE_TTL", "600")
+    cache = snapshots.get_snapshot_cache()
+    # 2026年2月から月送り 24 回では 2028年6月に届かないので、そのとき表示している月のセルを 6月として残さない
+    assert check(["2026-03-05", "2028-06-01"])["2028-06-01"].available is None
+    assert cache.get("compass", "2026-03") is not None
+    assert cache.get("compass", "2028-06") is None
@@ -0,0 +1,96 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from engine import Job, run_job
+from classifier import AVAILABLE, FULL
+from common import Check
+import state
+from sites import ClinicSite, Site
+from state import StateStore
+
+
+DATE = "2026-03-05"
+OPEN = Check(True, f"{DATE} に空きがあります（残り3枠）。サイトでご確認ください。", 3)
+
+
+class FlakySite(Site):
+    """fast_check が outcomes を順に返す（例外なら投げる）サイト。ブラウザは使わない。"""
+
+    name = "compass"
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+
+    def fast_check(self, dates):
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return {d: outcome for d in dates}
+
+
+def test_error_between_successes_does_not_notify_again():
+    site = FlakySite([OPEN, RuntimeError("Chromium を起動できませんでした"), OPEN])
+    store = StateStore()
+    notified = []
+    for _ in range(3):
+        results = asyncio.run(run_job(None, Job(site, [DATE])))
+        notified += store.update(site.name, results)
+    assert notified == [DATE]
+    assert store.latest() == [(site.name, DATE, True, 3, OPEN.detail, store.latest()[0][5])]
+    store.close()
+
+
+def test_unknown_result_keeps_previous_state():
+    store = StateStore()
+    store.update("clinic", {DATE: Check(False, f"{DATE} は空きが見つかりませんでした。")})
+    assert store.update("clinic", {DATE: Check(None, "❌ エラー: プロキシが機能せず、海外アクセスとして遮断されました。")}) == []
+    assert store.get_many("clinic", [DATE]) == {DATE: (False, None)}
+    assert store.update("clinic", {DATE: Check(True, f"【空きあり】{DATE} に予約可能な枠があります！")}) == [DATE]
+    store.close()
+
+
+def test_slot_count_change_is_notified():
+    store = StateStore()
+    assert store.update("compass", {DATE: OPEN}) == [DATE]
+    assert store.update("compass", {DATE: OPEN}) == []
+    assert store.update("compass", {DATE: OPEN._replace(slots=1)}) == [DATE]
+    store.close()
+
+
+def test_slot_count_is_read_from_check_not_wording():
+    # 説明の文言に枠数が無くても（別の言い回しでも）、Check.slots の変化で通知する
+    store = StateStore()
+    assert store.update("compass", {DATE: Check(True, "空きあり", 3)}) == [DATE]
+    assert store.update("compass", {DATE: Check(True, "空きあり", 1)}) == [DATE]
+    assert store.update("compass", {DATE: Check(True, "まだ空いています（残り5枠）", 1)}) == []
+    assert store.get_many("compass", [DATE]) == {DATE: (True, 1)}
+    store.close()
+
+
+def test_missing_clinic_cell_keeps_previous_state():
+    site = ClinicSite()
+    store = StateStore()
+    notified = []
+    for status in (AVAILABLE, None, AVAILABLE):
+        notified += store.update(site.name, {DATE: site.describe(DATE, status)})
+    assert notified == [DATE]
+    assert site.describe(DATE, FULL)[0] is False
+    store.close()
+
+
+def test_old_transitions_and_events_are_pruned(monkeypatch):
+    monkeypatch.setattr(state, "EVENTS_KEEP", 2)
+    store = StateStore()
+    old = (datetime.now() - timedelta(days=state.TRANSITIONS_KEEP_DAYS + 1)).isoformat(timespec="seconds")
+    store.conn.execute("INSERT INTO transitions (site, date, available, observed_at) VALUES ('compass', ?, 1, ?)", (DATE, old))
+    for slots in (3, 2, 1):
+        store.update("compass", {DATE: OPEN._replace(slots=slots)})
+    store.update("compass", {DATE: Check(False, f"{DATE} は空きなし。")})
+    # 新しい EVENTS_KEEP 件が通し番号を変えずに残るので、Last-Event-ID の続きは読める
+    assert [row[0] for row in store.events_after(0)] == [3, 4]
+    assert store.last_event_id() == 4
+    assert [(row[0], row[3]) for row in store.events_after(3)] == [(4, False)]
+    store.update("compass", {DATE: OPEN})
+    assert [row[0] for row in store.events_after(0)] == [4, 5]
+    assert [date for _, date in store.transitions(["compass"], datetime.now() - timedelta(days=365), available=True)] == [DATE]
+    store.close()
@@ -0,0 +1,112 @@
+import json
+
+import pytest
+
+import engine
+from common import Check
+from fake_servers import FakeLineServer
+from server import Commands
+from state import StateStore
+from subscribers import Registry, run_fanout
+
+
+MAR5 = "2026-03-05"
+MAR6 = "2026-03-06"
+
+
+@pytest.fixture
+def line(monkeypatch):
+    with FakeLineServer() as server:
+        monkeypatch.setenv("LINE_API_BASE", server.url)
+        monkeypatch.setenv("LINE_CHANNEL_ACCESS_TOKEN", "test")
+        yield server
+
+
+@pytest.fixture
+def calendar(monkeypatch):
+    """check_targets の代わりに、ブラウザを使わず dates の状況（{日付: Check}）を返す。ジョブのまとめ方は本物と同じ。"""
+    dates = {}
+
+    def check_targets(targets, concurrency=None):
+        return {job.site.name: {d: dates[d] for d in job.dates} for job in engine.jobs_from_targets(targets)}
+
+    monkeypatch.setattr(engine, "check_targets", check_targets)
+    return dates
+
+
+def subscribe(watches):
+    with open("subscribers.json", "w", encoding="utf-8") as f:
+        json.dump({"subscribers": [
+            {"user_id": user_id, "targets": [{"site": "compass", "dates": dates}]} for user_id, dates in watches.items()
+        ]}, f)
+
+
+def opened(date, slots=3):
+    return Check(True, f"{date} に空きがあります（残り{slots}枠）。サイトでご確認ください。", slots)
+
+
+def recipients(line):
+    return [sorted(r["body"]["to"]) for r in line.requests]
+
+
+def test_late_subscriber_gets_an_already_open_date(line, calendar):
+    calendar[MAR5] = opened(MAR5)
+    subscribe({"Ua": [MAR5]})
+    run_fanout()
+    subscribe({"Ua": [MAR5], "Ub": [MAR5]})
+    run_fanout()
+    run_fanout()
+    assert recipients(line) == [["Ua"], ["Ub"]]
+
+
+def test_failed_delivery_is_retried_only_for_that_recipient(line, calendar):
+    calendar[MAR5] = opened(MAR5)
+    calendar[MAR6] = opened(MAR6)
+    subscribe({"Ua": [MAR5], "Ub": [MAR6]})
+    line.statuses = [400]  # 最初の送信（Ua 宛て）だけ失敗させる
+    run_fanout()
+    run_fanout()
+    assert [(r["status"], r["body"]["to"]) for r in line.requests] == [(400, ["Ua"]), (200, ["Ub"]), (200, ["Ua"])]
+
+
+def test_reopened_or_changed_slots_are_delivered_again(line, calendar):
+    subscribe({"Ua": [MAR5]})
+    calendar[MAR5] = opened(MAR5)
+    run_fanout()
+    calendar[MAR5] = Check(None, "エラー: タイムアウト")
+    run_fanout()
+    calendar[MAR5] = opened(MAR5)
+    run_fanout()
+    assert len(line.requests) == 1
+    calendar[MAR5] = opened(MAR5, slots=1)
+    run_fanout()
+    calendar[MAR5] = Check(False, f"{MAR5} は空きなし（カレンダーでX/満員等の表示です）。")
+    run_fanout()
+    calendar[MAR5] = opened(MAR5, slots=1)
+    run_fanout()
+    assert len(line.requests) == 3
+
+
+def test_watch_pushes_an_already_open_date_once(line, calendar):
+    store = StateStore()
+    store.update("compass", {MAR5: opened(MAR5)})
+    store.close()
+    commands = Commands(Registry())
+    reply = commands.handle("Ua", f"watch {MAR5}")
+    assert "別のメッセージでお知らせしました" in reply
+    assert line.requests[0]["path"] == "/v2/bot/message/push"
+    assert line.requests[0]["body"]["to"] == "Ua"
+
+    calendar[MAR5] = opened(MAR5)
+    run_fanout()
+    assert len(line.requests) == 1
+
+
+def test_unknown_site_is_skipped(line, calendar):
+    calendar[MAR5] = opened(MAR5)
+    with open("subscribers.json", "w", encoding="utf-8") as f:
+        json.dump({"subscribers": [
+            {"user_id": "Ua", "targets": [{"site": "compas", "dates": [MAR5]}, {"site": "compass", "dates": [MAR5]}]},
+        ]}, f)
+    run_fanout()
+    assert recipients(line) == [["Ua"]]
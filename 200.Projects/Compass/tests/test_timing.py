@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+import pytest
+
+import timing
+from timing import StepTimer, budget_from_env
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """timing が読む time.perf_counter を、advance(ms) で進める時計に差し替える。"""
+    now = [100.0]
+
+    def advance(ms):
+        now[0] += ms / 1000
+
+    monkeypatch.setattr(timing, "time", SimpleNamespace(perf_counter=lambda: now[0]))
+    return advance
+
+
+def test_timeout_shrinks_with_the_budget_and_stops_at_the_floor(clock):
+    timer = StepTimer("compass", budget_ms=10000)
+    assert timer.timeout(5000) == 5000
+    clock(7000)
+    assert timer.timeout(5000) == pytest.approx(3000)
+    clock(2800)
+    assert timer.timeout(5000) == 500
+    assert timer.timeout(5000, floor_ms=100) == pytest.approx(200)
+    clock(1000)
+    assert timer.timeout(5000) == 500
+
+
+def test_timeout_without_budget_is_the_default(clock):
+    timer = StepTimer("compass")
+    clock(60000)
+    assert timer.timeout(5000) == 5000
+    assert not timer.over_budget()
+
+
+def test_over_budget_flips_after_budget_from_env(clock, monkeypatch):
+    monkeypatch.setenv("CHECK_BUDGET_MS", "1500")
+    timer = StepTimer("clinic", budget_ms=budget_from_env(30000))
+    clock(1500)
+    assert not timer.over_budget()
+    clock(1)
+    assert timer.over_budget()
+
+
+@pytest.mark.parametrize("value, expected", [("", 30000), ("abc", 30000), (" 2500 ", 2500)])
+def test_budget_from_env_falls_back_to_default(monkeypatch, value, expected):
+    monkeypatch.setenv("CHECK_BUDGET_MS", value)
+    assert budget_from_env(30000) == expected
+
+
+def test_report_names_the_slowest_step_over_budget(clock):
+    timer = StepTimer("compass", budget_ms=1000)
+    with timer.step("goto"):
+        clock(300)
+    with timer.step("calendar"):
+        clock(900)
+    lines = []
+    timer.report(lines.append)
+    assert lines[-1] == "[compass] ⚠ 予算超過（最も遅いステップ: calendar 0.90s）"
@@ -0,0 +1,156 @@
+import asyncio
+import json
+
+import pytest
+
+import engine
+import watcher
+from sites import ClinicSite, CompassSite
+from watcher import DEFAULTS, BrowserPool, load_config
+
+
+class StubBrowser:
+    def is_connected(self):
+        return True
+
+    async def close(self):
+        pass
+
+
+class StubPage:
+    """performance.memory の代わりに heap（バイト）を返すページ。"""
+
+    def __init__(self, context):
+        self.context = context
+        self.heap = 0
+
+    async def evaluate(self, script):
+        return self.heap
+
+
+class StubContext:
+    def __init__(self, site, proxy):
+        self.site = site
+        self.proxy = proxy
+        self.closed = False
+
+    async def new_page(self):
+        return StubPage(self)
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def launcher(monkeypatch):
+    """Chromium を起動せず、作ったコンテキストを contexts に、起動の回数を launches に拾う。"""
+    contexts = []
+    launches = []
+
+    async def launch(playwright):
+        launches.append(playwright)
+        return StubBrowser()
+
+    async def open_context(browser, site, proxy=None):
+        contexts.append(StubContext(site.name, proxy))
+        return contexts[-1]
+
+    monkeypatch.setattr(engine, "launch", launch)
+    monkeypatch.setattr(watcher, "open_context", open_context)
+    return contexts, launches
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_context_is_recycled_after_recycle_every(launcher):
+    contexts, launches = launcher
+    pool = BrowserPool(recycle_every=2, max_heap_mb=300, playwright=object())
+    site = CompassSite()
+
+    async def use_three_times():
+        for _ in range(3):
+            page = await pool.page(site)
+            await pool.release(site, page)
+
+    run(use_three_times())
+    # 2回使ったところで閉じ、3回目は新しいコンテキストで開く
+    assert len(launches) == 1
+    assert len(contexts) == 2
+    assert contexts[0].closed and not contexts[1].closed
+
+
+def test_context_is_recycled_over_max_heap_mb(launcher):
+    contexts, _ = launcher
+    pool = BrowserPool(recycle_every=50, max_heap_mb=100, playwright=object())
+    site = CompassSite()
+
+    async def use(heap_mb):
+        page = await pool.page(site)
+        page.heap = heap_mb * 1024 * 1024
+        await pool.release(site, page)
+        return page
+
+    first = run(use(80))
+    assert run(use(120)) is first
+    assert contexts[0].closed
+    # ヒープが小さいうちは同じページを使い回し、超えたら次のチェックで作り直す
+    assert run(use(10)) is not first
+    assert len(contexts) == 2
+
+
+def test_context_is_recycled_on_proxy_change(launcher):
+    contexts, _ = launcher
+    pool = BrowserPool(recycle_every=50, max_heap_mb=300, playwright=object())
+    clinic, compass = ClinicSite(), CompassSite()
+
+    async def use(site, proxy):
+        page = await pool.page(site, proxy)
+        await pool.release(site, page)
+        return page
+
+    first = run(use(clinic, "http://a"))
+    assert run(use(clinic, "http://a")) is first
+    assert run(use(compass, None)) is not first
+    switched = run(use(clinic, "http://b"))
+    assert switched is not first
+    assert [(c.site, c.proxy, c.closed) for c in contexts] == [
+        ("clinic", "http://a", True), ("compass", None, False), ("clinic", "http://b", False),
+    ]
+
+
+def test_load_config_reads_file_and_expands_dates(tmp_path, monkeypatch):
+    monkeypatch.setenv("CHECK_CONCURRENCY", "3")
+    path = tmp_path / "watch.json"
+    path.write_text(json.dumps({
+        "interval": 30,
+        "targets": [
+            {"site": "compass", "dates": "2026-03-07,2026-03-14..2026-03-15"},
+            {"site": "clinic", "dates": ["2026-03-06", "2026-03-05"]},
+        ],
+    }), encoding="utf-8")
+    config = load_config(str(path))
+    assert config["interval"] == 30
+    assert config["recycle_every"] == DEFAULTS["recycle_every"]
+    assert config["concurrency"] == 3
+    assert config["targets"] == [
+        {"site": "compass", "dates": ["2026-03-07", "2026-03-14", "2026-03-15"]},
+        {"site": "clinic", "dates": ["2026-03-05", "2026-03-06"]},
+    ]
+
+
+def test_load_config_falls_back_to_check_dates(tmp_path, monkeypatch):
+    monkeypatch.delenv("WATCH_CONFIG", raising=False)
+    monkeypatch.setenv("CHECK_DATES", "2026-03-05~2026-03-06")
+    config = load_config(str(tmp_path / "missing.json"), default_site="clinic")
+    assert config["targets"] == [{"site": "clinic", "dates": ["2026-03-05", "2026-03-06"]}]
+
+
+def test_load_config_uses_watch_config_and_check_dates_for_bad_dates(tmp_path, monkeypatch):
+    path = tmp_path / "custom.json"
+    path.write_text(json.dumps({"targets": [{"site": "compass", "dates": "2026-02-30"}]}), encoding="utf-8")
+    monkeypatch.setenv("WATCH_CONFIG", str(path))
+    monkeypatch.setenv("CHECK_DATES", "2026-03-05")
+    # 解釈できる日付が1つも無い対象は、環境変数の対象日を使う
+    assert load_config(None)["targets"] == [{"site": "compass", "dates": ["2026-03-05"]}]
@@ -0,0 +1,80 @@
+"""
+1回のチェックを処理ステップごとに計測し、所要時間の内訳を出すための小さなタイマー。
+ページ移動の回数・判定したセル数・転送量などの件数も count() で一緒に数える（metrics.py で書き出す）。
+
+予算（CHECK_BUDGET_MS）を決めておくと、各ステップの待ち時間の上限を残り予算で打ち切り、
+超過したときは内訳付きで警告する。
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+def budget_from_env(default_ms: float) -> float:
+    """環境変数 CHECK_BUDGET_MS（ミリ秒）を読む。未設定・不正なら default_ms。"""
+    try:
+        return float(os.environ.get("CHECK_BUDGET_MS", "").strip() or default_ms)
+    except ValueError:
+        return default_ms
+
+
+class StepTimer:
+    """ステップごとの所要時間を記録する。with timer.step("goto"): ... のように使う。"""
+
+    def __init__(self, name: str, budget_ms: Optional[float] = None):
+        self.name = name
+        self.budget_ms = budget_ms
+        self.steps: List[Tuple[str, float]] = []
+        self.counters: Dict[str, int] = {}
+        # 出来事の時刻（time.perf_counter()）。空きを見つけた時刻など、ステップの途中の瞬間を残す
+        self.marks: Dict[str, float] = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def step(self, label: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((label, (time.perf_counter() - started) * 1000))
+
+    def mark(self, label: str) -> None:
+        self.marks[label] = time.perf_counter()
+
+    def count(self, name: str, n: int = 1) -> None:
+        """件数を足す（navigations / cells / bytes など）。"""
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._started) * 1000
+
+    def remaining_ms(self) -> Optional[float]:
+        if self.budget_ms is None:
+            return None
+        return self.budget_ms - self.elapsed_ms()
+
+    def timeout(self, default_ms: float, floor_ms: float = 500) -> float:
+        """待ち時間の上限。残り予算が default_ms より少なければ残り予算（最低 floor_ms）にする。"""
+        remaining = self.remaining_ms()
+        if remaining is None:
+            return default_ms
+        return max(floor_ms, min(default_ms, remaining))
+
+    def over_budget(self) -> bool:
+        remaining = self.remaining_ms()
+        return remaining is not None and remaining < 0
+
+    def summary(self) -> str:
+        parts = ", ".join(f"{label} {ms / 1000:.2f}s" for label, ms in self.steps)
+        budget = f" / 予算 {self.budget_ms / 1000:.1f}s" if self.budget_ms is not None else ""
+        counts = "".join(f", {k} {v}" for k, v in self.counters.items())
+        return f"[{self.name}] 合計 {self.elapsed_ms() / 1000:.2f}s{budget}: {parts}{counts}"
+
+    def report(self, log: Callable[[str], None]) -> None:
+        """内訳をログに出す。予算を超えていれば、一番遅いステップも添えて警告する。"""
+        log(self.summary())
+        if self.over_budget() and self.steps:
+            label, ms = max(self.steps, key=lambda s: s[1])
+            log(f"[{self.name}] ⚠ 予算超過（最も遅いステップ: {label} {ms / 1000:.2f}s）")
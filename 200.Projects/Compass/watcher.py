@@ -0,0 +1,174 @@
+"""
+常駐して空きを監視するモード（python main.py watch [設定ファイル] / python clinic_main.py watch [設定ファイル]）。
+
+Chromium を1つ起動したまま、サイトごとのブラウザコンテキストとページを使い回し、
+設定ファイルの対象を一定間隔（＋ゆらぎ）で再チェックする。サイト同士は engine で並行して確認する。
+"schedule": "adaptive" にすると、間隔は scheduler.AdaptiveScheduler が空きの出やすい時間帯に合わせて決める
+（1日のチェック回数は "daily_budget"、間隔は "min_interval"〜"max_interval" 秒）。
+一定回数使ったコンテキストや、JS ヒープが大きくなったコンテキストは作り直す。
+
+設定ファイル（既定: 環境変数 WATCH_CONFIG または watch.json）の例:
+
+    {
+      "interval": 45,
+      "jitter": 10,
+      "recycle_every": 50,
+      "max_heap_mb": 300,
+      "concurrency": 4,
+      "targets": [
+        {"site": "compass", "dates": "2026-03-07,2026-03-14..2026-03-15"},
+        {"site": "clinic", "dates": ["2026-03-05"]}
+      ]
+    }
+"""
+
+import asyncio
+import json
+import os
+import random
+from datetime import datetime
+from typing import Dict, Optional
+
+from common import get_check_dates, log, parse_dates
+from engine import Pages, concurrency_from_env, jobs_from_targets, open_context, run_jobs
+from notify import close_dispatcher
+from scheduler import AdaptiveScheduler, learn_from_store, runs_today
+from sites import Site
+from state import StateStore
+
+
+DEFAULTS = {"interval": 60, "jitter": 10, "recycle_every": 50, "max_heap_mb": 300}
+
+
+class BrowserPool(Pages):
+    """
+    起動したままの Chromium と、サイトごとの（コンテキスト, ページ）を管理する。
+    recycle_every 回使うか、ページの JS ヒープが max_heap_mb を超えたらコンテキストを作り直す。
+    使うプロキシが前回と変わったときも作り直す（プロキシはコンテキスト単位なので）。
+    """
+
+    def __init__(self, recycle_every: int, max_heap_mb: float, playwright=None):
+        super().__init__(playwright)
+        self.recycle_every = recycle_every
+        self.max_heap_mb = max_heap_mb
+        self._slots: Dict[str, list] = {}  # site 名 -> [context, page, 使用回数, プロキシ]
+
+    def on_launch(self) -> None:
+        self._slots.clear()
+
+    async def page(self, site: Site, proxy: Optional[str] = None):
+        browser = await self._ensure_browser()
+        slot = self._slots.get(site.name)
+        if slot is not None and slot[3] != proxy:
+            log(f"[{site.name}] プロキシを {proxy} に切り替えます。")
+            del self._slots[site.name]
+            try:
+                await slot[0].close()
+            except Exception:
+                pass
+            slot = None
+        if slot is None:
+            context = await open_context(browser, site, proxy)
+            slot = self._slots[site.name] = [context, await context.new_page(), 0, proxy]
+        slot[2] += 1
+        return slot[1]
+
+    async def heap_mb(self, site: Site) -> float:
+        slot = self._slots.get(site.name)
+        if slot is None:
+            return 0.0
+        try:
+            used = await slot[1].evaluate("() => performance.memory ? performance.memory.usedJSHeapSize : 0")
+        except Exception:
+            return 0.0
+        return (used or 0) / 1024 / 1024
+
+    async def release(self, site: Site, page, broken: bool = False) -> None:
+        """チェック後に呼ぶ。壊れた・使い古した・メモリが大きいコンテキストは閉じる。"""
+        slot = self._slots.get(site.name)
+        if slot is None:
+            return
+        reason = None
+        if broken:
+            reason = "エラー"
+        elif slot[2] >= self.recycle_every:
+            reason = f"{slot[2]} 回使用"
+        else:
+            heap = await self.heap_mb(site)
+            if heap > self.max_heap_mb:
+                reason = f"JS ヒープ {heap:.0f}MB"
+        if reason:
+            log(f"[{site.name}] コンテキストを作り直します（{reason}）。")
+            del self._slots[site.name]
+            try:
+                await slot[0].close()
+            except Exception:
+                pass
+
+
+def load_config(path: Optional[str], default_site: str = "compass") -> dict:
+    """設定ファイルを読み込む。無ければ環境変数の対象日で default_site だけを監視する。"""
+    config = dict(DEFAULTS, concurrency=concurrency_from_env())
+    path = path or os.environ.get("WATCH_CONFIG", "").strip() or "watch.json"
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            config.update(json.load(f))
+    else:
+        log(f"設定ファイル {path} が無いので、環境変数の対象日で {default_site} を監視します。")
+        config["targets"] = [{"site": default_site, "dates": get_check_dates()}]
+    for target in config["targets"]:
+        dates = target.get("dates", [])
+        if isinstance(dates, list):
+            dates = ",".join(dates)
+        target["dates"] = parse_dates(dates) or get_check_dates()
+    return config
+
+
+async def _watch(config: dict) -> None:
+    jobs = jobs_from_targets(config["targets"])
+    if not jobs:
+        log("監視できる対象がありません。設定ファイルの site を確かめてください。")
+        return
+    interval = float(config["interval"])
+    jitter = float(config["jitter"])
+    scheduler = AdaptiveScheduler.from_config(config) if config.get("schedule") == "adaptive" else None
+    names = [job.site.name for job in jobs]
+    all_dates = sorted({d for job in jobs for d in job.dates})
+    # (site, 日付) ごとの前回の空き状況と比べ、空きに変わったときだけ通知する
+    store = StateStore()
+
+    # API やスナップショットで済むうちは、playwright も Chromium も起動しない
+    pool = BrowserPool(int(config["recycle_every"]), float(config["max_heap_mb"]))
+    try:
+        while True:
+            results = await run_jobs(pool, jobs, int(config["concurrency"]))
+            for job, site_results in zip(jobs, results):
+                for d in job.dates:
+                    print(f"[{job.site.name}] {site_results[d].detail}", flush=True)
+                hits = [site_results[d].detail for d in store.update(job.site.name, site_results)]
+                if hits:
+                    await asyncio.to_thread(job.site.notify, hits)
+
+            if scheduler is not None:
+                now = datetime.now()
+                learn_from_store(scheduler, store, names, now)
+                wait = scheduler.next_delay(now, all_dates, len(runs_today(store, names, now)))
+            else:
+                wait = max(1.0, interval + random.uniform(-jitter, jitter))
+            log(f"{wait:.0f} 秒後に再チェックします。")
+            await asyncio.sleep(wait)
+    finally:
+        await pool.close()
+        for job in jobs:
+            job.site.close()
+        store.close()
+        close_dispatcher()
+
+
+def run_watch(config_path: Optional[str] = None, default_site: str = "compass") -> int:
+    """設定ファイルの対象を Ctrl+C で止めるまで監視し続ける。"""
+    try:
+        asyncio.run(_watch(load_config(config_path, default_site)))
+    except KeyboardInterrupt:
+        log("監視を終了します。")
+    return 0